@@ -2,9 +2,13 @@
 A Caching Library that Focuses on Consistency, Performance & High Availability.
 """
 from .item import Item, new_json_codec, ItemCodec, new_multi_get_filler, FillerFunc
+from .item import NOT_FOUND
+from .codec import CompressedCodec, build_zdict, new_binary_codec
 from .memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
 from .memproxy import LeaseGetResult
 from .memproxy import LeaseSetStatus, DeleteStatus
 from .memproxy import Promise, CacheClient, Pipeline
+from .near_cache import NearCache, NearCacheClient, EvictionPolicy, LocalCache
 from .redis import RedisClient
+from .shared_cache import SharedCache
 from .session import Session
@@ -0,0 +1,6 @@
+"""
+Asyncio version of Item, Session & Pipeline Protocols.
+"""
+from .item import AsyncItem, AsyncFillerFunc, new_async_multi_get_filler
+from .memproxy import AsyncPromise, AsyncLeaseGetResult, AsyncPipeline, AsyncCacheClient
+from .session import AsyncSession
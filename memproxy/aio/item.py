@@ -0,0 +1,248 @@
+"""
+Main package for accessing cache with asyncio.
+Same batching semantics as memproxy.Item, but network I/O and fillers are awaited.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Generic, TypeVar, Callable, List, Optional, Dict, Awaitable
+
+from ..item import ItemCodec, _BaseItemConfig, _ItemStatsMixin
+from .memproxy import AsyncLeaseGetResult, AsyncPromise, AsyncPipeline
+from .session import AsyncSession
+
+T = TypeVar("T")
+K = TypeVar("K")
+
+AsyncFillerFunc = Callable[[K], AsyncPromise[T]]  # K -> AsyncPromise[T]
+
+
+class _AsyncItemConfig(  # pylint: disable=too-few-public-methods
+    _BaseItemConfig[AsyncPipeline, AsyncSession, AsyncFillerFunc], Generic[T, K],
+):
+    __slots__ = ()
+
+    waiting_states: List[_AsyncItemState[T, K]]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, pipe: AsyncPipeline,
+            key_fn: Callable[[K], str], filler: Callable[[K], AsyncPromise[T]],
+            codec: ItemCodec[T],
+            lease_wait_durations: Optional[List[float]] = None,
+    ):
+        super().__init__(
+            pipe=pipe, sess=pipe.lower_session(), key_fn=key_fn, filler=filler, codec=codec,
+            lease_wait_durations=lease_wait_durations,
+        )
+
+    async def _handle_waiting(self) -> None:
+        states, duration = self.take_waiting()
+        if len(states) == 0:
+            return
+
+        await asyncio.sleep(duration)
+        self.retry_waiting(states)
+
+
+class _AsyncItemState(Generic[T, K]):  # pylint: disable=too-many-instance-attributes
+    __slots__ = (
+        'conf', 'key', 'key_str', 'lease_get_fn', 'cas', 'wait_count', '_fill_fn', 'result',
+    )
+
+    conf: _AsyncItemConfig[T, K]
+
+    key: K
+    key_str: str
+    lease_get_fn: AsyncLeaseGetResult
+    cas: int
+    wait_count: int
+
+    _fill_fn: AsyncPromise[T]
+
+    result: T
+
+    async def _handle_set_back(self):
+        data = self.conf.codec.encode(self.result)
+        set_fn = self.conf.pipe.lease_set(key=self.key_str, cas=self.cas, data=data)
+
+        async def handle_set_fn():
+            await set_fn()
+
+        self.conf.sess.add_next_call(handle_set_fn)
+
+    async def _handle_fill_fn(self):
+        self.result = await self._fill_fn()
+
+        if self.cas <= 0:
+            return
+
+        self.conf.sess.add_next_call(self._handle_set_back)
+
+    def _handle_filling(self):
+        self.conf.fill_count += 1
+        self._fill_fn = self.conf.filler(self.key)
+        self.conf.sess.add_next_call(self._handle_fill_fn)
+
+    def fill_without_set(self) -> None:
+        """Call the filler without setting back, when the lease is still held by another client."""
+        self.cas = 0
+        self._handle_filling()
+
+    async def __call__(self) -> None:
+        get_resp = await self.lease_get_fn.result()
+
+        resp_error: Optional[str] = get_resp[3]
+        if get_resp[0] == 1:
+            self.conf.hit_count += 1
+            self.conf.bytes_read += len(get_resp[1])
+            try:
+                self.result = self.conf.codec.decode(get_resp[1])
+                return
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.conf.decode_error_count += 1
+                resp_error = f'Decode error. {str(e)}'
+
+        cas = self.conf.handle_miss(self, get_resp, resp_error)
+        if cas is not None:
+            self.cas = cas
+            self._handle_filling()
+
+    async def result_func(self) -> T:
+        """Execute the session and map the result back to clients."""
+        await self.conf.sess.execute()
+        return self.result
+
+
+class AsyncItem(_ItemStatsMixin[K], Generic[T, K]):
+    """
+    AsyncItem object is for accessing cache keys with asyncio.
+    Cache key will be filled for DB if cache miss, with intelligent batching.
+    Also providing stats for better monitoring.
+    """
+    __slots__ = ('_conf',)
+
+    _conf: _AsyncItemConfig[T, K]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, pipe: AsyncPipeline,
+            key_fn: Callable[[K], str],  # K -> str
+            filler: Callable[[K], AsyncPromise[T]],  # K -> async () -> T
+            codec: ItemCodec[T],
+            lease_wait_durations: Optional[List[float]] = None,
+    ):
+        """
+        :param lease_wait_durations: sleep durations between retries
+            when the lease get returns LEASE_HELD, same as memproxy.Item
+        """
+        self._conf = _AsyncItemConfig(
+            pipe=pipe, key_fn=key_fn, filler=filler, codec=codec,
+            lease_wait_durations=lease_wait_durations,
+        )
+
+    def get(self, key: K) -> AsyncPromise[T]:
+        """Get data from cache key and fill from DB if it missed."""
+        # do init item state
+        state: _AsyncItemState[T, K] = _AsyncItemState()
+
+        state.conf = self._conf
+        state.key = key
+        state.key_str = self._conf.key_fn(key)
+        state.lease_get_fn = self._conf.pipe.lease_get(state.key_str)
+        state.wait_count = 0
+        # end init item state
+
+        self._conf.sess.add_next_call(state)
+
+        return state.result_func
+
+    def get_multi(self, keys: List[K]) -> AsyncPromise[List[T]]:
+        """Get multi cache keys at once. Equivalent to calling get() multiple times."""
+        fn_list = [self.get(key) for key in keys]
+
+        async def result_func() -> List[T]:
+            result: List[T] = []
+            for fn in fn_list:
+                result.append(await fn())
+            return result
+
+        return result_func
+
+
+class _AsyncMultiGetState(Generic[T, K]):  # pylint: disable=too-few-public-methods
+    __slots__ = ('keys', 'result', 'task')
+
+    keys: List[K]
+    result: Dict[K, T]
+    task: Optional[asyncio.Future]
+
+    def __init__(self):
+        self.keys = []
+        self.result = {}
+        self.task = None
+
+    def add_key(self, key: K):
+        """Add key to the state of multi-get filler."""
+        self.keys.append(key)
+
+
+AsyncMultiGetFillFunc = Callable[[List[K]], Awaitable[List[T]]]  # async [K] -> [T]
+GetKeyFunc = Callable[[T], K]  # T -> K
+
+
+class _AsyncMultiGetFunc(Generic[T, K]):  # pylint: disable=too-few-public-methods
+    __slots__ = '_state', '_fill_func', '_get_key_func', '_default'
+
+    _state: Optional[_AsyncMultiGetState[T, K]]
+    _fill_func: AsyncMultiGetFillFunc
+    _get_key_func: GetKeyFunc
+    _default: Callable[[], T]
+
+    def __init__(
+            self,
+            fill_func: Callable[[List[K]], Awaitable[List[T]]],  # async List[K] -> List[T]
+            key_func: Callable[[T], K],  # T -> K
+            default: Callable[[], T],
+    ):
+        self._state = None
+        self._fill_func = fill_func
+        self._get_key_func = key_func
+        self._default = default
+
+    def _get_state(self) -> _AsyncMultiGetState:
+        if self._state is None:
+            self._state = _AsyncMultiGetState()
+        return self._state
+
+    async def _fill(self, state: _AsyncMultiGetState[T, K]) -> None:
+        self._state = None
+
+        values = await self._fill_func(state.keys)
+        for v in values:
+            k = self._get_key_func(v)
+            state.result[k] = v
+
+    def result_func(self, key: K) -> AsyncPromise[T]:
+        """Function that implement the filler function signature."""
+        state = self._get_state()
+        state.add_key(key)
+
+        async def resp_func() -> T:
+            if state.task is None:
+                # shared by every key of the batch, even when awaited from different tasks
+                state.task = asyncio.ensure_future(self._fill(state))
+            await state.task
+
+            return state.result.get(key, self._default())
+
+        return resp_func
+
+
+# from async [K] -> [T] to K -> AsyncPromise[T]
+def new_async_multi_get_filler(
+        fill_func: Callable[[List[K]], Awaitable[List[T]]],  # async List[K] -> List[T]
+        get_key_func: Callable[[T], K],  # T -> K
+        default: Callable[[], T],  # () -> T
+) -> Callable[[K], AsyncPromise[T]]:  # K -> async () -> T
+    """Helper function for creating AsyncItem object with a multi get filler."""
+    fn = _AsyncMultiGetFunc(fill_func=fill_func, key_func=get_key_func, default=default)
+    return fn.result_func
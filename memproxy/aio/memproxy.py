@@ -0,0 +1,85 @@
+"""
+Basic Data Types of Memproxy for asyncio.
+"""
+from abc import abstractmethod
+from typing import Callable, TypeVar, Optional, Awaitable
+
+from typing_extensions import Protocol
+
+from ..memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from .session import AsyncSession
+
+T = TypeVar("T")
+
+AsyncPromise = Callable[[], Awaitable[T]]
+
+
+# pylint: disable=too-few-public-methods
+class AsyncLeaseGetResult(Protocol):
+    """Response Object when calling AsyncPipeline.lease_get()."""
+
+    @abstractmethod
+    async def result(self) -> LeaseGetResponse:
+        """When awaited will return the lease get response object."""
+
+
+# pylint: disable=too-few-public-methods
+class AsyncLeaseGetResultFunc:
+    """Mostly for testing purpose."""
+
+    _fn: AsyncPromise[LeaseGetResponse]
+
+    def __init__(self, fn: AsyncPromise[LeaseGetResponse]):
+        self._fn = fn
+
+    async def result(self) -> LeaseGetResponse:
+        """Return lease get result."""
+        return await self._fn()
+
+
+class AsyncPipeline(Protocol):
+    """
+    A Cache Pipeline for asyncio.
+    Operations are collected without blocking, network I/O is awaited when results are awaited.
+    """
+
+    @abstractmethod
+    def lease_get(self, key: str) -> AsyncLeaseGetResult:
+        """Returns data or a cas (lease id) number when not found."""
+
+    @abstractmethod
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> AsyncPromise[LeaseSetResponse]:
+        """
+        Set data for the key when cas number is matched.
+        negative is True if data is a negative cache entry, same as Pipeline.lease_set().
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> AsyncPromise[DeleteResponse]:
+        """Delete key from cache servers."""
+
+    @abstractmethod
+    def lower_session(self) -> AsyncSession:
+        """Returns a session with lower priority."""
+
+    @abstractmethod
+    async def finish(self) -> None:
+        """Do clean up, for example, flush pending operations, e.g. set, delete."""
+
+    @abstractmethod
+    async def __aenter__(self):
+        """Do clean up but using async with."""
+
+    @abstractmethod
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Do clean up but using async with."""
+
+
+class AsyncCacheClient(Protocol):
+    """AsyncCacheClient is a class to create AsyncPipeline objects."""
+
+    @abstractmethod
+    def pipeline(self, sess: Optional[AsyncSession] = None) -> AsyncPipeline:
+        """Create a new pipeline, create a new AsyncSession if input sess is None."""
@@ -0,0 +1,225 @@
+"""
+Implementation of AsyncCacheClient using redis.asyncio (requires redis>=4.2.0).
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import List, Optional, Any
+
+from redis import asyncio as aioredis
+
+from ..memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from ..redis import SetInput, PipelineStateBase, PipelineBase, LeaseTTL, RedisClientBase
+from ..redis import GetResultBase
+from ..redis import lease_set_args
+from .memproxy import AsyncLeaseGetResult, AsyncPipeline, AsyncPromise
+from .session import AsyncSession
+
+
+class AsyncRedisPipelineState(PipelineStateBase):
+    """
+    State between pipeline stages.
+    Batches bigger than max_keys_per_batch are sent concurrently on different pooled connections.
+    """
+
+    __slots__ = ('_pipe', '_task')
+
+    _pipe: AsyncRedisPipeline
+    _task: Optional[asyncio.Future]
+
+    def __init__(self, pipe: AsyncRedisPipeline):
+        super().__init__()
+        self._pipe = pipe
+        self._task = None
+
+    async def execute(self) -> None:
+        """Execute collected operations, concurrent callers wait for the same execution."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._execute())
+        # cancelling one of the callers must not cancel the execution of the others
+        await asyncio.shield(self._task)
+
+    async def _execute(self) -> None:
+        try:
+            await self._execute_in_try()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.redis_error = str(e)
+        self.completed = True
+
+    async def _execute_in_try(self) -> None:
+        if len(self.keys) > 0:
+            await self._execute_lease_get()
+
+        if len(self.set_inputs) > 0:
+            await self._execute_lease_set()
+
+        if len(self.delete_keys) > 0:
+            async with self._pipe.client.pipeline(transaction=False) as pipe:
+                for key in self.delete_keys:
+                    pipe.delete(key)
+                self.delete_result = await pipe.execute()
+
+    async def _execute_lease_get(self) -> None:
+        batch_size = self._pipe.max_keys_per_batch
+
+        if len(self.keys) <= batch_size:
+            self.get_result = await self._call_get_script(self.keys)
+            return
+
+        batch_results = await asyncio.gather(*[
+            self._call_get_script(self.keys[n: n + batch_size])
+            for n in range(0, len(self.keys), batch_size)
+        ])
+
+        self.get_result = []
+        for r in batch_results:
+            self.get_result.extend(r)
+
+    async def _call_get_script(self, keys: List[str]) -> List[bytes]:
+        if self._pipe.lease_wait:
+            return await self._pipe.get_script(keys=keys, args=[b'w'], client=self._pipe.client)
+        return await self._pipe.get_script(keys=keys, client=self._pipe.client)
+
+    async def _execute_lease_set(self) -> None:
+        batch_size = self._pipe.max_keys_per_batch
+
+        batch_results = await asyncio.gather(*[
+            self._execute_lease_set_inputs(self.set_inputs[n: n + batch_size])
+            for n in range(0, len(self.set_inputs), batch_size)
+        ])
+
+        self.set_result = []
+        for r in batch_results:
+            self.set_result.extend(r)
+
+    async def _execute_lease_set_inputs(self, inputs: List[SetInput]) -> List[bytes]:
+        keys = [i.key for i in inputs]
+        args = lease_set_args(inputs)
+        return await self._pipe.set_script(keys=keys, args=args, client=self._pipe.client)
+
+
+class _AsyncRedisGetResult(GetResultBase['AsyncRedisPipeline', AsyncRedisPipelineState]):  # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
+    async def result(self) -> LeaseGetResponse:
+        """Implementation of AsyncLeaseGetResult protocol."""
+        state = self.state
+        if not state.completed:
+            await self.pipe.execute(state)
+
+        return state.lease_get_response(self.index)
+
+
+class AsyncRedisPipeline(PipelineBase[AsyncRedisPipelineState]):
+    """A implementation of AsyncPipeline using redis.asyncio."""
+
+    __slots__ = ('client', 'get_script', 'set_script', '_sess', 'max_keys_per_batch', 'lease_wait')
+
+    client: aioredis.Redis
+    get_script: Any
+    set_script: Any
+
+    _sess: AsyncSession
+
+    max_keys_per_batch: int
+    lease_wait: bool
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, r: aioredis.Redis,
+            get_script: Any, set_script: Any,
+            min_ttl: int, max_ttl: int,
+            sess: Optional[AsyncSession],
+            max_keys_per_batch: int,
+            lease_wait: bool = False,
+            negative_min_ttl: Optional[int] = None,
+            negative_max_ttl: Optional[int] = None,
+    ):
+        super().__init__(LeaseTTL(min_ttl, max_ttl, negative_min_ttl, negative_max_ttl))
+
+        self.client = r
+        self.get_script = get_script
+        self.set_script = set_script
+
+        self._sess = sess or AsyncSession()
+
+        self.max_keys_per_batch = max_keys_per_batch
+        self.lease_wait = lease_wait
+
+    def _new_state(self) -> AsyncRedisPipelineState:
+        return AsyncRedisPipelineState(self)
+
+    async def execute(self, state: AsyncRedisPipelineState):
+        """Executing the pipeline state."""
+        # operations added while awaiting belong to the next state
+        self._end_stage(state)
+        await state.execute()
+
+    def lease_get(self, key: str) -> AsyncLeaseGetResult:
+        """Lease get from cache."""
+        state = self._get_state()
+        return _AsyncRedisGetResult(self, state, state.add_get_op(key))
+
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> AsyncPromise[LeaseSetResponse]:
+        """Set data into cache if cas number is matched, same as RedisPipeline.lease_set()."""
+        state, index = self._add_set_op(key, cas, data, negative)
+
+        async def lease_set_fn() -> LeaseSetResponse:
+            await self.execute(state)
+            return state.lease_set_response(index)
+
+        return lease_set_fn
+
+    def delete(self, key: str) -> AsyncPromise[DeleteResponse]:
+        """Delete cache key."""
+        state, index = self._add_delete_op(key)
+
+        async def delete_fn() -> DeleteResponse:
+            await self.execute(state)
+            return state.delete_response(index)
+
+        return delete_fn
+
+    def lower_session(self) -> AsyncSession:
+        """Returns the lower priority session"""
+        return self._sess
+
+    async def finish(self) -> None:
+        """Do clean up."""
+        if self._state is not None:
+            await self.execute(self._state)
+
+    async def __aenter__(self):
+        """Do clean up using async with keyword."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Do clean up using async with keyword."""
+        await self.finish()
+
+
+class AsyncRedisClient(RedisClientBase):  # pylint: disable=too-few-public-methods
+    """
+    An implementation of AsyncCacheClient using redis.asyncio.
+    The lease_wait and negative TTL options are the same as of memproxy.RedisClient.
+    """
+    __slots__ = ()
+    _client: aioredis.Redis
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, r: aioredis.Redis,
+            min_ttl=6 * 3600, max_ttl=12 * 3600,
+            max_keys_per_batch=100,
+            lease_wait=False,
+            negative_min_ttl=60, negative_max_ttl=120,
+    ):
+        super().__init__(
+            r=r, min_ttl=min_ttl, max_ttl=max_ttl, max_keys_per_batch=max_keys_per_batch,
+            lease_wait=lease_wait,
+            negative_min_ttl=negative_min_ttl, negative_max_ttl=negative_max_ttl,
+        )
+
+    def pipeline(self, sess: Optional[AsyncSession] = None) -> AsyncPipeline:
+        """Creates a new pipeline."""
+        return AsyncRedisPipeline(sess=sess, **self._pipeline_kwargs())
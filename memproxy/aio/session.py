@@ -0,0 +1,70 @@
+"""
+AsyncSession implementation.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Callable, Optional, Awaitable
+
+from ..session import _BaseSession
+
+AsyncNextCallFunc = Callable[[], Awaitable[None]]
+
+
+class AsyncSession(_BaseSession[AsyncNextCallFunc]):
+    """AsyncSession class is for deferring coroutine function calls."""
+
+    __slots__ = '_lock', '_owner'
+
+    _lower: Optional[AsyncSession]
+    _higher: Optional[AsyncSession]
+
+    # created lazily to bind to the running event loop
+    _lock: Optional[asyncio.Lock]
+    _owner: Optional[asyncio.Task]
+
+    def __init__(self):
+        super().__init__()
+        self._lock = None
+        self._owner = None
+
+    async def _run(self) -> None:
+        higher = self._higher
+        if higher and (higher.is_dirty or higher._owner):  # pylint: disable=protected-access
+            await higher.execute()
+
+        while self.is_dirty:
+            for fn in self._take_next_calls():
+                await fn()
+
+    async def execute(self) -> None:
+        """
+        Execute defer funcs.
+        Those defer functions can itself call the add_next_call() inside of them.
+        When another task is executing this session, waits for it to finish.
+        """
+        if not self.is_dirty and self._owner is None:
+            return
+
+        task = asyncio.current_task()
+        if self._owner is task:
+            # called from inside one of the defer funcs
+            await self._run()
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._owner = task
+            try:
+                await self._run()
+            finally:
+                self._owner = None
+
+    def get_lower(self) -> AsyncSession:
+        """Returns a lower priority session."""
+        if self._lower is None:
+            self._lower = AsyncSession()
+            self._lower._higher = self  # pylint: disable=protected-access
+        return self._lower
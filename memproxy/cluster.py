@@ -0,0 +1,372 @@
+"""
+Implementation of CacheClient using Redis Cluster (requires redis>=4.1.0).
+Keys are grouped by hash slot, lease scripts are run per slot and per node in parallel.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
+
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
+from redis.exceptions import MovedError, AskError, SlotNotCoveredError
+
+from .memproxy import Pipeline
+from .redis import LEASE_SET_SCRIPT, SyncPipelineStateBase, SyncPipelineBase, LeaseTTL
+from .redis import lease_set_args
+from .session import Session
+
+# Same as LEASE_GET_SCRIPT, but the cas counter is KEYS[1],
+# a key in the same hash slot as the other keys.
+LEASE_GET_CLUSTER_SCRIPT = """
+local result = {}
+local lease_wait = ARGV[1] == 'w'
+
+for i = 2,#KEYS do
+    local k = KEYS[i]
+
+    local resp = redis.call('GET', k)
+
+    if resp then
+        if lease_wait and string.sub(resp, 1, 4) == 'cas:' then
+            result[i - 1] = 'wait:' .. string.sub(resp, 5)
+        else
+            result[i - 1] = resp
+        end
+    else
+        local cas = redis.call('INCR', KEYS[1])
+        local cas_str = 'cas:' .. cas
+        redis.call('SET', k, cas_str, 'EX', 3)
+        result[i - 1] = cas_str
+    end
+end
+
+return result
+"""
+
+
+class _SlotTags:  # pylint: disable=too-few-public-methods
+    """Lazily computed hash tags, one for each hash slot."""
+    __slots__ = ('_tags', '_next', '_mut')
+
+    _tags: Dict[int, str]
+    _next: int
+    _mut: threading.Lock
+
+    def __init__(self):
+        self._tags = {}
+        self._next = 0
+        self._mut = threading.Lock()
+
+    def get(self, slot: int) -> str:
+        """Returns a hash tag that belongs to the slot."""
+        tag = self._tags.get(slot)
+        if tag is not None:
+            return tag
+
+        with self._mut:
+            while slot not in self._tags:
+                tag = str(self._next)
+                self._next += 1
+                self._tags.setdefault(key_slot(tag.encode()), tag)
+
+            return self._tags[slot]
+
+
+_slot_tags = _SlotTags()
+
+
+def cas_key_for_slot(slot: int) -> str:
+    """Returns the name of the cas counter key that belongs to the hash slot."""
+    return f'__next_cas:{{{_slot_tags.get(slot)}}}'
+
+
+class _NodeOps:  # pylint: disable=too-few-public-methods
+    """Operations of a pipeline stage sent to one cluster node."""
+    __slots__ = ('node', 'get_slots', 'set_slots', 'delete_indices')
+
+    node: Any
+    get_slots: Dict[int, List[int]]  # slot -> indices of keys
+    set_slots: Dict[int, List[int]]  # slot -> indices of set inputs
+    delete_indices: List[int]
+
+    def __init__(self, node: Any):
+        self.node = node
+        self.get_slots = {}
+        self.set_slots = {}
+        self.delete_indices = []
+
+
+class RedisClusterPipelineState(SyncPipelineStateBase):  # pylint: disable=too-many-instance-attributes
+    """
+    State between pipeline stages.
+    Each cluster node receives one redis pipeline per stage, nodes are executed in parallel.
+    Errors are tracked per node, so a failed node does not affect keys on other nodes.
+    """
+
+    __slots__ = ('_pipe', 'get_errors', 'set_errors', 'delete_errors')
+
+    _pipe: RedisClusterPipeline
+
+    get_errors: Dict[int, str]
+    set_errors: Dict[int, str]
+    delete_errors: Dict[int, str]
+
+    def __init__(self, pipe: RedisClusterPipeline):
+        super().__init__()
+        self._pipe = pipe
+
+        self.get_errors = {}
+        self.set_errors = {}
+        self.delete_errors = {}
+
+    def get_error(self, index: int) -> Optional[str]:
+        """The error of the node of the lease get operation."""
+        return self.get_errors.get(index)
+
+    def set_error(self, index: int) -> Optional[str]:
+        """The error of the node of the lease set operation."""
+        return self.set_errors.get(index)
+
+    def delete_error(self, index: int) -> Optional[str]:
+        """The error of the node of the delete operation."""
+        return self.delete_errors.get(index)
+
+    def _node_ops(self, node_ops: Dict[str, _NodeOps], key: str) -> Tuple[_NodeOps, int]:
+        cluster = self._pipe.cluster
+        slot = cluster.keyslot(key)
+        node = cluster.get_node_from_key(key)
+        if node is None:
+            raise SlotNotCoveredError(f'Slot "{slot}" is not covered by any node')
+
+        ops = node_ops.get(node.name)
+        if ops is None:
+            ops = _NodeOps(node)
+            node_ops[node.name] = ops
+        return ops, slot
+
+    def _group_by_node(self) -> Dict[str, _NodeOps]:
+        node_ops: Dict[str, _NodeOps] = {}
+
+        for i, key in enumerate(self.keys):
+            ops, slot = self._node_ops(node_ops, key)
+            ops.get_slots.setdefault(slot, []).append(i)
+
+        for i, set_input in enumerate(self.set_inputs):
+            ops, slot = self._node_ops(node_ops, set_input.key)
+            ops.set_slots.setdefault(slot, []).append(i)
+
+        for i, key in enumerate(self.delete_keys):
+            ops, _ = self._node_ops(node_ops, key)
+            ops.delete_indices.append(i)
+
+        return node_ops
+
+    def execute(self) -> None:
+        """Execute collected operations."""
+        self.get_result = [b''] * len(self.keys)
+        self.set_result = [b''] * len(self.set_inputs)
+        self.delete_result = [0] * len(self.delete_keys)
+
+        try:
+            node_ops = list(self._group_by_node().values())
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self._set_errors_all(str(e))
+            self.completed = True
+            return
+
+        if len(node_ops) == 1:
+            self._execute_node(node_ops[0])
+        else:
+            # list() to wait for all nodes
+            list(self._pipe.executor.map(self._execute_node, node_ops))
+
+        self.completed = True
+
+    def _set_errors_all(self, error: str) -> None:
+        for i in range(len(self.keys)):
+            self.get_errors[i] = error
+        for i in range(len(self.set_inputs)):
+            self.set_errors[i] = error
+        for i in range(len(self.delete_keys)):
+            self.delete_errors[i] = error
+
+    def _execute_node(self, ops: _NodeOps) -> None:
+        try:
+            self._execute_node_in_try(ops)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if isinstance(e, (MovedError, AskError)):
+                self._pipe.cluster.nodes_manager.initialize()
+            self._set_node_errors(ops, str(e))
+
+    def _set_node_errors(self, ops: _NodeOps, error: str) -> None:
+        for indices in ops.get_slots.values():
+            for i in indices:
+                self.get_errors[i] = error
+        for indices in ops.set_slots.values():
+            for i in indices:
+                self.set_errors[i] = error
+        for i in ops.delete_indices:
+            self.delete_errors[i] = error
+
+    def _execute_node_in_try(self, ops: _NodeOps) -> None:
+        client = self._pipe.cluster.get_redis_connection(ops.node)
+
+        with client.pipeline(transaction=False) as pipe:
+            get_batches, set_batches = self._add_node_commands(ops, client, pipe)
+            pipe_result = pipe.execute()
+
+        pos = 0
+        for batch in get_batches:
+            for i, r in zip(batch, pipe_result[pos]):
+                self.get_result[i] = r
+            pos += 1
+
+        for batch in set_batches:
+            for i, r in zip(batch, pipe_result[pos]):
+                self.set_result[i] = r
+            pos += 1
+
+        for i in ops.delete_indices:
+            self.delete_result[i] = pipe_result[pos]
+            pos += 1
+
+    def _add_node_commands(  # pylint: disable=too-many-locals
+            self, ops: _NodeOps, client, pipe,
+    ) -> Tuple[List[List[int]], List[List[int]]]:
+        get_script, set_script = self._pipe.get_scripts(ops.node.name, client)
+        batch_size = self._pipe.max_keys_per_batch
+
+        get_args = [b'w'] if self._pipe.lease_wait else []
+
+        get_batches: List[List[int]] = []
+        for slot, indices in ops.get_slots.items():
+            cas_key = cas_key_for_slot(slot)
+            for n in range(0, len(indices), batch_size):
+                batch = indices[n: n + batch_size]
+                get_batches.append(batch)
+                keys = [cas_key] + [self.keys[i] for i in batch]
+                get_script(keys=keys, args=get_args, client=pipe)
+
+        set_batches: List[List[int]] = []
+        for indices in ops.set_slots.values():
+            for n in range(0, len(indices), batch_size):
+                batch = indices[n: n + batch_size]
+                set_batches.append(batch)
+                inputs = [self.set_inputs[i] for i in batch]
+                keys = [i.key for i in inputs]
+                set_script(keys=keys, args=lease_set_args(inputs), client=pipe)
+
+        for i in ops.delete_indices:
+            pipe.delete(self.delete_keys[i])
+
+        return get_batches, set_batches
+
+
+class RedisClusterPipeline(SyncPipelineBase[RedisClusterPipelineState]):
+    """A implementation of Pipeline using Redis Cluster."""
+
+    __slots__ = ('cluster', '_client', 'executor', 'max_keys_per_batch', 'lease_wait')
+
+    cluster: RedisCluster
+    _client: RedisClusterClient
+    executor: Executor
+
+    max_keys_per_batch: int
+    lease_wait: bool
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, client: RedisClusterClient,
+            min_ttl: int, max_ttl: int,
+            sess: Optional[Session],
+            max_keys_per_batch: int,
+    ):
+        # negative cache entries use the same TTL range as RedisPipeline
+        ttl = LeaseTTL(min_ttl, max_ttl, client.negative_min_ttl, client.negative_max_ttl)
+        super().__init__(ttl, sess)
+
+        self.cluster = client.cluster
+        self._client = client
+        self.executor = client.executor
+
+        self.max_keys_per_batch = max_keys_per_batch
+        self.lease_wait = client.lease_wait
+
+    def get_scripts(self, node_name: str, client: Any) -> Tuple[Any, Any]:
+        """Returns lease get & set scripts registered for a node."""
+        return self._client.get_scripts(node_name, client)
+
+    def _new_state(self) -> RedisClusterPipelineState:
+        return RedisClusterPipelineState(self)
+
+
+class RedisClusterClient:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """An implementation of Cache Client using Redis Cluster."""
+    __slots__ = ('cluster', 'executor', '_min_ttl', '_max_ttl', '_max_keys_per_batch',
+                 'lease_wait', 'negative_min_ttl', 'negative_max_ttl', '_scripts', '_mut')
+
+    cluster: RedisCluster
+    executor: Executor
+    lease_wait: bool
+    negative_min_ttl: int
+    negative_max_ttl: int
+    _min_ttl: int
+    _max_ttl: int
+    _max_keys_per_batch: int
+
+    _scripts: Dict[str, Tuple[Any, Any]]  # node name -> (get script, set script)
+    _mut: threading.Lock
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, cluster: RedisCluster,
+            min_ttl=6 * 3600, max_ttl=12 * 3600,
+            max_keys_per_batch=100,
+            executor: Optional[Executor] = None,
+            lease_wait=False,
+            negative_min_ttl=60, negative_max_ttl=120,
+    ):
+        """
+        :param cluster: redis cluster client
+        :param executor: for executing per-node pipelines in parallel,
+            a thread pool is created if None
+        :param lease_wait: only the first caller of a missed key is granted the lease,
+            same as RedisClient
+        :param negative_min_ttl: TTL range of negative cache entries,
+            same as RedisClient
+        """
+        self.cluster = cluster
+        self.executor = executor or ThreadPoolExecutor(max_workers=16)
+        self._min_ttl = min_ttl
+        self._max_ttl = max_ttl
+        self._max_keys_per_batch = max_keys_per_batch
+        self.lease_wait = lease_wait
+        self.negative_min_ttl = negative_min_ttl
+        self.negative_max_ttl = negative_max_ttl
+
+        self._scripts = {}
+        self._mut = threading.Lock()
+
+    def get_scripts(self, node_name: str, client: Any) -> Tuple[Any, Any]:
+        """Returns lease get & set scripts registered for a node."""
+        scripts = self._scripts.get(node_name)
+        if scripts is not None:
+            return scripts
+
+        with self._mut:
+            scripts = (
+                client.register_script(LEASE_GET_CLUSTER_SCRIPT),
+                client.register_script(LEASE_SET_SCRIPT),
+            )
+            self._scripts[node_name] = scripts
+            return scripts
+
+    def pipeline(self, sess: Optional[Session] = None) -> Pipeline:
+        """Creates a new pipeline."""
+        return RedisClusterPipeline(
+            client=self,
+            min_ttl=self._min_ttl,
+            max_ttl=self._max_ttl,
+            sess=sess,
+            max_keys_per_batch=self._max_keys_per_batch,
+        )
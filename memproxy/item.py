@@ -7,24 +7,48 @@ from __future__ import annotations
 import dataclasses
 import json
 import logging
+import threading
+import time
+from concurrent.futures import Executor
 from dataclasses import dataclass
-from typing import Generic, TypeVar, Callable, List, Optional, Dict, Type
+from typing import Generic, TypeVar, Callable, List, Optional, Dict, Type, Any, Tuple
 
-from .memproxy import LeaseGetResult
+from typing_extensions import Protocol
+
+from .memproxy import LeaseGetResult, LeaseGetResponse, LeaseSetResponse
 from .memproxy import Promise, Pipeline, Session
 
 T = TypeVar("T")
 K = TypeVar("K")
+F = TypeVar("F")  # filler
 
 KeyNameFunc = Callable[[K], str]  # K -> str
 FillerFunc = Callable[[K], Promise[T]]  # K -> Promise[T]
 
+# sleep durations (in seconds) between lease get retries when the lease is held by another client,
+# the filler is called without setting back after all retries
+DEFAULT_LEASE_WAIT_DURATIONS = [0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32]
+
+# the cache data of a not found key when negative caching is enabled (see Item negative_value)
+NEGATIVE_ENTRY = b'\x00memproxy:not-found\x00'
+
+
+class _NotFound:  # pylint: disable=too-few-public-methods
+    def __repr__(self) -> str:
+        return 'NOT_FOUND'
+
+
+# returned by fillers for keys not in the DB, compared by identity (see Item negative_value)
+NOT_FOUND: Any = _NotFound()
+
 
 @dataclass
 class ItemCodec(Generic[T]):
     """Item encoder & decoder for data in cache."""
     encode: Callable[[T], bytes]
     decode: Callable[[bytes], T]
+    # optional, decode the data of all cache hits of a get_multi() stage at once
+    decode_many: Optional[Callable[[List[bytes]], List[T]]] = None
 
 
 class DataclassJSONEncoder(json.JSONEncoder):
@@ -39,39 +63,65 @@ class DataclassJSONEncoder(json.JSONEncoder):
 
 def new_json_codec(cls: Type[T]) -> ItemCodec[T]:
     """Creates a simple ItemCodec for dataclasses."""
+    def decode_many(data_list: List[bytes]) -> List[T]:
+        # a single json.loads() call over the joined array
+        return [cls(**d) for d in json.loads(b'[' + b','.join(data_list) + b']')]
+
     return ItemCodec(
         encode=lambda x: json.dumps(x, cls=DataclassJSONEncoder).encode(),
         decode=lambda d: cls(**json.loads(d)),
+        decode_many=decode_many,
     )
 
 
-class _ItemConfig(Generic[T, K]):  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+class _PipelineLike(Protocol):  # pylint: disable=too-few-public-methods
+    def lease_get(self, key: str) -> Any:
+        """Pipeline.lease_get() or AsyncPipeline.lease_get()."""
+
+
+class _SessionLike(Protocol):  # pylint: disable=too-few-public-methods
+    def add_next_call(self, fn: Any) -> None:
+        """Session.add_next_call() or AsyncSession.add_next_call()."""
+
+
+P = TypeVar("P", bound=_PipelineLike)
+S = TypeVar("S", bound=_SessionLike)
+
+
+class _BaseItemConfig(Generic[P, S, F]):  # pylint: disable=too-many-instance-attributes
+    """Config, stats and the handling of lease get responses, shared by Item and AsyncItem."""
     __slots__ = (
         'pipe', 'key_fn', 'sess', 'codec', 'filler',
         'hit_count', 'fill_count', 'cache_error_count', 'decode_error_count',
-        'bytes_read'
+        'bytes_read', 'lease_wait_count',
+        'lease_wait_durations', 'waiting_states',
     )
 
-    pipe: Pipeline
+    pipe: P
     key_fn: KeyNameFunc
-    sess: Session
+    sess: S
     codec: ItemCodec
-    filler: FillerFunc
+    filler: F
 
     hit_count: int
     fill_count: int
     cache_error_count: int
     decode_error_count: int
     bytes_read: int
+    lease_wait_count: int
 
-    def __init__(
-            self, pipe: Pipeline,
-            key_fn: Callable[[K], str], filler: Callable[[K], Promise[T]],
-            codec: ItemCodec[T],
+    lease_wait_durations: List[float]
+    waiting_states: List[Any]  # states of the subclass
+    # sleeps then retries the waiting states, with take_waiting() and retry_waiting()
+    _handle_waiting: Callable[[], Any]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, pipe: P, sess: S, key_fn: KeyNameFunc, filler: F, codec: ItemCodec,
+            lease_wait_durations: Optional[List[float]],
     ):
         self.pipe = pipe
         self.key_fn = key_fn
-        self.sess = pipe.lower_session()
+        self.sess = sess
         self.filler = filler
         self.codec = codec
 
@@ -80,11 +130,219 @@ class _ItemConfig(Generic[T, K]):  # pylint: disable=too-few-public-methods,too-
         self.cache_error_count = 0
         self.decode_error_count = 0
         self.bytes_read = 0
+        self.lease_wait_count = 0
+
+        if lease_wait_durations is None:
+            lease_wait_durations = DEFAULT_LEASE_WAIT_DURATIONS
+        self.lease_wait_durations = lease_wait_durations
+        self.waiting_states = []
+
+    def handle_miss(
+            self, state: Any, get_resp: LeaseGetResponse, resp_error: Optional[str],
+    ) -> Optional[int]:
+        """
+        Handle the lease get response that is not a cache hit.
+        Returns the cas for setting back the filled value, 0 is not setting back,
+        None if the state waits because the lease is held by another client.
+        """
+        if get_resp[0] == 4:
+            self.add_waiting(state)
+            return None
+
+        if get_resp[0] == 2:
+            return get_resp[2]
+
+        if get_resp[0] == 3:
+            self.cache_error_count += 1
+        logging.error('Item get error. %s', resp_error)
+        return 0
+
+    def add_waiting(self, state: Any) -> None:
+        """Add state of key whose lease is held by another client, waiting keys sleep together."""
+        if len(self.waiting_states) == 0:
+            self.sess.add_next_call(self._handle_waiting)
+        self.waiting_states.append(state)
+
+    def take_waiting(self) -> Tuple[List[Any], float]:
+        """
+        Take the waiting states, the ones waited for all durations are filled without setting back.
+        Returns the states to retry and the duration to sleep before retrying.
+        """
+        states = self.waiting_states
+        self.waiting_states = []
+
+        retry_states: List[Any] = []
+        for state in states:
+            if state.wait_count < len(self.lease_wait_durations):
+                retry_states.append(state)
+            else:
+                state.fill_without_set()
+
+        if len(retry_states) == 0:
+            return retry_states, 0.0
+        return retry_states, self.lease_wait_durations[min(s.wait_count for s in retry_states)]
+
+    def retry_waiting(self, states: List[Any]) -> None:
+        """Get the keys of the states again, after sleeping."""
+        for state in states:
+            self.lease_wait_count += 1
+            state.wait_count += 1
+            state.lease_get_fn = self.pipe.lease_get(state.key_str)
+            self.sess.add_next_call(state)
+
+
+class _ItemStatsMixin(Generic[K]):
+    """Public stats of Item and AsyncItem."""
+    __slots__ = ()
+
+    _conf: _BaseItemConfig
+
+    def compute_key_name(self, key: K) -> str:
+        """Calling the key name function, mostly for testing purpose."""
+        return self._conf.key_fn(key)
+
+    @property
+    def hit_count(self) -> int:
+        """Number of times cache get hit."""
+        return self._conf.hit_count
+
+    @property
+    def fill_count(self) -> int:
+        """Number of times cache get missed and need to fill from DB."""
+        return self._conf.fill_count
+
+    @property
+    def cache_error_count(self) -> int:
+        """Number of times cache servers return errors"""
+        return self._conf.cache_error_count
+
+    @property
+    def decode_error_count(self) -> int:
+        """Number of times decode function raises errors."""
+        return self._conf.decode_error_count
+
+    @property
+    def bytes_read(self) -> int:
+        """Number of bytes read from the cache servers."""
+        return self._conf.bytes_read
+
+    @property
+    def lease_wait_count(self) -> int:
+        """Number of times lease get is retried because the lease is held by another client."""
+        return self._conf.lease_wait_count
+
+
+class _ItemConfig(  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    _BaseItemConfig[Pipeline, Session, FillerFunc], Generic[T, K],
+):
+    __slots__ = (
+        'refresh_count', 'negative_hit_count',
+        'negative_value', 'refresh_sess',
+        'pending_states', 'fill_executor', 'filling_states',
+    )
+
+    refresh_count: int
+    negative_hit_count: int
+
+    negative_value: Optional[Callable[[], T]]
+    waiting_states: List[_ItemState[T, K]]
+    refresh_sess: Session
+    pending_states: Dict[str, _ItemState[T, K]]
+
+    fill_executor: Optional[Executor]
+    filling_states: List[_ItemState[T, K]]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, pipe: Pipeline,
+            key_fn: Callable[[K], str], filler: Callable[[K], Promise[T]],
+            codec: ItemCodec[T],
+            lease_wait_durations: Optional[List[float]] = None,
+            fill_executor: Optional[Executor] = None,
+            negative_value: Optional[Callable[[], T]] = None,
+    ):
+        super().__init__(
+            pipe=pipe, sess=pipe.lower_session(), key_fn=key_fn, filler=filler, codec=codec,
+            lease_wait_durations=lease_wait_durations,
+        )
+
+        self.refresh_count = 0
+        self.negative_hit_count = 0
+
+        self.negative_value = negative_value
+
+        # early refreshes are executed after the current stage, when the pipeline finishes
+        self.refresh_sess = self.sess.get_lower()
+
+        # states of keys requested in the current stage, by key name
+        self.pending_states = {}
+
+        self.fill_executor = fill_executor
+        self.filling_states = []
+
+    def add_pending(self, state: _ItemState[T, K]) -> None:
+        """Add the state of a key requested in the current stage."""
+        if len(self.pending_states) == 0:
+            self.sess.add_next_call(self._clear_pending)
+        self.pending_states[state.key_str] = state
+
+    def _clear_pending(self) -> None:
+        # the stage is executing, keys requested from now on are fetched again
+        self.pending_states = {}
+
+    def add_filling(self, state: _ItemState[T, K]) -> None:
+        """Add state of key to be filled on the fill executor, together with other keys."""
+        if len(self.filling_states) == 0:
+            self.sess.add_next_call(self._start_filling)
+        self.filling_states.append(state)
+
+    def _start_filling(self) -> None:
+        assert self.fill_executor is not None
+
+        states = self.filling_states
+        self.filling_states = []
+
+        # fillers of all keys of the stage are started in this session call,
+        # and only joined in the next one. Promises of the same batch of
+        # new_multi_get_filler wait for the single call of its fill_func
+        futures = [self.fill_executor.submit(state.call_fill_fn) for state in states]
+
+        def join_filling() -> None:
+            for state, future in zip(states, futures):
+                state.handle_fill_result(future.result())
+
+        self.sess.add_next_call(join_filling)
+
+    def lease_set(self, key_str: str, cas: int, value: T) -> Promise[LeaseSetResponse]:
+        """Encode & set the filled value to cache, NOT_FOUND is set as a negative entry."""
+        if value is NOT_FOUND:
+            return self.pipe.lease_set(key=key_str, cas=cas, data=NEGATIVE_ENTRY, negative=True)
+        return self.pipe.lease_set(key=key_str, cas=cas, data=self.codec.encode(value))
+
+    def is_negative_entry(self, data: bytes) -> bool:
+        """Whether the cache data is a negative entry set by lease_set()."""
+        return self.negative_value is not None and data == NEGATIVE_ENTRY
+
+    def to_result(self, value: T) -> T:
+        """Map the filled value to the value returned to clients."""
+        if value is not NOT_FOUND:
+            return value
+        if self.negative_value is None:
+            raise ValueError('Filler returned NOT_FOUND but negative_value of Item is None')
+        return self.negative_value()
+
+    def _handle_waiting(self) -> None:
+        states, duration = self.take_waiting()
+        if len(states) == 0:
+            return
+
+        time.sleep(duration)
+        self.retry_waiting(states)
 
 
-class _ItemState(Generic[T, K]):
+class _ItemState(Generic[T, K]):  # pylint: disable=too-many-instance-attributes
     __slots__ = (
-        'conf', 'key', 'key_str', 'lease_get_fn', 'cas', '_fill_fn', 'result',
+        'conf', 'key', 'key_str', 'lease_get_fn', 'cas', 'wait_count', '_fill_fn', '_filled',
+        'result',
     )
 
     conf: _ItemConfig[T, K]
@@ -93,14 +351,15 @@ class _ItemState(Generic[T, K]):
     key_str: str
     lease_get_fn: LeaseGetResult
     cas: int
+    wait_count: int
 
     _fill_fn: Promise[T]
+    _filled: T  # the value returned by the filler, can be NOT_FOUND
 
     result: T
 
     def _handle_set_back(self):
-        data = self.conf.codec.encode(self.result)
-        set_fn = self.conf.pipe.lease_set(key=self.key_str, cas=self.cas, data=data)
+        set_fn = self.conf.lease_set(self.key_str, self.cas, self._filled)
 
         def handle_set_fn():
             set_fn()
@@ -108,41 +367,90 @@ class _ItemState(Generic[T, K]):
         self.conf.sess.add_next_call(handle_set_fn)
 
     def _handle_fill_fn(self):
-        self.result = self._fill_fn()
+        self.handle_fill_result(self._fill_fn())
+
+    def _handle_filling(self):
+        self.conf.fill_count += 1
+        self._fill_fn = self.conf.filler(self.key)
+        if self.conf.fill_executor is None:
+            self.conf.sess.add_next_call(self._handle_fill_fn)
+        else:
+            self.conf.add_filling(self)
+
+    def call_fill_fn(self) -> T:
+        """Call the filler promise, can be called from other threads."""
+        return self._fill_fn()
+
+    def handle_fill_result(self, result: T) -> None:
+        """Set the result of the filler and set it back to the cache."""
+        self._filled = result
+        self.result = self.conf.to_result(result)
 
         if self.cas <= 0:
             return
 
         self.conf.sess.add_next_call(self._handle_set_back)
 
-    def _handle_filling(self):
-        self.conf.fill_count += 1
-        self._fill_fn = self.conf.filler(self.key)
-        self.conf.sess.add_next_call(self._handle_fill_fn)
+    def handle_refresh(self, cas: int) -> None:
+        """Refill the key in background when the refresh lease is granted."""
+        conf = self.conf
+        conf.refresh_count += 1
+
+        def refresh_fill_fn():
+            fill_fn = conf.filler(self.key)
+
+            def refresh_set_fn():
+                set_fn = conf.lease_set(self.key_str, cas, fill_fn())
+
+                def handle_set_fn():
+                    set_fn()
+
+                conf.refresh_sess.add_next_call(handle_set_fn)
+
+            conf.refresh_sess.add_next_call(refresh_set_fn)
+
+        conf.refresh_sess.add_next_call(refresh_fill_fn)
+
+    def fill_without_set(self) -> None:
+        """Call the filler without setting back, when the lease is still held by another client."""
+        self.cas = 0
+        self._handle_filling()
+
+    def handle_hit(self, get_resp: LeaseGetResponse) -> None:
+        """Decode the data of a cache hit, fill from the DB if decoding failed."""
+        negative_value = self.conf.negative_value
+        try:
+            if negative_value is not None and self.conf.is_negative_entry(get_resp[1]):
+                self.conf.negative_hit_count += 1
+                self.result = negative_value()
+            else:
+                self.result = self.conf.codec.decode(get_resp[1])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.conf.decode_error_count += 1
+            self.handle_miss(get_resp, f'Decode error. {str(e)}')
+            return
+
+        if get_resp[2] > 0:
+            # refresh lease granted, keep returning the current value
+            self.handle_refresh(get_resp[2])
+
+    def handle_miss(self, get_resp: LeaseGetResponse, resp_error: Optional[str]) -> None:
+        """Handle the lease get response that is not a cache hit."""
+        cas = self.conf.handle_miss(self, get_resp, resp_error)
+        if cas is not None:
+            self.cas = cas
+            self._handle_filling()
 
     def __call__(self) -> None:
         get_resp = self.lease_get_fn.result()
 
-        resp_error: Optional[str] = get_resp[3]
         if get_resp[0] == 1:
             self.conf.hit_count += 1
             self.conf.bytes_read += len(get_resp[1])
-            try:
-                self.result = self.conf.codec.decode(get_resp[1])
-                return
-            except Exception as e:  # pylint: disable=broad-exception-caught
-                self.conf.decode_error_count += 1
-                resp_error = f'Decode error. {str(e)}'
-
-        if get_resp[0] == 2:
-            self.cas = get_resp[2]
-        else:
-            if get_resp[0] == 3:
-                self.conf.cache_error_count += 1
-            logging.error('Item get error. %s', resp_error)
-            self.cas = 0
+            self.handle_hit(get_resp)
+            return
 
-        self._handle_filling()
+        self.handle_miss(get_resp, get_resp[3])
 
     def result_func(self) -> T:
         """Execute the session and map the result back to clients."""
@@ -153,7 +461,83 @@ class _ItemState(Generic[T, K]):
         return r
 
 
-class Item(Generic[T, K]):
+def _new_state(conf: _ItemConfig[T, K], key: K, key_str: str) -> _ItemState[T, K]:
+    """Init the state of a key, the session call of it is added by the caller."""
+    # do init item state
+    state: _ItemState[T, K] = _ItemState()
+
+    state.conf = conf
+    state.key = key
+    state.key_str = key_str
+    state.lease_get_fn = conf.pipe.lease_get(key_str)
+    state.wait_count = 0
+    # end init item state
+
+    conf.add_pending(state)
+    return state
+
+
+class _ItemMultiState(Generic[T, K]):  # pylint: disable=too-few-public-methods
+    """Handles the lease get responses of a get_multi() call in one pass."""
+    __slots__ = ('conf', 'states')
+
+    conf: _ItemConfig[T, K]
+    states: List[_ItemState[T, K]]
+
+    def __init__(self, conf: _ItemConfig[T, K], states: List[_ItemState[T, K]]):
+        self.conf = conf
+        self.states = states
+
+    def _decode_many(self, hit_data: List[bytes]) -> Optional[List[T]]:
+        decode_many = self.conf.codec.decode_many
+        if decode_many is None or len(hit_data) < 2:
+            return None
+        try:
+            values = decode_many(hit_data)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # fall back to decoding one by one to find out the bad values
+            return None
+        if len(values) != len(hit_data):
+            return None
+        return values
+
+    def __call__(self) -> None:
+        conf = self.conf
+
+        hit_states: List[_ItemState[T, K]] = []
+        hit_resps: List[LeaseGetResponse] = []
+
+        for state in self.states:
+            get_resp = state.lease_get_fn.result()
+            if get_resp[0] != 1:
+                state.handle_miss(get_resp, get_resp[3])
+            elif conf.is_negative_entry(get_resp[1]):
+                conf.hit_count += 1
+                state.handle_hit(get_resp)
+            else:
+                hit_states.append(state)
+                hit_resps.append(get_resp)
+
+        if len(hit_states) == 0:
+            return
+
+        hit_data = [resp[1] for resp in hit_resps]
+        conf.hit_count += len(hit_states)
+        conf.bytes_read += sum(len(data) for data in hit_data)
+
+        values = self._decode_many(hit_data)
+        if values is None:
+            for state, get_resp in zip(hit_states, hit_resps):
+                state.handle_hit(get_resp)
+            return
+
+        for state, get_resp, value in zip(hit_states, hit_resps, values):
+            state.result = value
+            if get_resp[2] > 0:
+                state.handle_refresh(get_resp[2])
+
+
+class Item(_ItemStatsMixin[K], Generic[T, K]):
     """
     Item object is for accessing cache keys.
     Cache key will be filled for DB if cache miss, with intelligent batching.
@@ -163,26 +547,48 @@ class Item(Generic[T, K]):
 
     _conf: _ItemConfig[T, K]
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
             self, pipe: Pipeline,
             key_fn: Callable[[K], str],  # K -> str
             filler: Callable[[K], Promise[T]],  # K -> () -> T
             codec: ItemCodec[T],
+            lease_wait_durations: Optional[List[float]] = None,
+            fill_executor: Optional[Executor] = None,
+            negative_value: Optional[Callable[[], T]] = None,
     ):
-        self._conf = _ItemConfig(pipe=pipe, key_fn=key_fn, filler=filler, codec=codec)
+        """
+        :param lease_wait_durations: sleep durations between retries
+            when the lease get returns LEASE_HELD (see RedisClient lease_wait option),
+            default is DEFAULT_LEASE_WAIT_DURATIONS
+        :param fill_executor: for calling the fillers on other threads, one task per key,
+            items sharing the executor start fillers of the same stage together,
+            so the latency of a stage is the max instead of the sum of the fillers.
+            It should not be the executor of new_multi_get_filler, tasks waiting for
+            a batch could occupy all of its workers
+        :param negative_value: the value returned to clients for not found keys, the filler
+            returns NOT_FOUND for them, e.g. new_multi_get_filler with default=lambda: NOT_FOUND.
+            If not None, those keys are cached as NEGATIVE_ENTRY, set with negative=True
+            to use the negative TTL range of the cache client
+        """
+        self._conf = _ItemConfig(
+            pipe=pipe, key_fn=key_fn, filler=filler, codec=codec,
+            lease_wait_durations=lease_wait_durations,
+            fill_executor=fill_executor,
+            negative_value=negative_value,
+        )
 
     def get(self, key: K) -> Promise[T]:
-        """Get data from cache key and fill from DB if it missed."""
-        # do init item state
-        state: _ItemState[T, K] = _ItemState()
-
-        state.conf = self._conf
-        state.key = key
-        state.key_str = self._conf.key_fn(key)
-        state.lease_get_fn = self._conf.pipe.lease_get(state.key_str)
-        # end init item state
+        """
+        Get data from cache key and fill from DB if it missed.
+        The same key requested multiple times in a stage is fetched & filled only once.
+        """
+        conf = self._conf
+        key_str = conf.key_fn(key)
 
-        self._conf.sess.add_next_call(state)
+        state = conf.pending_states.get(key_str)
+        if state is None:
+            state = _new_state(conf, key, key_str)
+            conf.sess.add_next_call(state)
 
         return state.result_func
 
@@ -190,74 +596,56 @@ class Item(Generic[T, K]):
         """Get multi cache keys at once. Equivalent to calling get() multiple times."""
         conf = self._conf
         key_fn = conf.key_fn
-        pipe = conf.pipe
         sess: Session = self._conf.sess
 
         states: List[_ItemState[T, K]] = []
+        new_states: List[_ItemState[T, K]] = []
 
         for key in keys:
-            # do init item state
-            state: _ItemState[T, K] = _ItemState()
-
-            state.conf = conf
-            state.key = key
-            state.key_str = key_fn(key)
-            state.lease_get_fn = pipe.lease_get(state.key_str)
-            # end init item state
+            key_str = key_fn(key)
 
-            sess.add_next_call(state)
+            state = conf.pending_states.get(key_str)
+            if state is None:
+                state = _new_state(conf, key, key_str)
+                new_states.append(state)
 
             states.append(state)
 
+        if len(new_states) > 0:
+            # responses of all keys are handled together, hits are decoded in one batch
+            sess.add_next_call(_ItemMultiState(conf, new_states))
+
         def result_func() -> List[T]:
-            result: List[T] = []
-            for resp_state in states:
-                result.append(resp_state.result_func())
-            return result
+            if sess.is_dirty:
+                sess.execute()
+            return [resp_state.result for resp_state in states]
 
         return result_func
 
-    def compute_key_name(self, key: K) -> str:
-        """Calling the key name function, mostly for testing purpose."""
-        return self._conf.key_fn(key)
-
     @property
-    def hit_count(self) -> int:
-        """Number of times cache get hit."""
-        return self._conf.hit_count
-
-    @property
-    def fill_count(self) -> int:
-        """Number of times cache get missed and need to fill from DB."""
-        return self._conf.fill_count
-
-    @property
-    def cache_error_count(self) -> int:
-        """Number of times cache servers return errors"""
-        return self._conf.cache_error_count
-
-    @property
-    def decode_error_count(self) -> int:
-        """Number of times decode function raises errors."""
-        return self._conf.decode_error_count
+    def refresh_count(self) -> int:
+        """Number of times a key is refreshed before it expires."""
+        return self._conf.refresh_count
 
     @property
-    def bytes_read(self) -> int:
-        """Number of bytes read from the cache servers."""
-        return self._conf.bytes_read
+    def negative_hit_count(self) -> int:
+        """Number of cache hits of not found keys (included in hit_count)."""
+        return self._conf.negative_hit_count
 
 
 class _MultiGetState(Generic[T, K]):  # pylint: disable=too-few-public-methods
-    __slots__ = ('keys', 'result', 'completed')
+    __slots__ = ('keys', 'result', 'completed', 'mut')
 
     keys: List[K]
     result: Dict[K, T]
     completed: bool
+    mut: threading.Lock
 
     def __init__(self):
         self.keys = []
         self.completed = False
         self.result = {}
+        self.mut = threading.Lock()
 
     def add_key(self, key: K):
         """Add key to the state of multi-get filler."""
@@ -269,44 +657,78 @@ GetKeyFunc = Callable[[T], K]  # T -> K
 
 
 class _MultiGetFunc(Generic[T, K]):  # pylint: disable=too-few-public-methods
-    __slots__ = '_state', '_fill_func', '_get_key_func', '_default'
+    __slots__ = (
+        '_state', '_fill_func', '_get_key_func', '_default', '_max_batch_size', '_executor', '_mut',
+    )
 
     _state: Optional[_MultiGetState[T, K]]
     _fill_func: MultiGetFillFunc
     _get_key_func: GetKeyFunc
     _default: Callable[[], T]
+    _max_batch_size: int
+    _executor: Optional[Executor]
+    _mut: threading.Lock
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
             self,
             fill_func: Callable[[List[K]], List[T]],  # List[K] -> List[T]
             key_func: Callable[[T], K],  # T -> K
             default: Callable[[], T],
+            max_batch_size: int = 0,
+            executor: Optional[Executor] = None,
     ):
         self._state = None
         self._fill_func = fill_func
         self._get_key_func = key_func
         self._default = default
+        self._max_batch_size = max_batch_size
+        self._executor = executor
+        self._mut = threading.Lock()
 
     def _get_state(self) -> _MultiGetState:
         if self._state is None:
             self._state = _MultiGetState()
         return self._state
 
-    def result_func(self, key: K) -> Promise[T]:
-        """Function that implement the filler function signature."""
-        state = self._get_state()
-        state.add_key(key)
+    def _fill(self, keys: List[K]) -> List[List[T]]:
+        # remove duplicated keys, keeping the order
+        keys = list(dict.fromkeys(keys))
 
-        def resp_func() -> T:
-            if not state.completed:
-                values = self._fill_func(state.keys)
+        batch_size = self._max_batch_size
+        if batch_size <= 0 or len(keys) <= batch_size:
+            return [self._fill_func(keys)]
 
+        chunks = [keys[n: n + batch_size] for n in range(0, len(keys), batch_size)]
+        if self._executor is None:
+            return [self._fill_func(chunk) for chunk in chunks]
+        return list(self._executor.map(self._fill_func, chunks))
+
+    def _complete(self, state: _MultiGetState[T, K]) -> None:
+        # the promises can be called from the fill executor of Item
+        with state.mut:
+            if state.completed:
+                return
+
+            with self._mut:
+                if self._state is state:
+                    self._state = None
+
+            for values in self._fill(state.keys):
                 for v in values:
                     k = self._get_key_func(v)
                     state.result[k] = v
 
-                state.completed = True
-                self._state = None
+            state.completed = True
+
+    def result_func(self, key: K) -> Promise[T]:
+        """Function that implement the filler function signature."""
+        with self._mut:
+            state = self._get_state()
+            state.add_key(key)
+
+        def resp_func() -> T:
+            if not state.completed:
+                self._complete(state)
 
             return state.result.get(key, self._default())
 
@@ -314,11 +736,22 @@ class _MultiGetFunc(Generic[T, K]):  # pylint: disable=too-few-public-methods
 
 
 # from [K] -> [T] to K -> Promise[T]
-def new_multi_get_filler(
+def new_multi_get_filler(  # pylint: disable=too-many-arguments
         fill_func: Callable[[List[K]], List[T]],  # List[K] -> List[T]
         get_key_func: Callable[[T], K],  # T -> K
         default: Callable[[], T],  # () -> T
+        max_batch_size: int = 0,
+        executor: Optional[Executor] = None,
 ) -> Callable[[K], Promise[T]]:  # K -> () -> T
-    """Helper function for creating Item object with a multi get filler."""
-    fn = _MultiGetFunc(fill_func=fill_func, key_func=get_key_func, default=default)
+    """
+    Helper function for creating Item object with a multi get filler.
+
+    :param max_batch_size: max number of keys per fill_func call, 0 is no limit
+    :param executor: for calling fill_func of the batches in parallel, e.g. a ThreadPoolExecutor
+        with bounded max_workers; batches are called sequentially if it is None
+    """
+    fn = _MultiGetFunc(
+        fill_func=fill_func, key_func=get_key_func, default=default,
+        max_batch_size=max_batch_size, executor=executor,
+    )
     return fn.result_func
@@ -15,9 +15,10 @@ T = TypeVar("T")
 Promise = Callable[[], T]
 
 # status, data, cas, error
-# status = 1 (OK)
+# status = 1 (OK), cas > 0 if a refresh lease is granted (early refresh)
 # status = 2 (LEASE_GRANTED)
 # status = 3 (ERROR)
+# status = 4 (LEASE_HELD), the lease is held by another client, the cas is not usable for setting
 LeaseGetResponse = Tuple[int, bytes, int, Optional[str]]
 
 
@@ -81,8 +82,14 @@ class Pipeline(Protocol):
         """Returns data or a cas (lease id) number when not found."""
 
     @abstractmethod
-    def lease_set(self, key: str, cas: int, data: bytes) -> Promise[LeaseSetResponse]:
-        """Set data for the key when cas number is matched."""
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> Promise[LeaseSetResponse]:
+        """
+        Set data for the key when cas number is matched.
+        negative is True if data is a negative cache entry (a tombstone of a not found key),
+        which can be set with a shorter TTL.
+        """
 
     @abstractmethod
     def delete(self, key: str) -> Promise[DeleteResponse]:
@@ -0,0 +1,396 @@
+"""
+In-process near cache (L1) in front of a CacheClient.
+Hot keys are served from process memory without a round trip to the cache servers.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, List, Optional, Callable, Set
+
+from typing_extensions import Protocol
+
+from .memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from .memproxy import LeaseGetResult, LeaseSetStatus
+from .memproxy import Promise, Pipeline, CacheClient
+from .session import Session
+
+NowFunc = Callable[[], float]  # returns time in seconds
+
+LFU_MAX_FREQ = 255
+
+# number of invalidation versions of NearCache, each shared by the keys hashed to it
+VERSION_BUCKETS = 1024
+
+
+class EvictionPolicy(Enum):
+    """Eviction policy of NearCache when it is full."""
+    LRU = 1
+    LFU = 2
+
+
+class LocalCache(Protocol):
+    """
+    Cache in front of the cache servers used by NearCacheClient,
+    e.g. NearCache, or SharedCache for sharing between processes.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns cached data or None if not found or expired."""
+
+    @abstractmethod
+    def version(self, key: str) -> int:
+        """Returns the invalidation version of the key."""
+
+    @abstractmethod
+    def put_if(self, key: str, data: bytes, version: int) -> bool:
+        """Put data into cache if no invalidation happened since the version was observed."""
+
+    @abstractmethod
+    def invalidate(self, key: str) -> None:
+        """Remove key from cache, in-flight reads of the key will not be put into cache."""
+
+
+class _Entry:  # pylint: disable=too-few-public-methods
+    __slots__ = ('data', 'size', 'expire_at', 'freq')
+
+    data: bytes
+    size: int
+    expire_at: float
+    freq: int
+
+    def __init__(self, data: bytes, size: int, expire_at: float):
+        self.data = data
+        self.size = size
+        self.expire_at = expire_at
+        self.freq = 1
+
+
+class NearCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe process-local cache, bounded by total bytes and number of entries.
+    Entries are expired after ttl seconds and evicted using LRU or LFU policy.
+
+    Keys are hashed to VERSION_BUCKETS invalidation versions, an invalidation only
+    rejects in-flight put_if() calls of the keys sharing its version.
+    """
+
+    __slots__ = (
+        '_max_bytes', '_max_entries', '_ttl', '_policy', '_now',
+        '_mut', '_entries', '_buckets', '_total_bytes', '_versions',
+        '_hit_count', '_miss_count', '_evict_count',
+    )
+
+    _max_bytes: int
+    _max_entries: int
+    _ttl: float
+    _policy: EvictionPolicy
+    _now: NowFunc
+
+    _mut: threading.Lock
+    _entries: Dict[str, _Entry]
+    _buckets: Dict[int, OrderedDict]  # freq -> keys in LRU order
+    _total_bytes: int
+    _versions: List[int]
+
+    _hit_count: int
+    _miss_count: int
+    _evict_count: int
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            max_entries: int = 100_000,
+            ttl: float = 30.0,
+            policy: EvictionPolicy = EvictionPolicy.LRU,
+            now_func: NowFunc = time.monotonic,
+    ):
+        if max_bytes <= 0 or max_entries <= 0:
+            raise ValueError("max_bytes and max_entries must be positive")
+
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._policy = policy
+        self._now = now_func
+
+        self._mut = threading.Lock()
+        self._entries = {}
+        self._buckets = {}
+        self._total_bytes = 0
+        self._versions = [0] * VERSION_BUCKETS
+
+        self._hit_count = 0
+        self._miss_count = 0
+        self._evict_count = 0
+
+    def _unlink(self, key: str, entry: _Entry) -> None:
+        bucket = self._buckets[entry.freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[entry.freq]
+
+    def _link(self, key: str, entry: _Entry) -> None:
+        bucket = self._buckets.get(entry.freq)
+        if bucket is None:
+            bucket = OrderedDict()
+            self._buckets[entry.freq] = bucket
+        bucket[key] = None
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._unlink(key, entry)
+        self._total_bytes -= entry.size
+
+    def _touch(self, key: str, entry: _Entry) -> None:
+        if self._policy == EvictionPolicy.LRU:
+            self._buckets[entry.freq].move_to_end(key)
+            return
+
+        if entry.freq >= LFU_MAX_FREQ:
+            self._buckets[entry.freq].move_to_end(key)
+            return
+
+        self._unlink(key, entry)
+        entry.freq += 1
+        self._link(key, entry)
+
+    def _evict_one(self) -> None:
+        bucket = self._buckets[min(self._buckets)]
+        key = next(iter(bucket))
+        self._remove(key)
+        self._evict_count += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns cached data or None if not found or expired."""
+        with self._mut:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._miss_count += 1
+                return None
+
+            if entry.expire_at <= self._now():
+                self._remove(key)
+                self._miss_count += 1
+                return None
+
+            self._touch(key, entry)
+            self._hit_count += 1
+            return entry.data
+
+    def version(self, key: str) -> int:
+        """
+        Returns the invalidation version of the key.
+        Data read from cache servers must only be put with the version observed before reading,
+        put_if() will ignore it if the key (or another key of the same version) was
+        invalidated in between.
+        """
+        return self._versions[hash(key) % VERSION_BUCKETS]
+
+    def put_if(self, key: str, data: bytes, version: int) -> bool:
+        """Put data into cache if no invalidation happened since the version was observed."""
+        size = len(key) + len(data)
+        if size > self._max_bytes:
+            return False
+
+        with self._mut:
+            if version != self._versions[hash(key) % VERSION_BUCKETS]:
+                return False
+
+            self._remove(key)
+
+            while self._entries and (
+                    len(self._entries) >= self._max_entries
+                    or self._total_bytes + size > self._max_bytes
+            ):
+                self._evict_one()
+
+            entry = _Entry(data=data, size=size, expire_at=self._now() + self._ttl)
+            self._entries[key] = entry
+            self._link(key, entry)
+            self._total_bytes += size
+            return True
+
+    def invalidate(self, key: str) -> None:
+        """Remove key from cache, in-flight reads of the key will not be put into cache."""
+        with self._mut:
+            self._versions[hash(key) % VERSION_BUCKETS] += 1
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._mut:
+            self._versions = [v + 1 for v in self._versions]
+            self._entries.clear()
+            self._buckets.clear()
+            self._total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        """Number of bytes of keys and data stored in cache."""
+        return self._total_bytes
+
+    @property
+    def hit_count(self) -> int:
+        """Number of times get() found data."""
+        return self._hit_count
+
+    @property
+    def miss_count(self) -> int:
+        """Number of times get() did not find data."""
+        return self._miss_count
+
+    @property
+    def evict_count(self) -> int:
+        """Number of entries removed for making room."""
+        return self._evict_count
+
+
+class _NearCacheHitResult:  # pylint: disable=too-few-public-methods
+    __slots__ = ('data',)
+
+    data: bytes
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def result(self) -> LeaseGetResponse:
+        """Implementation of LeaseGetResult protocol."""
+        return 1, self.data, 0, None
+
+
+class _NearCacheGetResult:  # pylint: disable=too-few-public-methods
+    __slots__ = ('pipe', 'key', 'version', 'fn', 'resp')
+
+    pipe: NearCachePipeline
+    key: str
+    version: int
+    fn: LeaseGetResult
+    resp: Optional[LeaseGetResponse]
+
+    def result(self) -> LeaseGetResponse:
+        """Implementation of LeaseGetResult protocol."""
+        if self.resp is not None:
+            return self.resp
+
+        resp = self.fn.result()
+        if resp[0] == 1:
+            self.pipe.put_if(self.key, resp[1], self.version)  # pylint: disable=no-member
+
+        self.resp = resp
+        return resp
+
+
+class NearCachePipeline:
+    """An implementation of Pipeline that looks up a NearCache before the wrapped Pipeline."""
+
+    __slots__ = ('_pipe', '_cache', '_deleted_keys')
+
+    _pipe: Pipeline
+    _cache: LocalCache
+
+    # keys deleted in this pipeline, data read for them may be executed before the deletion
+    _deleted_keys: Optional[Set[str]]
+
+    def __init__(self, pipe: Pipeline, cache: LocalCache):
+        self._pipe = pipe
+        self._cache = cache
+        self._deleted_keys = None
+
+    def put_if(self, key: str, data: bytes, version: int) -> None:
+        """Put data into the near cache if the key was not deleted in this pipeline."""
+        if self._deleted_keys and key in self._deleted_keys:
+            return
+        self._cache.put_if(key, data, version)
+
+    def lease_get(self, key: str) -> LeaseGetResult:
+        """Implement Pipeline.lease_get()."""
+        cache = self._cache
+
+        data = cache.get(key)
+        if data is not None:
+            return _NearCacheHitResult(data)
+
+        result = _NearCacheGetResult()
+        result.pipe = self
+        result.key = key
+        result.version = cache.version(key)
+        result.fn = self._pipe.lease_get(key)
+        result.resp = None
+        return result
+
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> Promise[LeaseSetResponse]:
+        """Implement Pipeline.lease_set()."""
+        version = self._cache.version(key)
+        fn = self._pipe.lease_set(key, cas, data, negative)
+
+        def lease_set_fn() -> LeaseSetResponse:
+            resp = fn()
+            if resp.status == LeaseSetStatus.OK:
+                self.put_if(key, data, version)
+            return resp
+
+        return lease_set_fn
+
+    def delete(self, key: str) -> Promise[DeleteResponse]:
+        """Implement Pipeline.delete(), the key is invalidated from the near cache immediately."""
+        if self._deleted_keys is None:
+            self._deleted_keys = set()
+        self._deleted_keys.add(key)
+
+        self._cache.invalidate(key)
+        fn = self._pipe.delete(key)
+
+        def delete_fn() -> DeleteResponse:
+            self._cache.invalidate(key)
+            return fn()
+
+        return delete_fn
+
+    def lower_session(self) -> Session:
+        """Implement Pipeline.lower_session()."""
+        return self._pipe.lower_session()
+
+    def finish(self) -> None:
+        """Implement Pipeline.finish()."""
+        self._pipe.finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+
+# pylint: disable=too-few-public-methods
+class NearCacheClient:
+    """
+    An implementation of CacheClient that adds a process-local NearCache
+    (or a SharedCache of processes on the same host) in front of another CacheClient.
+    Only deletes issued through pipelines sharing the cache invalidate it,
+    changes from other processes are visible after the cache ttl.
+    """
+
+    __slots__ = ('_client', '_cache')
+
+    _client: CacheClient
+    _cache: LocalCache
+
+    def __init__(self, client: CacheClient, cache: LocalCache):
+        self._client = client
+        self._cache = cache
+
+    def pipeline(self, sess: Optional[Session] = None) -> Pipeline:
+        """Creates a new pipeline."""
+        return NearCachePipeline(pipe=self._client.pipeline(sess), cache=self._cache)
@@ -1,7 +1,10 @@
 """
 Implementation of Cache Client & Pipeline supporting Cache Replication.
 """
+from .hedge import HedgePolicy
+from .latency import ServerLatency
 from .proxy import ProxyCacheClient
 from .replicated import ReplicatedRoute, ReplicatedSelector
 from .route import Route, Selector, Stats
-from .stats import ServerStats
+from .sharded import ShardedRoute, ShardedSelector
+from .stats import ServerStats, StatsScheduler
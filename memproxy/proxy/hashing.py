@@ -0,0 +1,26 @@
+"""
+Hash functions for choosing servers of keys.
+"""
+import hashlib
+
+MASK_64 = (1 << 64) - 1
+
+
+def mix64(x: int) -> int:
+    """Finalizer of MurmurHash3, for mixing key hash with server seeds."""
+    x ^= x >> 33
+    x = (x * 0xff51afd7ed558ccd) & MASK_64
+    x ^= x >> 33
+    x = (x * 0xc4ceb9fe1a85ec53) & MASK_64
+    x ^= x >> 33
+    return x
+
+
+def key_hash(key: str) -> int:
+    """64-bit hash of the key, stable between processes."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+def server_seed(server_id: int) -> int:
+    """Seed of the server for rendezvous hashing."""
+    return mix64(server_id & MASK_64)
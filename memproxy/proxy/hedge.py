@@ -0,0 +1,100 @@
+"""
+Policy for hedging lease gets of slow servers to other replicas.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+_MAX_TOKENS = 10.0
+
+
+class HedgePolicy:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe policy deciding when lease gets of a server batch are also sent to another replica.
+    A batch is hedged when it has not answered after a percentile of the recent batch latencies,
+    and only while the budget allows, at most budget_percent of batches are hedged.
+    """
+
+    __slots__ = (
+        '_percentile', '_min_delay', '_budget', '_min_samples', '_recompute_every',
+        '_mut', '_samples', '_new_samples', '_delay', '_tokens',
+    )
+
+    _percentile: float
+    _min_delay: float
+    _budget: float
+    _min_samples: int
+    _recompute_every: int
+
+    _mut: threading.Lock
+    _samples: Deque[float]
+    _new_samples: int
+    _delay: Optional[float]
+    _tokens: float
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            percentile: float = 95.0,
+            min_delay: float = 0.001,
+            budget_percent: float = 5.0,
+            window: int = 1000,
+            min_samples: int = 100,
+    ):
+        """
+        :param percentile: percentile of batch latencies (in seconds) used as the hedge delay
+        :param min_delay: the hedge delay is never less than this
+        :param budget_percent: maximum percentage of batches that are hedged
+        :param window: number of recent batch latencies kept
+        :param min_samples: no hedging before this number of batch latencies are observed
+        """
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if window <= 0 or min_samples <= 0 or min_samples > window:
+            raise ValueError("min_samples must be positive and not greater than window")
+
+        self._percentile = percentile
+        self._min_delay = min_delay
+        self._budget = budget_percent / 100.0
+        self._min_samples = min_samples
+        self._recompute_every = max(window // 10, 1)
+
+        self._mut = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._new_samples = 0
+        self._delay = None
+        self._tokens = 0.0
+
+    def observe(self, duration: float) -> None:
+        """Record the latency of a server batch."""
+        with self._mut:
+            self._samples.append(duration)
+            self._new_samples += 1
+
+            if len(self._samples) < self._min_samples:
+                return
+            if self._delay is not None and self._new_samples < self._recompute_every:
+                return
+
+            self._new_samples = 0
+            sorted_samples = sorted(self._samples)
+            index = min(int(len(sorted_samples) * self._percentile / 100), len(sorted_samples) - 1)
+            self._delay = max(sorted_samples[index], self._min_delay)
+
+    def delay(self) -> Optional[float]:
+        """Returns the hedge delay in seconds, None if not enough batch latencies are observed."""
+        return self._delay
+
+    def add_request(self) -> None:
+        """Called for each batch that can be hedged, adding to the budget."""
+        with self._mut:
+            self._tokens = min(self._tokens + self._budget, _MAX_TOKENS)
+
+    def try_hedge(self) -> bool:
+        """Returns True and takes from the budget if a batch can be hedged."""
+        with self._mut:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
@@ -0,0 +1,103 @@
+"""
+Tracking latency of cache servers observed by the proxy, for selecting replicas.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Dict, Callable
+
+NowFunc = Callable[[], float]  # returns time in seconds
+
+
+class _ServerState:  # pylint: disable=too-few-public-methods
+    __slots__ = ('ewma', 'updated_at', 'in_flight')
+
+    ewma: float
+    updated_at: float
+    in_flight: int
+
+    def __init__(self):
+        self.ewma = 0.0
+        self.updated_at = 0.0
+        self.in_flight = 0
+
+
+class ServerLatency:
+    """
+    Thread-safe tracker of the latency (EWMA) and the number of in-flight calls of servers.
+    The same object is passed to ProxyCacheClient for observing calls
+    and to ReplicatedRoute for selecting replicas.
+    """
+
+    __slots__ = ('_decay', '_now', '_mut', '_servers')
+
+    _decay: float
+    _now: NowFunc
+    _mut: threading.Lock
+    _servers: Dict[int, _ServerState]
+
+    def __init__(self, decay_seconds: float = 10.0, now_func: NowFunc = time.monotonic):
+        """
+        :param decay_seconds: time constant of the EWMA, samples older than it have less weight.
+            The latency of a server without new samples also decays with it,
+            so a slow server that is not selected anymore will be retried later,
+            when its score is within the latency_threshold of ReplicatedRoute
+        """
+        if decay_seconds <= 0:
+            raise ValueError("decay_seconds must be positive")
+
+        self._decay = decay_seconds
+        self._now = now_func
+        self._mut = threading.Lock()
+        self._servers = {}
+
+    def _get_state(self, server_id: int) -> _ServerState:
+        state = self._servers.get(server_id)
+        if state is None:
+            state = _ServerState()
+            self._servers[server_id] = state
+        return state
+
+    def begin(self, server_id: int) -> float:
+        """Start a call to the server, returns the start time for calling end()."""
+        with self._mut:
+            self._get_state(server_id).in_flight += 1
+        return self._now()
+
+    def end(self, server_id: int, start: float) -> None:
+        """Finish a call to the server started at the start time."""
+        now = self._now()
+        sample = now - start
+
+        with self._mut:
+            state = self._get_state(server_id)
+            state.in_flight -= 1
+
+            if state.updated_at == 0.0:
+                state.ewma = sample
+            else:
+                w = math.exp(-max(now - state.updated_at, 0.0) / self._decay)
+                state.ewma = state.ewma * w + sample * (1.0 - w)
+            state.updated_at = now
+
+    def latency(self, server_id: int) -> float:
+        """Returns the EWMA latency in seconds, decayed by the time since the last sample."""
+        state = self._servers.get(server_id)
+        if state is None or state.updated_at == 0.0:
+            return 0.0
+
+        elapsed = max(self._now() - state.updated_at, 0.0)
+        return state.ewma * math.exp(-elapsed / self._decay)
+
+    def in_flight(self, server_id: int) -> int:
+        """Returns the number of calls to the server that are not finished."""
+        state = self._servers.get(server_id)
+        if state is None:
+            return 0
+        return state.in_flight
+
+    def score(self, server_id: int) -> float:
+        """The expected cost of calling the server, lower is better."""
+        return self.latency(server_id) * (self.in_flight(server_id) + 1)
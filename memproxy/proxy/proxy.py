@@ -1,24 +1,169 @@
 """
 CacheClient & Pipeline implementation as a proxy for multiple cache servers.
 """
-from typing import Dict, List, Callable, Optional
+import time
+from concurrent.futures import Executor, Future, wait, FIRST_COMPLETED
+from typing import Dict, List, Callable, Optional, TypeVar, Any, Tuple
 
 from memproxy import LeaseGetResult
 from memproxy import LeaseSetStatus, DeleteStatus
 from memproxy import Pipeline, CacheClient, Session
 from memproxy import Promise, LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from .hedge import HedgePolicy
+from .latency import ServerLatency
 from .route import Selector, Route
 
+T = TypeVar("T")
+
 
 class _ClientConfig:  # pylint: disable=too-few-public-methods
-    __slots__ = ('clients', 'route')
+    __slots__ = ('clients', 'route', 'executor', 'latency', 'hedge')
 
     clients: Dict[int, CacheClient]
     route: Route
-
-    def __init__(self, clients: Dict[int, CacheClient], route: Route):
+    executor: Optional[Executor]
+    latency: Optional[ServerLatency]
+    hedge: Optional[HedgePolicy]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, clients: Dict[int, CacheClient], route: Route,
+            executor: Optional[Executor] = None,
+            latency: Optional[ServerLatency] = None,
+            hedge: Optional[HedgePolicy] = None,
+    ):
         self.clients = clients
         self.route = route
+        self.executor = executor
+        self.latency = latency
+        self.hedge = hedge
+
+
+def _observe(latency: Optional[ServerLatency], server_id: int, fn: Callable[[], T]) -> T:
+    if latency is None:
+        return fn()
+
+    start = latency.begin(server_id)
+    try:
+        return fn()
+    finally:
+        latency.end(server_id, start)
+
+
+class _OnceLeaseGet:  # pylint: disable=too-few-public-methods
+    """
+    Lease get result that is only computed once, it can be flushed on another thread.
+    Its first call does the round trip to the server, so the latency is observed there.
+    """
+    __slots__ = ('fn', 'resp', 'latency', 'server_id')
+
+    fn: LeaseGetResult
+    resp: Optional[LeaseGetResponse]
+    latency: Optional[ServerLatency]
+    server_id: int
+
+    def __init__(self, fn: LeaseGetResult, latency: Optional[ServerLatency], server_id: int):
+        self.fn = fn
+        self.resp = None
+        self.latency = latency
+        self.server_id = server_id
+
+    def result(self) -> LeaseGetResponse:
+        """Implement LeaseGetResult protocol."""
+        if self.resp is None:
+            self.resp = _observe(self.latency, self.server_id, self.fn.result)
+        return self.resp
+
+
+class _ResolvedLeaseGet:  # pylint: disable=too-few-public-methods
+    """Lease get result already received, e.g. from a hedged request."""
+    __slots__ = ('resp',)
+
+    resp: LeaseGetResponse
+
+    def __init__(self, resp: LeaseGetResponse):
+        self.resp = resp
+
+    def result(self) -> LeaseGetResponse:
+        """Implement LeaseGetResult protocol."""
+        return self.resp
+
+
+def _is_lease_granted(resp: LeaseGetResponse) -> bool:
+    # refresh leases are not released, the key still holds a valid value until they expire
+    return resp[0] == 2
+
+
+def _run_observed(hedge: HedgePolicy, fn: Callable[[], Any]) -> None:
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        hedge.observe(time.perf_counter() - start)
+
+
+def _hedge_lease_get(
+        clients: Dict[int, CacheClient], requests: List[Tuple[int, str]],
+) -> List[LeaseGetResponse]:
+    """Lease get (server id, key) pairs using new pipelines, not shared with the proxy pipeline."""
+    pipes: Dict[int, Pipeline] = {}
+    fns: List[LeaseGetResult] = []
+    for server_id, key in requests:
+        pipe = pipes.get(server_id)
+        if pipe is None:
+            pipe = clients[server_id].pipeline()
+            pipes[server_id] = pipe
+        fns.append(pipe.lease_get(key))
+
+    try:
+        return [fn.result() for fn in fns]
+    finally:
+        for pipe in pipes.values():
+            pipe.finish()
+
+
+def _release_leases(clients: Dict[int, CacheClient], leases: List[Tuple[int, str]]) -> None:
+    """
+    Delete keys that leases were granted for but will not be set,
+    other clients would otherwise wait for those leases until they expire.
+    """
+    pipes: Dict[int, Pipeline] = {}
+    fns: List[Promise[DeleteResponse]] = []
+    for server_id, key in leases:
+        pipe = pipes.get(server_id)
+        if pipe is None:
+            pipe = clients[server_id].pipeline()
+            pipes[server_id] = pipe
+        fns.append(pipe.delete(key))
+
+    try:
+        for fn in fns:
+            fn()
+    finally:
+        for pipe in pipes.values():
+            pipe.finish()
+
+
+class _OncePromise:  # pylint: disable=too-few-public-methods
+    """Promise that is only computed once, it can be flushed on another thread."""
+    __slots__ = ('fn', 'done', 'value', 'latency', 'server_id')
+
+    fn: Promise[Any]
+    done: bool
+    value: Any
+    latency: Optional[ServerLatency]
+    server_id: int
+
+    def __init__(self, fn: Promise[Any], latency: Optional[ServerLatency], server_id: int):
+        self.fn = fn
+        self.done = False
+        self.latency = latency
+        self.server_id = server_id
+
+    def __call__(self) -> Any:
+        if not self.done:
+            self.value = _observe(self.latency, self.server_id, self.fn)
+            self.done = True
+        return self.value
 
 
 class _LeaseSetServer:  # pylint: disable=too-few-public-methods
@@ -35,7 +180,7 @@ class _PipelineConfig:  # pylint: disable=too-many-instance-attributes
     """Config object for pipeline actions."""
     __slots__ = (
         'conf', 'sess', 'pipe_sess', 'selector',
-        '_pipelines', '_set_servers', 'pipe', 'server_id',
+        '_pipelines', '_set_servers', '_flush_fns', '_hedge_states', '_detached',
     )
 
     conf: _ClientConfig
@@ -47,8 +192,13 @@ class _PipelineConfig:  # pylint: disable=too-many-instance-attributes
 
     _set_servers: Optional[Dict[str, _LeaseSetServer]]
 
-    pipe: Optional[Pipeline]
-    server_id: Optional[int]
+    # server id -> a promise that executes the pipeline of that server in the current stage
+    _flush_fns: Dict[int, Callable[[], Any]]
+
+    # server id -> lease get states of the current stage, None if the server can not be hedged
+    _hedge_states: Dict[int, Optional[List['_LeaseGetState']]]
+    # pipelines were replaced because they were still executing after losing to hedged requests
+    _detached: bool
 
     def __init__(self, conf: _ClientConfig, sess: Optional[Session]):
         self.conf = conf
@@ -64,22 +214,203 @@ class _PipelineConfig:  # pylint: disable=too-many-instance-attributes
         self._pipelines = {}
 
         self._set_servers = None
-
-        self.pipe = None
-        self.server_id = None
+        self._flush_fns = {}
+        self._hedge_states = {}
+        self._detached = False
 
     def get_pipeline(self, server_id: int) -> Pipeline:
         """New pipeline object if not already created."""
         pipe = self._pipelines.get(server_id)
-        self.pipe = pipe
         if pipe:
             return pipe
 
         new_pipe = self.conf.clients[server_id].pipeline(sess=self.pipe_sess)
         self._pipelines[server_id] = new_pipe
-        self.pipe = new_pipe
         return new_pipe
 
+    def _add_flush_fn(self, server_id: int, fn: Callable[[], Any]) -> None:
+        if len(self._flush_fns) == 0:
+            # executed before the calls of the operations of the stage
+            self.sess.add_next_call(self._flush)
+        self._flush_fns[server_id] = fn
+
+    def _need_flush_fn(self, server_id: int) -> bool:
+        if self.conf.executor is None and self.conf.latency is None:
+            return False
+        return server_id not in self._flush_fns
+
+    def flush_lease_get(self, server_id: int, fn: LeaseGetResult) -> LeaseGetResult:
+        """
+        Use the lease get result for flushing the server pipeline
+        and observing its latency if none was used.
+        """
+        if not self._need_flush_fn(server_id):
+            return fn
+        once = _OnceLeaseGet(fn, self.conf.latency, server_id)
+        self._add_flush_fn(server_id, once.result)
+        return once
+
+    def flush_promise(self, server_id: int, fn: Promise[T]) -> Promise[T]:
+        """
+        Use the promise for flushing the server pipeline
+        and observing its latency if none was used.
+        """
+        if self.conf.hedge is not None:
+            # other operations can not be hedged
+            self._hedge_states[server_id] = None
+
+        if not self._need_flush_fn(server_id):
+            return fn
+        once = _OncePromise(fn, self.conf.latency, server_id)
+        self._add_flush_fn(server_id, once)
+        return once
+
+    def add_hedge_state(self, state: '_LeaseGetState') -> None:
+        """Add the lease get state to be hedged if its server is slow."""
+        if self.conf.hedge is None:
+            return
+
+        states = self._hedge_states.setdefault(state.server_id, [])
+        if states is not None:
+            states.append(state)
+
+    def _flush(self) -> None:
+        executor = self.conf.executor
+
+        flush_fns = self._flush_fns
+        self._flush_fns = {}
+
+        hedge_states = self._hedge_states
+        self._hedge_states = {}
+
+        if executor is None:
+            return
+
+        if self.conf.hedge is not None:
+            self._flush_hedged(executor, self.conf.hedge, flush_fns, hedge_states)
+            return
+
+        fns = list(flush_fns.values())
+        if len(fns) <= 1:
+            return
+
+        # errors are handled when the promises are called again
+        futures = [executor.submit(fn) for fn in fns[1:]]
+        try:
+            fns[0]()
+        finally:
+            wait(futures)
+
+    def _flush_hedged(
+            self, executor: Executor, hedge: HedgePolicy,
+            flush_fns: Dict[int, Callable[[], Any]],
+            hedge_states: Dict[int, Optional[List['_LeaseGetState']]],
+    ) -> None:
+        futures: Dict[int, Future] = {}
+        for server_id, fn in flush_fns.items():
+            futures[server_id] = executor.submit(_run_observed, hedge, fn)
+            if hedge_states.get(server_id):
+                hedge.add_request()
+
+        hedged: Dict[int, Tuple[List[Tuple[int, str]], Future]] = {}
+
+        delay = hedge.delay()
+        if delay is not None:
+            wait(futures.values(), timeout=delay)
+
+            for server_id, future in futures.items():
+                states = hedge_states.get(server_id)
+                if future.done() or not states:
+                    continue
+
+                requests = self._hedge_requests(server_id, states)
+                if requests is None or not hedge.try_hedge():
+                    continue
+
+                hedge_future = executor.submit(_hedge_lease_get, self.conf.clients, requests)
+                hedged[server_id] = requests, hedge_future
+
+        for server_id, future in futures.items():
+            hedged_req = hedged.get(server_id)
+            if hedged_req is None:
+                wait([future])
+                continue
+
+            states = hedge_states[server_id]
+            assert states is not None
+            self._complete_hedged(server_id, future, states, *hedged_req)
+
+    def _hedge_requests(
+            self, server_id: int, states: List['_LeaseGetState'],
+    ) -> Optional[List[Tuple[int, str]]]:
+        """Returns (other replica, key) for each state, None if any key has no other replica."""
+        requests: List[Tuple[int, str]] = []
+        for state in states:
+            for other_id in self.selector.select_servers_for_delete(state.key):
+                if other_id != server_id:
+                    requests.append((other_id, state.key))
+                    break
+            else:
+                return None
+        return requests
+
+    def _complete_hedged(  # pylint: disable=too-many-arguments
+            self, server_id: int, future: Future, states: List['_LeaseGetState'],
+            requests: List[Tuple[int, str]], hedge_future: Future,
+    ) -> None:
+        clients = self.conf.clients
+        executor = self.conf.executor
+        assert executor is not None
+
+        wait([future, hedge_future], return_when=FIRST_COMPLETED)
+
+        if not future.done() and hedge_future.exception() is None:
+            responses: List[LeaseGetResponse] = hedge_future.result()
+            if all(resp[0] != 3 for resp in responses):
+                self._use_hedged(server_id, future, states, requests, responses)
+                return
+
+        # the server answered first or the hedged requests failed
+        wait([future])
+
+        def release_hedged(f: Future) -> None:
+            if f.exception() is not None:
+                return
+            leases = [req for req, resp in zip(requests, f.result()) if _is_lease_granted(resp)]
+            if leases:
+                executor.submit(_release_leases, clients, leases)
+
+        # the callback is called on this thread if the future is done,
+        # releasing is submitted to the executor for not blocking the caller
+        hedge_future.add_done_callback(release_hedged)
+
+    def _use_hedged(  # pylint: disable=too-many-arguments
+            self, server_id: int, future: Future, states: List['_LeaseGetState'],
+            requests: List[Tuple[int, str]], responses: List[LeaseGetResponse],
+    ) -> None:
+        clients = self.conf.clients
+        executor = self.conf.executor
+        assert executor is not None
+        server_fns = [(state.key, state.fn) for state in states]
+
+        for state, (other_id, _), resp in zip(states, requests, responses):
+            state.fn = _ResolvedLeaseGet(resp)
+            # lease sets must go to the server granting the lease
+            state.server_id = other_id
+
+        # the pipeline is still executing, later stages use a new one
+        del self._pipelines[server_id]
+        self._detached = True
+
+        def release_server(_: Future) -> None:
+            leases = [
+                (server_id, key) for key, fn in server_fns if _is_lease_granted(fn.result())
+            ]
+            if leases:
+                executor.submit(_release_leases, clients, leases)
+
+        future.add_done_callback(release_server)
+
     def _get_servers(self) -> Dict[str, _LeaseSetServer]:
         if not self._set_servers:
             self._set_servers = {}
@@ -107,15 +438,16 @@ class _PipelineConfig:  # pylint: disable=too-many-instance-attributes
 
     def execute(self):
         """execute pipeline stage."""
-        self.pipe = None
-        self.server_id = None
         self.sess.execute()
         self.selector.reset()
 
     def finish(self):
         """finish pipeline stage."""
-        for server_id in self._pipelines:  # pylint: disable=consider-using-dict-items
-            self._pipelines[server_id].finish()
+        self.sess.execute_lower()
+        for pipe in list(self._pipelines.values()):
+            pipe.finish()
+        if self._detached:
+            self.pipe_sess.execute_lower()
 
 
 class _LeaseGetState:
@@ -133,7 +465,7 @@ class _LeaseGetState:
 
     def _handle_resp(self):
         self.resp = self.fn.result()
-        if self.resp[0] == 2:
+        if self.resp[0] == 2 or (self.resp[0] == 1 and self.resp[2] > 0):
             self.conf.add_set_server(self.key, self.server_id)
 
     def __call__(self) -> None:
@@ -142,6 +474,12 @@ class _LeaseGetState:
         self.resp = self.fn.result()
 
         if self.resp[0] == 1:
+            if self.resp[2] > 0:
+                # refresh lease granted
+                self.conf.add_set_server(self.key, self.server_id)
+            return
+
+        if self.resp[0] == 4:
             return
 
         if self.resp[0] == 2:
@@ -153,10 +491,9 @@ class _LeaseGetState:
         self.server_id, ok = self.conf.selector.select_server(self.key)
         if not ok:
             return
-        self.conf.server_id = self.server_id
 
         pipe = self.conf.get_pipeline(self.server_id)
-        self.fn = pipe.lease_get(self.key)
+        self.fn = self.conf.flush_lease_get(self.server_id, pipe.lease_get(self.key))
 
         def next_again_func():
             self._handle_resp()
@@ -255,23 +592,22 @@ class ProxyPipeline:
         state.conf = conf
         state.key = key
 
-        if conf.pipe:
-            state.pipe = conf.pipe
-            state.server_id = conf.server_id  # type: ignore
-        else:
-            server_id, _ = conf.selector.select_server(key)
-            state.server_id = server_id
-            conf.server_id = server_id
+        # keys can be on different servers, e.g. with ShardedRoute
+        server_id, _ = conf.selector.select_server(key)
+        state.server_id = server_id
+        state.pipe = conf.get_pipeline(server_id)
 
-            state.pipe = conf.get_pipeline(server_id)
-
-        state.fn = state.pipe.lease_get(key)
+        state.fn = conf.flush_lease_get(server_id, state.pipe.lease_get(key))
         # end init get state
 
+        conf.add_hedge_state(state)
+
         conf.sess.add_next_call(state)
         return state
 
-    def lease_set(self, key: str, cas: int, data: bytes) -> Promise[LeaseSetResponse]:
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> Promise[LeaseSetResponse]:
         """Implement Pipeline.lease_set()."""
 
         server_id = self._conf.get_set_server(key)
@@ -286,7 +622,7 @@ class ProxyPipeline:
 
         pipe = self._conf.get_pipeline(server_id)
 
-        fn = pipe.lease_set(key, cas, data)
+        fn = self._conf.flush_promise(server_id, pipe.lease_set(key, cas, data, negative))
         state = _LeaseSetState(conf=self._conf, fn=fn)
 
         self._conf.sess.add_next_call(state.next_func)
@@ -301,7 +637,7 @@ class ProxyPipeline:
         fn_list: List[Promise[DeleteResponse]] = []
         for server_id in servers:
             pipe = self._conf.get_pipeline(server_id)
-            fn = pipe.delete(key)
+            fn = self._conf.flush_promise(server_id, pipe.delete(key))
             fn_list.append(fn)
 
         state = _DeleteState(conf=self._conf, fn_list=fn_list, servers=servers)
@@ -332,12 +668,26 @@ class ProxyCacheClient:
 
     _conf: _ClientConfig
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
             self,
             server_ids: List[int],
             new_func: Callable[[int], CacheClient],  # server_id -> CacheClient
             route: Route,
+            executor: Optional[Executor] = None,
+            latency: Optional[ServerLatency] = None,
+            hedge: Optional[HedgePolicy] = None,
     ):
+        """
+        :param executor: if not None, pipelines of servers used in the same stage
+            are executed concurrently on it, e.g. deletes on all replicas
+        :param latency: if not None, latency of calls to servers are recorded into it,
+            the same object should be passed to ReplicatedRoute for selecting replicas
+        :param hedge: if not None, lease gets of a server not answering after the hedge delay
+            are also sent to another replica, the first answer is used. Requires executor
+        """
+        if hedge is not None and executor is None:
+            raise ValueError("hedge requires an executor")
+
         clients: Dict[int, CacheClient] = {}
         for server_id in server_ids:
             client = new_func(server_id)
@@ -346,6 +696,9 @@ class ProxyCacheClient:
         self._conf = _ClientConfig(
             clients=clients,
             route=route,
+            executor=executor,
+            latency=latency,
+            hedge=hedge,
         )
 
     def pipeline(self, sess: Optional[Session] = None) -> Pipeline:
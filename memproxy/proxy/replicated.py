@@ -3,88 +3,175 @@ Implementation of Route and Selector Protocol.
 """
 from __future__ import annotations
 
+import bisect
+import math
 import random
+import threading
 import time
-from dataclasses import dataclass
-from typing import Optional, List, Tuple, Callable, Set
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple, Callable, Set, Dict, FrozenSet
 
+from .hashing import mix64, key_hash, server_seed
+from .latency import ServerLatency
 from .route import Selector, Stats
 
 
 class ReplicatedSelector:
     """Implement Selector Protocol that deals with cache replication."""
 
-    __slots__ = '_conf', '_chosen_server', '_failed_servers', '_rand_func'
+    __slots__ = (
+        '_conf', '_chosen_server', '_table', '_chosen_keys', '_failed_servers', '_rand_func',
+    )
 
     _conf: _RouteConfig
 
     _chosen_server: Optional[int]
+    # with key affinity, the weight table of the stage and the chosen servers of keys
+    _table: Optional[_WeightTable]
+    _chosen_keys: Dict[str, Tuple[int, bool]]
     _failed_servers: Set[int]
     _rand_func: RandFunc
 
     def __init__(self, conf: _RouteConfig):
         self._conf = conf
         self._chosen_server = None
+        self._table = None
+        self._chosen_keys = {}
         self._failed_servers = set()
         self._rand_func = conf.rand()
 
-    def _compute_chosen_server(self) -> bool:
-        remaining: List[int] = []
-        weights: List[float] = []
-
-        for server_id in self._conf.servers:
-            if server_id in self._failed_servers:
-                continue
-
-            usage = self._conf.stats.get_mem_usage(server_id)
-            if usage is None:
-                self._failed_servers.add(server_id)
-                continue
-
-            remaining.append(server_id)
-            weights.append(usage)
-
-        ok = True
-        if len(remaining) == 0:
-            remaining = self._conf.servers
-            weights = [1.0] * len(remaining)
-            ok = False
-
-        if all(w < 1.0 for w in weights):
-            for i in range(len(weights)):  # pylint: disable=consider-using-enumerate
-                weights[i] = 1.0
-
-        _recompute_weights_with_min_percent(weights, self._conf.min_percent)
-
-        # accumulate
-        for i in range(1, len(weights)):
-            weights[i] = weights[i - 1] + weights[i]
+    def _load_shared_table(self) -> _WeightTable:
+        """Returns the weight table shared by selectors, usages are read only if stats changed."""
+        conf = self._conf
+        generation = conf.stats.generation()
+
+        failed = conf.failed
+        if failed.servers and failed.generation != generation:
+            # the stats were updated after the failures, e.g. by probing the failed servers
+            failed = conf.clear_failed(failed)
+
+        table = conf.table
+        if table is not None and table.key == (generation, failed.version):
+            return table
+
+        usages: List[Optional[float]] = []
+        for server_id in conf.servers:
+            if server_id in failed.servers:
+                usages.append(None)
+            else:
+                usages.append(conf.stats.get_mem_usage(server_id))
+
+        key = generation, failed.version
+        table = _WeightTable(conf.servers, usages, conf.min_percent, key=key)
+        conf.table = table
+        return table
+
+    def _load_table(self) -> _WeightTable:
+        """The shared table, or a table of this selector if its failed servers are not excluded."""
+        table = self._load_shared_table()
+        if not self._failed_servers:
+            return table
+
+        servers = self._conf.servers
+        usages = [
+            None if server_id in self._failed_servers else usage
+            for server_id, usage in zip(servers, table.usages)
+        ]
+        if tuple(usages) == table.usages:
+            return table
+        return _WeightTable(servers, usages, self._conf.min_percent)
 
+    def _compute_chosen_server(self) -> bool:
+        table = self._load_table()
+        remaining = table.remaining
+
+        index = self._weighted_choice(table.weights, -1)
+
+        conf = self._conf
+        latency = conf.latency
+        if latency is not None and len(remaining) > 1:
+            # power of two choices: the other candidate is also chosen by weights.
+            # it replaces the weighted choice only if its score is lower by more than the threshold,
+            # so replicas with similar latencies keep the split by weights
+            other = self._weighted_choice(table.weights, index)
+            limit = latency.score(remaining[index]) * (1.0 - conf.latency_threshold)
+            if latency.score(remaining[other]) < limit:
+                index = other
+
+        self._chosen_server = remaining[index]
+        return table.ok
+
+    def _weighted_choice(self, weights: Tuple[float, ...], excluded: int) -> int:
+        """Choose an index using accumulated weights, excluded index is not chosen if >= 0."""
         max_weight = weights[-1]
 
+        excluded_low = 0.0
+        excluded_weight = 0.0
+        if excluded >= 0:
+            if excluded > 0:
+                excluded_low = weights[excluded - 1]
+            excluded_weight = weights[excluded] - excluded_low
+
         val = self._rand_func(RAND_MAX)
         pos = float(val) / float(RAND_MAX)
 
-        chosen_weight = max_weight * pos
+        chosen_weight = (max_weight - excluded_weight) * pos
+        if excluded >= 0 and chosen_weight >= excluded_low:
+            chosen_weight += excluded_weight
 
-        for i in range(len(weights)):  # pylint: disable=consider-using-enumerate
-            if weights[i] > chosen_weight:
-                self._chosen_server = remaining[i]
-                return ok
+        # the first index with accumulated weight > chosen weight
+        i = bisect.bisect_right(weights, chosen_weight)
+        if i == excluded:
+            i += 1
 
-        self._chosen_server = remaining[-1]
-        return ok
+        last = len(weights) - 1
+        if i > last:
+            return last - 1 if excluded == last else last
+        return i
 
     def set_failed_server(self, server_id: int) -> None:
         """Implement the Selector.set_failed_server()."""
         if server_id in self._failed_servers:
             return
         self._failed_servers.add(server_id)
-        self._conf.stats.notify_server_failed(server_id)
+
+        conf = self._conf
+        conf.stats.notify_server_failed(server_id)
+        # other selectors also skip the server, until the stats are updated
+        conf.add_failed(server_id, conf.stats.generation())
         self.reset()
 
-    def select_server(self, _: str) -> Tuple[int, bool]:
+    def _select_by_key(self, key: str) -> Tuple[int, bool]:
+        """Weighted rendezvous hashing, a key is read from the same replica while it is healthy."""
+        chosen = self._chosen_keys.get(key)
+        if chosen is not None:
+            return chosen
+
+        table = self._table
+        if table is None:
+            table = self._load_table()
+            self._table = table
+
+        h = key_hash(key)
+        best = 0
+        best_score = -1.0
+        for i, seed in enumerate(table.seeds):
+            # uniform in (0, 1)
+            u = ((mix64(h ^ seed) >> 11) + 0.5) / _FLOAT_53
+            score = table.shares[i] / -math.log(u)
+            if score > best_score:
+                best = i
+                best_score = score
+
+        chosen = table.remaining[best], table.ok
+        self._chosen_keys[key] = chosen
+        return chosen
+
+    def select_server(self, key: str) -> Tuple[int, bool]:
         """Implement the Selector.select_server()."""
+        if self._conf.key_affinity:
+            return self._select_by_key(key)
+
         if self._chosen_server:
             return self._chosen_server, True
 
@@ -96,9 +183,10 @@ class ReplicatedSelector:
         """Implement the Selector.select_servers_for_delete()."""
         self.select_server(key)
 
+        table = self._load_table()
         result: List[int] = []
-        for server_id in self._conf.servers:
-            if server_id in self._failed_servers:
+        for server_id, usage in zip(self._conf.servers, table.usages):
+            if usage is None:
                 continue
             result.append(server_id)
         return result
@@ -106,6 +194,8 @@ class ReplicatedSelector:
     def reset(self) -> None:
         """Implement the Selector.reset()."""
         self._chosen_server = None
+        self._table = None
+        self._chosen_keys = {}
 
 
 RAND_MAX = 1_000_000
@@ -119,35 +209,142 @@ def default_rand_func_factory() -> RandFunc:
     return r.randrange
 
 
+_FLOAT_53 = float(1 << 53)
+
+
+class _WeightTable:  # pylint: disable=too-few-public-methods
+    """Immutable snapshot of accumulated weights of non-failed servers."""
+    __slots__ = ('key', 'usages', 'remaining', 'shares', 'weights', 'seeds', 'ok')
+
+    key: Optional[Tuple[int, int]]  # stats generation, failed version, None if not shared
+    usages: Tuple[Optional[float], ...]  # of all servers, None if failed
+    remaining: Tuple[int, ...]
+    shares: Tuple[float, ...]
+    weights: Tuple[float, ...]  # accumulated
+    seeds: Tuple[int, ...]  # for rendezvous hashing
+    ok: bool
+
+    def __init__(
+            self, servers: List[int], usages: List[Optional[float]], min_percent: float,
+            key: Optional[Tuple[int, int]] = None,
+    ):
+        self.key = key
+        self.usages = tuple(usages)
+
+        remaining: List[int] = []
+        weights: List[float] = []
+        for server_id, usage in zip(servers, usages):
+            if usage is not None:
+                remaining.append(server_id)
+                weights.append(usage)
+
+        self.ok = True
+        if len(remaining) == 0:
+            remaining = servers
+            weights = [1.0] * len(remaining)
+            self.ok = False
+
+        if all(w < 1.0 for w in weights):
+            for i in range(len(weights)):  # pylint: disable=consider-using-enumerate
+                weights[i] = 1.0
+
+        _recompute_weights_with_min_percent(weights, min_percent)
+        self.shares = tuple(weights)
+
+        # accumulate
+        for i in range(1, len(weights)):
+            weights[i] = weights[i - 1] + weights[i]
+
+        self.remaining = tuple(remaining)
+        self.weights = tuple(weights)
+        self.seeds = tuple(server_seed(server_id) for server_id in remaining)
+
+
+class _FailedServers:  # pylint: disable=too-few-public-methods
+    """Immutable snapshot of servers set failed by selectors since the stats generation."""
+    __slots__ = ('generation', 'version', 'servers')
+
+    generation: int
+    version: int
+    servers: FrozenSet[int]
+
+    def __init__(self, generation: int, version: int, servers: FrozenSet[int]):
+        self.generation = generation
+        self.version = version
+        self.servers = servers
+
+
 @dataclass
-class _RouteConfig:
+class _RouteConfig:  # pylint: disable=too-many-instance-attributes
     servers: List[int]
     stats: Stats
     rand: RandomFactory
     min_percent: float
+    latency: Optional[ServerLatency] = None
+    latency_threshold: float = 0.0
+    key_affinity: bool = False
+    table: Optional[_WeightTable] = None
+    failed: _FailedServers = field(default_factory=lambda: _FailedServers(0, 0, frozenset()))
+    failed_mut: threading.Lock = field(default_factory=threading.Lock)
+
+    def add_failed(self, server_id: int, generation: int) -> None:
+        """Add a server failed at the stats generation."""
+        with self.failed_mut:
+            failed = self.failed
+            servers = failed.servers if failed.generation == generation else frozenset()
+            self.failed = _FailedServers(generation, failed.version + 1, servers | {server_id})
+
+    def clear_failed(self, failed: _FailedServers) -> _FailedServers:
+        """Clear the failed servers if not changed, returns the current snapshot."""
+        with self.failed_mut:
+            if self.failed is failed:
+                self.failed = _FailedServers(failed.generation, failed.version + 1, frozenset())
+            return self.failed
 
 
 # pylint: disable=too-few-public-methods
 class ReplicatedRoute:
-    """An implementation of Route Protocol that deals with replication."""
+    """
+    An implementation of Route Protocol that deals with replication.
+    Replicas are chosen randomly with weights by memory usage. With latency,
+    two replicas are chosen that way and the other one is used only if its latency score
+    is lower by more than the threshold.
+    With key affinity, each key is read from the replica chosen by weighted rendezvous hashing,
+    so replicas cache fewer keys.
+    """
 
     __slots__ = ('_conf',)
 
     _conf: _RouteConfig
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
             self, server_ids: List[int], stats: Stats,
             rand: RandomFactory = default_rand_func_factory,
             min_percent: float = 1.0,
+            latency: Optional[ServerLatency] = None,
+            key_affinity: bool = False,
+            latency_threshold: float = 0.3,
     ):
+        """
+        :param latency: observed by ProxyCacheClient constructed with the same object
+        :param latency_threshold: in [0, 1), the fraction by which the score of the other replica
+            must be lower to replace the replica chosen by weights
+        :param key_affinity: choose replicas by keys instead of randomly once per stage,
+            falling back to other replicas when the chosen one fails. Latency is not used
+        """
         if len(server_ids) == 0:
             raise ValueError("server_ids must not be empty")
+        if not 0.0 <= latency_threshold < 1.0:
+            raise ValueError("latency_threshold must be in [0, 1)")
 
         self._conf = _RouteConfig(
             servers=server_ids,
             stats=stats,
             rand=rand,
             min_percent=min_percent,
+            latency=latency,
+            latency_threshold=latency_threshold,
+            key_affinity=key_affinity,
         )
 
     def new_selector(self) -> Selector:
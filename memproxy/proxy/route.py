@@ -25,6 +25,13 @@ class Stats(Protocol):
         Notify server for fast detecting failed servers.
         """
 
+    @abstractmethod
+    def generation(self) -> int:
+        """
+        :return: a number that changes whenever the results of get_mem_usage() may have changed,
+            for caching values computed from them
+        """
+
 
 class Selector(Protocol):
     """A Protocol for selecting cache servers to get & delete."""
@@ -0,0 +1,150 @@
+"""
+Implementation of Route and Selector Protocol that shards keys over servers.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Set, Tuple
+
+from .hashing import mix64, key_hash, server_seed
+from .replicated import RandFunc, RandomFactory, default_rand_func_factory
+from .route import Selector, Stats
+
+
+class _ShardedConfig:  # pylint: disable=too-few-public-methods
+    __slots__ = ('servers', 'seeds', 'stats', 'rand', 'replicas')
+
+    servers: List[int]
+    seeds: List[int]
+    stats: Stats
+    rand: RandomFactory
+    replicas: int
+
+    def __init__(self, servers: List[int], stats: Stats, rand: RandomFactory, replicas: int):
+        self.servers = servers
+        self.seeds = [server_seed(server_id) for server_id in servers]
+        self.stats = stats
+        self.rand = rand
+        self.replicas = replicas
+
+    def replicas_of(self, key: str) -> List[int]:
+        """Rendezvous hashing, returns servers with the highest scores for the key."""
+        h = key_hash(key)
+        scores = [
+            (mix64(h ^ seed), server_id) for seed, server_id in zip(self.seeds, self.servers)
+        ]
+        if self.replicas == 1:
+            return [max(scores)[1]]
+        scores.sort(reverse=True)
+        return [server_id for _, server_id in scores[:self.replicas]]
+
+
+class ShardedSelector:
+    """Implement Selector Protocol that selects servers by the hash of keys."""
+
+    __slots__ = '_conf', '_chosen', '_checked', '_failed_servers', '_rand_func'
+
+    _conf: _ShardedConfig
+
+    _chosen: Dict[str, Tuple[int, bool]]
+    _checked: Set[int]
+    _failed_servers: Set[int]
+    _rand_func: RandFunc
+
+    def __init__(self, conf: _ShardedConfig):
+        self._conf = conf
+        self._chosen = {}
+        self._checked = set()
+        self._failed_servers = set()
+        self._rand_func = conf.rand()
+
+    def _is_failed(self, server_id: int) -> bool:
+        if server_id in self._failed_servers:
+            return True
+        if server_id in self._checked:
+            return False
+
+        self._checked.add(server_id)
+        if self._conf.stats.get_mem_usage(server_id) is None:
+            self._failed_servers.add(server_id)
+            return True
+        return False
+
+    def set_failed_server(self, server_id: int) -> None:
+        """Implement the Selector.set_failed_server()."""
+        if server_id not in self._failed_servers:
+            self._failed_servers.add(server_id)
+            self._conf.stats.notify_server_failed(server_id)
+            self.reset()
+
+    def select_server(self, key: str) -> Tuple[int, bool]:
+        """
+        Implement the Selector.select_server().
+        A key is read from a random non-failed replica of its shard,
+        the same server is returned for the key until reset() is called.
+        """
+        chosen = self._chosen.get(key)
+        if chosen is not None:
+            return chosen
+
+        replicas = self._conf.replicas_of(key)
+        remaining = [server_id for server_id in replicas if not self._is_failed(server_id)]
+
+        if len(remaining) == 0:
+            chosen = replicas[0], False
+        elif len(remaining) == 1:
+            chosen = remaining[0], True
+        else:
+            chosen = remaining[self._rand_func(len(remaining))], True
+
+        self._chosen[key] = chosen
+        return chosen
+
+    def select_servers_for_delete(self, key: str) -> List[int]:
+        """Implement the Selector.select_servers_for_delete(), non-failed replicas of the key."""
+        return [
+            server_id for server_id in self._conf.replicas_of(key)
+            if not self._is_failed(server_id)
+        ]
+
+    def reset(self) -> None:
+        """Implement the Selector.reset()."""
+        self._chosen = {}
+        self._checked = set()
+
+
+# pylint: disable=too-few-public-methods
+class ShardedRoute:
+    """
+    An implementation of Route Protocol that shards keys over servers using rendezvous hashing.
+    Each key is stored on `replicas` servers, adding or removing a server
+    only moves about 1/N of the keys.
+    """
+
+    __slots__ = ('_conf',)
+
+    _conf: _ShardedConfig
+
+    def __init__(
+            self, server_ids: List[int], stats: Stats,
+            replicas: int = 1,
+            rand: RandomFactory = default_rand_func_factory,
+    ):
+        if len(server_ids) == 0:
+            raise ValueError("server_ids must not be empty")
+        if replicas <= 0 or replicas > len(server_ids):
+            raise ValueError("replicas must be between 1 and the number of servers")
+
+        self._conf = _ShardedConfig(
+            servers=server_ids,
+            stats=stats,
+            rand=rand,
+            replicas=replicas,
+        )
+
+    def new_selector(self) -> Selector:
+        """Create a Selector for sharding."""
+        return ShardedSelector(conf=self._conf)
+
+    def replicas_of(self, key: str) -> List[int]:
+        """Returns the servers storing the key, mostly for testing purpose."""
+        return self._conf.replicas_of(key)
@@ -0,0 +1,293 @@
+"""
+Sharing RAM usage of cache servers between processes on the same host.
+One process polls the servers and publishes the results into a memory mapped file.
+"""
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+
+from .stats import ServerStats, StatsScheduler, MemLogger, _empty_logger
+
+_MAGIC = b'MPSTS001'
+
+# magic, number of servers
+_HEADER = struct.Struct('<8sI')
+_HEADER_SIZE = 64
+# incremented by the leader after each publish
+_GENERATION = struct.Struct('<Q')
+_GENERATION_OFFSET = 16
+
+# server id, seq, RAM usage, status, updated at, notify counter
+# seq is odd while the slot is being written by the leader
+_SLOT = struct.Struct('<qQdIdQ')
+_SLOT_SIZE = 64
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 8
+# seq, RAM usage, status, updated at, written only by the leader
+_DATA = struct.Struct('<QdId')
+_NOTIFY = struct.Struct('<Q')
+_NOTIFY_OFFSET = 36
+
+_STATUS_UNKNOWN = 0
+_STATUS_OK = 1
+_STATUS_FAILED = 2
+
+_READ_RETRIES = 4
+
+# published data becomes stale without any write, the generation also changes every interval
+_STALE_CHECK_INTERVAL = 1.0
+
+
+class SharedStats:  # pylint: disable=too-many-instance-attributes
+    """
+    Implement Stats Protocol, sharing the results of ServerStats between processes.
+    The process holding the lock of the file is the leader, it runs ServerStats and publishes
+    RAM usage of servers into the file. Other processes only read the file.
+    A background thread tries to take the lock every election_interval seconds,
+    so when the leader exits, another process takes over without blocking callers.
+    Servers are considered failed until the first results are published.
+    Data not published for stale_after seconds, e.g. by a hung leader, is considered failed.
+    Objects must be created after forking, the file lock is shared with forked processes.
+    """
+
+    __slots__ = (
+        '_clients', '_kwargs', '_election_interval', '_watch_interval', '_stale_after',
+        '_fd', '_mm', '_offsets', '_mut', '_publish_mut',
+        '_stats', '_closed', '_thread',
+    )
+
+    _clients: Dict[int, redis.Redis]
+    _kwargs: dict
+    _election_interval: float
+    _watch_interval: float
+    _stale_after: float
+
+    _fd: int
+    _mm: mmap.mmap
+    _offsets: Dict[int, int]
+    _mut: threading.Lock
+    _publish_mut: threading.Lock
+
+    _stats: Optional[ServerStats]
+    _closed: threading.Event
+    _thread: threading.Thread
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, clients: Dict[int, redis.Redis], path: str,
+            sleep_min: int = 150, sleep_max: int = 300,
+            mem_logger: MemLogger = _empty_logger,
+            timeout: float = 1.0,
+            scheduler: Optional[StatsScheduler] = None,
+            election_interval: float = 1.0,
+            watch_interval: float = 0.2,
+            stale_after: Optional[float] = None,
+    ):
+        """
+        :param path: file shared by processes of the host, e.g. under /dev/shm.
+            All processes must use the same server ids
+        :param election_interval: seconds between tries of becoming the leader
+        :param watch_interval: seconds between checks of servers notified failed by other processes
+        :param stale_after: RAM usage published longer ago than this (in seconds) is considered
+            failed, default is 2 * sleep_max + timeout
+        """
+        self._clients = clients
+        self._kwargs = {
+            'sleep_min': sleep_min,
+            'sleep_max': sleep_max,
+            'mem_logger': mem_logger,
+            'timeout': timeout,
+            'scheduler': scheduler,
+        }
+        self._election_interval = election_interval
+        self._watch_interval = watch_interval
+        if stale_after is None:
+            stale_after = 2 * sleep_max + timeout
+        self._stale_after = stale_after
+
+        servers = sorted(clients)
+        self._offsets = {
+            server_id: _HEADER_SIZE + i * _SLOT_SIZE for i, server_id in enumerate(servers)
+        }
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._mm = self._init_mapping(servers)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+        self._mut = threading.Lock()
+        self._publish_mut = threading.Lock()
+        self._stats = None
+        self._closed = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _init_mapping(self, servers: List[int]) -> mmap.mmap:
+        size = _HEADER_SIZE + len(servers) * _SLOT_SIZE
+
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, 0)
+        try:
+            file_size = os.fstat(self._fd).st_size
+            if file_size not in (0, size):
+                raise ValueError("Shared stats file was created with different servers")
+            if file_size == 0:
+                os.ftruncate(self._fd, size)
+
+            mm = mmap.mmap(self._fd, size)
+            if file_size == 0:
+                _HEADER.pack_into(mm, 0, _MAGIC, len(servers))
+                for server_id, offset in self._offsets.items():
+                    _SLOT.pack_into(mm, offset, server_id, 0, 0.0, _STATUS_UNKNOWN, 0.0, 0)
+                return mm
+
+            magic, num_servers = _HEADER.unpack_from(mm, 0)
+            ids = [_SLOT.unpack_from(mm, offset)[0] for offset in self._offsets.values()]
+            if magic != _MAGIC or num_servers != len(servers) or ids != list(self._offsets):
+                mm.close()
+                raise ValueError("Shared stats file was created with different servers")
+            return mm
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+
+    @property
+    def is_leader(self) -> bool:
+        """Whether this object polls the servers."""
+        return self._stats is not None
+
+    def _try_lead(self) -> None:
+        """Called by the background thread, becomes the leader if the file lock is free."""
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+
+        # the initial probe is not done under the mutex, closing is not blocked by it
+        stats = ServerStats(self._clients, on_update=self._publish, **self._kwargs)
+        for server_id in self._offsets:
+            self._publish(server_id, stats.get_mem_usage(server_id))
+
+        with self._mut:
+            if not self._closed.is_set():
+                self._stats = stats
+                return
+        stats.shutdown()
+
+    def _publish(self, server_id: int, mem: Optional[float]) -> None:
+        offset = self._offsets[server_id] + _SEQ_OFFSET
+        mm = self._mm
+        status = _STATUS_FAILED if mem is None else _STATUS_OK
+
+        # called by both the probe and the scheduler threads, the seqlock needs a single writer
+        with self._publish_mut:
+            if self._closed.is_set():
+                # a poll finished after closing, the file may be unmapped
+                return
+
+            seq = _SEQ.unpack_from(mm, offset)[0] + 1
+            _SEQ.pack_into(mm, offset, seq)
+
+            _DATA.pack_into(mm, offset, seq, mem or 0.0, status, time.time())
+
+            # readers only accept the slot after seq becomes even again
+            _SEQ.pack_into(mm, offset, seq + 1)
+
+            published = _GENERATION.unpack_from(mm, _GENERATION_OFFSET)[0]
+            _GENERATION.pack_into(mm, _GENERATION_OFFSET, published + 1)
+
+    def _read(self, server_id: int) -> Optional[float]:
+        offset = self._offsets[server_id]
+        mm = self._mm
+
+        mem = 0.0
+        status = _STATUS_UNKNOWN
+        updated_at = 0.0
+        for _ in range(_READ_RETRIES):
+            _, seq, mem, status, updated_at, _ = _SLOT.unpack_from(mm, offset)
+            if seq & 1:
+                continue
+            if _SEQ.unpack_from(mm, offset + _SEQ_OFFSET)[0] == seq:
+                break
+
+        if status != _STATUS_OK:
+            # failed or not yet published
+            return None
+        if time.time() - updated_at > self._stale_after:
+            # the leader is hung
+            return None
+        return mem
+
+    def _run(self) -> None:
+        """Try to become the leader until succeeded, then watch the failed notifications."""
+        self._try_lead()
+        while self._stats is None:
+            if self._closed.wait(self._election_interval):
+                return
+            self._try_lead()
+        self._watch()
+
+    def _watch(self) -> None:
+        """Poll servers notified failed by other processes."""
+        counters = {server_id: self._notify_count(server_id) for server_id in self._offsets}
+        while not self._closed.wait(self._watch_interval):
+            stats = self._stats
+            if stats is None:
+                return
+            for server_id in self._offsets:
+                count = self._notify_count(server_id)
+                if count != counters[server_id]:
+                    counters[server_id] = count
+                    stats.notify_server_failed(server_id)
+
+    def _notify_count(self, server_id: int) -> int:
+        return _NOTIFY.unpack_from(self._mm, self._offsets[server_id] + _NOTIFY_OFFSET)[0]
+
+    def get_mem_usage(self, server_id: int) -> Optional[float]:
+        """Get RAM usage in bytes, published by the leader."""
+        return self._read(server_id)
+
+    def generation(self) -> int:
+        """Changes after each publish of the leader and every _STALE_CHECK_INTERVAL seconds."""
+        published = _GENERATION.unpack_from(self._mm, _GENERATION_OFFSET)[0]
+        tick = int(time.time() / _STALE_CHECK_INTERVAL) & 0xffffffff
+        return published << 32 | tick
+
+    def notify_server_failed(self, server_id: int) -> None:
+        """Notify a server id has been returning errors, the leader will poll it."""
+        stats = self._stats
+        if stats is not None:
+            stats.notify_server_failed(server_id)
+            return
+
+        offset = self._offsets[server_id] + _NOTIFY_OFFSET
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _NOTIFY.size, offset)
+        try:
+            _NOTIFY.pack_into(self._mm, offset, self._notify_count(server_id) + 1)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _NOTIFY.size, offset)
+
+    def close(self) -> None:
+        """Stop polling if this is the leader, another process will take over."""
+        with self._mut:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            stats = self._stats
+            self._stats = None
+
+        if stats is not None:
+            stats.shutdown()
+        self._thread.join()
+
+        with self._publish_mut:
+            self._mm.close()
+        os.close(self._fd)
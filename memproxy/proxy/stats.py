@@ -2,18 +2,48 @@
 Implementation of ServerStats.
 Get RAM usage of cache servers to do load-balancing.
 """
+import heapq
 import logging
+import os
 import random
 import threading
 import time
-from typing import Optional, Dict, List, Set, Callable
+from concurrent.futures import Future, wait
+from typing import Optional, Dict, List, Set, Callable, Tuple, Hashable
 
 import redis
 
 MemLogger = Callable[[int, float], None]
+UpdateFunc = Callable[[int, Optional[float]], None]  # server id, RAM usage or None if failed
 
 
-class _ServerState:
+class _Subscription:  # pylint: disable=too-few-public-methods
+    """A server of a ServerStats object."""
+    __slots__ = ('server_id', 'mem_logger', 'sleep_min', 'sleep_max', 'timeout', 'on_update')
+
+    server_id: int
+    mem_logger: MemLogger
+    sleep_min: int
+    sleep_max: int
+    timeout: float
+    on_update: Optional[UpdateFunc]
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, server_id: int, mem_logger: MemLogger,
+            sleep_min: int, sleep_max: int, timeout: float,
+            on_update: Optional[UpdateFunc] = None,
+    ):
+        self.server_id = server_id
+        self.mem_logger = mem_logger
+        self.sleep_min = sleep_min
+        self.sleep_max = sleep_max
+        self.timeout = timeout
+        self.on_update = on_update
+
+
+class _ServerState:  # pylint: disable=too-many-instance-attributes
+    """State of a server address, shared by all ServerStats objects using that address."""
+    address: Hashable
     client: redis.Redis
 
     next_wake_up: float
@@ -23,161 +53,368 @@ class _ServerState:
 
     mem: Optional[float]
 
-    def __init__(self, r: redis.Redis):
+    mut: threading.Lock
+    probing: bool
+    probed: threading.Event  # set when the first probe is finished or timed out
+    subs: Dict[int, _Subscription]
+
+    def __init__(self, address: Hashable, r: redis.Redis):
+        self.address = address
         self.client = r
 
+        self.next_wake_up = 0.0
         self.notified = False
 
         self.error = None
-        self.mem = 0
+        # unknown until the first probe is finished, considered failed
+        self.mem = None
+
+        self.mut = threading.Lock()
+        self.probing = False
+        self.probed = threading.Event()
+        self.subs = {}
+
+    def timeout(self) -> float:
+        """The smallest timeout of subscriptions."""
+        return min((sub.timeout for sub in list(self.subs.values())), default=1.0)
+
+    def compute_next_wake_up(self):
+        """next wake time point for sleeping, using the shortest sleep range of subscriptions."""
+        subs = list(self.subs.values())
+        sleep_min = min(sub.sleep_min for sub in subs)
+        sleep_max = min(sub.sleep_max for sub in subs)
 
-    def compute_next_wake_up(self, sleep_min: int, sleep_max: int):
-        """next wake time point for sleeping."""
         rand = random.Random(time.time_ns())
-        d = rand.randint(sleep_min, sleep_max)
+        d = rand.randint(sleep_min, max(sleep_min, sleep_max))
         self.next_wake_up = time.time() + float(d)
 
-    def get_mem_usage(self, server_id, mem_logger: MemLogger):
+    def _notify_update(self, mem: Optional[float]):
+        for sub in list(self.subs.values()):
+            if sub.on_update is not None:
+                sub.on_update(sub.server_id, mem)
+
+    def get_mem_usage(self):
         """get RAM usage of cache servers."""
         try:
             usage = self.client.info('memory').get('used_memory')
+            with self.mut:
+                self.probing = False
+                if usage:
+                    self.mem = usage
+            self.probed.set()
             if usage:
-                self.mem = usage
-                mem_logger(server_id, usage)
+                for sub in list(self.subs.values()):
+                    sub.mem_logger(sub.server_id, usage)
+                self._notify_update(usage)
         except Exception as e:  # pylint: disable=broad-exception-caught
-            self.mem = None
-            self.error = str(e)
+            with self.mut:
+                self.probing = False
+                self.mem = None
+                self.error = str(e)
+            self.probed.set()
             logging.error('Server Stats error. %s', str(e))
+            self._notify_update(None)
 
+    def _run_probe(self, future: Future) -> None:
+        try:
+            self.get_mem_usage()
+        finally:
+            future.set_result(None)
+
+    def start_probe(self) -> Optional[Future]:
+        """
+        Get RAM usage on a new daemon thread, returns None if the previous probe is not finished.
+        A probe of a server not answering does not block the exit of the process.
+        """
+        with self.mut:
+            if self.probing:
+                return None
+            self.probing = True
+
+        future: Future = Future()
+        threading.Thread(
+            target=self._run_probe, args=(future,), daemon=True, name='memproxy-stats',
+        ).start()
+        return future
+
+    def set_timeout(self, timeout: float):
+        """Consider the server failed if the probe is not finished, it may still finish later."""
+        with self.mut:
+            if not self.probing:
+                return
+            self.mem = None
+            self.error = 'timeout'
+        self.probed.set()
+        logging.error('Server Stats error. Server %s timeout after %.3fs', self.address, timeout)
+        self._notify_update(None)
 
-def _empty_logger(_server_id: int, _mem: float):
-    pass
 
+def _address_of(r: redis.Redis) -> Hashable:
+    pool = getattr(r, 'connection_pool', None)
+    if pool is None:
+        return id(r)
+    kwargs = pool.connection_kwargs
+    return kwargs.get('host'), kwargs.get('port'), kwargs.get('path'), kwargs.get('db', 0)
 
-class ServerStats:  # pylint: disable=too-many-instance-attributes
-    """ServerStats periodic get RAM of cache servers for load-balancing."""
-    _servers: List[int]
-    _states: Dict[int, _ServerState]
 
-    _sleep_min: int
-    _sleep_max: int
-    _mem_logger: MemLogger
+class StatsScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+    A single thread scheduling polls of RAM usage of servers for many ServerStats objects.
+    Polls are ordered by a heap of wake up times, a server address used
+    by many ServerStats objects is only polled once.
+    Each poll runs on a daemon thread, at most one per server at a time.
+    """
+
+    __slots__ = (
+        '_pid', '_mut', '_cond', '_states', '_heap', '_notified',
+        '_seq', '_started', '_closed',
+    )
+
+    _pid: int
 
     _mut: threading.Lock
-    _notified: Set[int]
-    _closed: bool
     _cond: threading.Condition
 
-    _finished: threading.Semaphore
+    _states: Dict[Hashable, _ServerState]
+    _heap: List[Tuple[float, int, Hashable]]
+    _notified: Set[Hashable]
 
-    def __init__(
-            self, clients: Dict[int, redis.Redis],
-            sleep_min: int = 150, sleep_max: int = 300,
-            mem_logger: MemLogger = _empty_logger,
-    ):
-        self._sleep_min = sleep_min
-        self._sleep_max = sleep_max
-        self._mem_logger = mem_logger
+    _seq: int
+    _started: bool
+    _closed: bool
+
+    def __init__(self):
+        self._pid = os.getpid()
 
         self._mut = threading.Lock()
+        self._cond = threading.Condition(lock=self._mut)
+
+        self._states = {}
+        self._heap = []
         self._notified = set()
+
+        self._seq = 0
+        self._started = False
         self._closed = False
-        self._cond = threading.Condition(lock=self._mut)
 
-        self._finished = threading.Semaphore(value=0)
+    @property
+    def pid(self) -> int:
+        """The process creating this scheduler, the thread does not exist in forked processes."""
+        return self._pid
 
-        servers = list(clients)
-        servers.sort()
-        self._servers = servers
+    def _push(self, state: _ServerState) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (state.next_wake_up, self._seq, state.address))
 
-        self._states = {}
-        for server_id in self._servers:
-            r = clients[server_id]
-            state = _ServerState(r=r)
+    def subscribe(
+            self, r: redis.Redis, sub: _Subscription,
+    ) -> Tuple[_ServerState, int, bool]:
+        """Returns the shared state, the subscription id and whether the state is new."""
+        address = _address_of(r)
+        with self._mut:
+            if self._closed:
+                raise RuntimeError("stats scheduler is shut down")
 
-            self._states[server_id] = state
-            state.get_mem_usage(server_id, self._mem_logger)
-            state.compute_next_wake_up(sleep_min=self._sleep_min, sleep_max=self._sleep_max)
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._run, daemon=True).start()
 
-        threading.Thread(target=self._run, daemon=True).start()
+            self._seq += 1
+            sub_id = self._seq
 
-    def _find_min_wake_up(self) -> float:
-        first_server = self._servers[0]
+            state = self._states.get(address)
+            is_new = state is None
+            if state is None:
+                state = _ServerState(address=address, r=r)
+                self._states[address] = state
 
-        min_wake_up = self._states[first_server].next_wake_up
+            state.subs[sub_id] = sub
+            if is_new:
+                state.compute_next_wake_up()
+                self._push(state)
+                self._cond.notify()
 
-        for server_id in self._servers[1:]:
-            wake_up = self._states[server_id].next_wake_up
-            if wake_up < min_wake_up:
-                min_wake_up = wake_up
+            return state, sub_id, is_new
 
-        return min_wake_up
+    def unsubscribe(self, state: _ServerState, sub_id: int) -> None:
+        """Stop polling the server if no ServerStats objects are using it."""
+        with self._mut:
+            state.subs.pop(sub_id, None)
+            if len(state.subs) == 0 and self._states.get(state.address) is state:
+                del self._states[state.address]
 
-    def _notify_timeout(self) -> List[int]:
-        timeout_servers: List[int] = []
+    def notify(self, state: _ServerState) -> None:
+        """Poll the server as soon as possible, only once until its next periodic poll."""
+        with self._mut:
+            if state.notified:
+                return
+            state.notified = True
+            self._notified.add(state.address)
+            self._cond.notify()
+
+    def probe(self, states: List[_ServerState]) -> None:
+        """
+        Get RAM usage of servers concurrently,
+        waiting for each server at most the timeout of its subscriptions.
+        """
+        futures: List[Tuple[float, _ServerState, Future]] = []
+        for state in states:
+            future = state.start_probe()
+            if future is not None:
+                futures.append((state.timeout(), state, future))
+
+        start = time.monotonic()
+        futures.sort(key=lambda f: f[0])
+        for timeout, state, future in futures:
+            remaining = start + timeout - time.monotonic()
+            if remaining > 0:
+                wait([future], timeout=remaining)
+            if not future.done():
+                state.set_timeout(timeout)
+
+    def _pop_due(self) -> List[_ServerState]:
+        due: List[_ServerState] = []
 
         now = time.time()
-        for server_id in self._servers:
-            state = self._states[server_id]
-            if state.next_wake_up <= now:
-                state.notified = False
-                timeout_servers.append(server_id)
-
-        return timeout_servers
-
-    def _notify_servers(self, servers: List[int], is_timeout: bool):
-        for server_id in servers:
-            state = self._states.get(server_id)
-            if not state:
+        while self._heap and self._heap[0][0] <= now:
+            wake_up, _, address = heapq.heappop(self._heap)
+            state = self._states.get(address)
+            if state is None or state.next_wake_up != wake_up:
+                # unsubscribed or rescheduled
                 continue
 
-            if not is_timeout:
-                if state.notified:
-                    continue
-                state.notified = True
-
-            state.get_mem_usage(server_id, self._mem_logger)
-            state.compute_next_wake_up(sleep_min=self._sleep_min, sleep_max=self._sleep_max)
+            state.notified = False
+            state.compute_next_wake_up()
+            self._push(state)
+            due.append(state)
 
-    def _do_wait(self) -> List[int]:
-        min_wake_up = self._find_min_wake_up()
+        for address in self._notified:
+            state = self._states.get(address)
+            if state is not None and state not in due:
+                due.append(state)
+        self._notified.clear()
 
-        timeout = min_wake_up - time.time()
-        if timeout > 0:
-            self._cond.wait(timeout=timeout)
-
-        return self._notify_timeout()
+        return due
 
     def _run(self) -> None:
         while True:
-            timeout_servers: List[int] = []
             with self._mut:
-                while len(self._notified) == 0 and len(timeout_servers) == 0 and not self._closed:
-                    timeout_servers = self._do_wait()
+                due: List[_ServerState] = []
+                while not self._closed:
+                    due = self._pop_due()
+                    if due:
+                        break
+
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout=timeout)
 
                 if self._closed:
-                    self._finished.release()
                     return
 
-                notify_list = list(self._notified)
-                self._notified.clear()
+            self.probe(due)
+
+    def shutdown(self) -> None:
+        """Stop the scheduler thread, do not wait for polls of servers not answering."""
+        with self._mut:
+            self._closed = True
+            self._cond.notify()
+
+
+_default_mut = threading.Lock()
+_default_scheduler: Optional[StatsScheduler] = None  # pylint: disable=invalid-name
+
+
+def default_stats_scheduler() -> StatsScheduler:
+    """The scheduler shared by ServerStats objects of the current process."""
+    global _default_scheduler  # pylint: disable=global-statement
+    with _default_mut:
+        if _default_scheduler is None or _default_scheduler.pid != os.getpid():
+            _default_scheduler = StatsScheduler()
+        return _default_scheduler
+
+
+def _empty_logger(_server_id: int, _mem: float):
+    pass
+
+
+class ServerStats:
+    """
+    ServerStats periodic get RAM of cache servers for load-balancing.
+    Polling is done by a StatsScheduler, by default one thread shared by the whole process.
+    """
+    _scheduler: StatsScheduler
+    _states: Dict[int, _ServerState]
+    _sub_ids: Dict[int, int]
+    _on_update: Optional[UpdateFunc]
+    _generation: int
 
-            self._notify_servers(timeout_servers, True)
-            self._notify_servers(notify_list, False)
+    def __init__(  # pylint: disable=too-many-arguments
+            self, clients: Dict[int, redis.Redis],
+            sleep_min: int = 150, sleep_max: int = 300,
+            mem_logger: MemLogger = _empty_logger,
+            timeout: float = 1.0,
+            scheduler: Optional[StatsScheduler] = None,
+            on_update: Optional[UpdateFunc] = None,
+    ):
+        """
+        :param timeout: seconds to wait for getting RAM usage of servers, polled concurrently.
+            A server not answering in time is considered failed until it answers
+        :param scheduler: if None, use the scheduler shared by the current process
+        :param on_update: called on the polling threads after each poll of a server,
+            with the RAM usage or None if the server failed
+        """
+        self._scheduler = scheduler or default_stats_scheduler()
+
+        self._states = {}
+        self._sub_ids = {}
+        self._on_update = on_update
+        self._generation = 0
+
+        new_states: List[_ServerState] = []
+        probing_states: List[_ServerState] = []
+        for server_id in sorted(clients):
+            sub = _Subscription(
+                server_id=server_id, mem_logger=mem_logger,
+                sleep_min=sleep_min, sleep_max=sleep_max, timeout=timeout,
+                on_update=self._update,
+            )
+            state, sub_id, is_new = self._scheduler.subscribe(clients[server_id], sub)
+
+            self._states[server_id] = state
+            self._sub_ids[server_id] = sub_id
+            if is_new:
+                new_states.append(state)
+            elif not state.probed.is_set():
+                probing_states.append(state)
+
+        # servers already polled for other ServerStats objects are not polled again,
+        # only waiting for their first probes
+        self._scheduler.probe(new_states)
+        for state in probing_states:
+            state.probed.wait(timeout=timeout)
+
+    def _update(self, server_id: int, mem: Optional[float]) -> None:
+        # called after the state is updated, increments lost by concurrent calls don't matter,
+        # the generation still changes
+        self._generation += 1
+        if self._on_update is not None:
+            self._on_update(server_id, mem)
 
     def get_mem_usage(self, server_id: int) -> Optional[float]:
         """Get RAM usage in bytes."""
         return self._states[server_id].mem
 
+    def generation(self) -> int:
+        """Incremented after each poll of a server."""
+        return self._generation
+
     def notify_server_failed(self, server_id: int) -> None:
         """Notify a server id has been returning errors."""
-        with self._mut:
-            self._notified.add(server_id)
-            self._cond.notify()
+        state = self._states.get(server_id)
+        if state is not None:
+            self._scheduler.notify(state)
 
     def shutdown(self):
-        """Shutdown the server stats thread and wait for finishing."""
-        with self._mut:
-            self._closed = True
-            self._cond.notify()
-        self._finished.acquire()  # pylint: disable=consider-using-with
+        """Stop polling servers not used by other ServerStats objects."""
+        for server_id, state in self._states.items():
+            self._scheduler.unsubscribe(state, self._sub_ids[server_id])
@@ -3,12 +3,14 @@ Implementation of CacheClient using redis.
 """
 from __future__ import annotations
 
+import math
 import random
 import time
 from dataclasses import dataclass
-from typing import List, Optional, Union, Any
+from typing import List, Optional, Union, Any, Callable, Dict, Tuple, TypeVar, Generic, cast
 
 import redis
+from redis.exceptions import NoScriptError
 
 from .memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
 from .memproxy import LeaseGetResult
@@ -16,8 +18,14 @@ from .memproxy import LeaseSetStatus, DeleteStatus
 from .memproxy import Pipeline, Promise
 from .session import Session
 
+# With ARGV[1] = 'w' (lease wait mode), only the caller that creates the lease gets the cas,
+# other callers get 'wait:{cas}' until the key is set.
+# ARGV[i + 1] is the optional early refresh threshold (in milliseconds) of KEYS[i],
+# a value with a smaller remaining TTL is granted a refresh lease
+# by rewriting it to 'rfs:{cas}:{data}', other callers still see that value as 'val:{data}'.
 LEASE_GET_SCRIPT = """
 local result = {}
+local lease_wait = ARGV[1] == 'w'
 
 for i = 1,#KEYS do
     local k = KEYS[i]
@@ -25,7 +33,22 @@ for i = 1,#KEYS do
     local resp = redis.call('GET', k)
     
     if resp then
-        result[i] = resp
+        local prefix = string.sub(resp, 1, 4)
+        if prefix == 'val:' and ARGV[i + 1] then
+            local pttl = redis.call('PTTL', k)
+            if pttl > 0 and pttl < tonumber(ARGV[i + 1]) then
+                local cas = redis.call('INCR', '__next_cas')
+                resp = 'rfs:' .. cas .. ':' .. string.sub(resp, 5)
+                redis.call('SET', k, resp, 'PX', pttl)
+            end
+            result[i] = resp
+        elseif prefix == 'rfs:' then
+            result[i] = 'val:' .. string.sub(resp, string.find(resp, ':', 5, true) + 1)
+        elseif lease_wait and prefix == 'cas:' then
+            result[i] = 'wait:' .. string.sub(resp, 5)
+        else
+            result[i] = resp
+        end
     else
         local cas = redis.call('INCR', '__next_cas')
         local cas_str = 'cas:' .. cas
@@ -46,12 +69,13 @@ for i = 1,#KEYS do
     local resp = redis.call('GET', k)
     
     local cas_str = 'cas:' .. ARGV[i * 3 - 2]
+    local refresh_str = 'rfs:' .. ARGV[i * 3 - 2] .. ':'
     local val = 'val:' .. ARGV[i * 3 - 1]
     local ttl = ARGV[i * 3]
     
     if not resp then
         result[i] = 'NF'
-    elseif resp ~= cas_str then
+    elseif resp ~= cas_str and string.sub(resp, 1, #refresh_str) ~= refresh_str then
         result[i] = 'EX'
     else
         redis.call('SET', k, val, 'EX', ttl)
@@ -72,50 +96,134 @@ class SetInput:
     ttl: int
 
 
-class RedisPipelineState:  # pylint: disable=too-many-instance-attributes
+class PipelineStateBase:  # pylint: disable=too-many-instance-attributes
     """
-    State between pipeline stages.
-    A pipeline stage is a duration start with collecting operations, e.g. lease get/set,
-    then finish by executing it.
+    Operations of a pipeline stage and their results,
+    shared by the pipelines of redis, redis cluster and redis.asyncio.
     """
 
-    __slots__ = ('_pipe', 'completed', 'keys', 'get_result', '_set_inputs',
-                 'set_result', '_delete_keys', 'delete_result', 'redis_error')
+    __slots__ = ('completed', 'keys', 'get_result', 'set_inputs', 'set_result',
+                 'delete_keys', 'delete_result', 'redis_error')
 
-    _pipe: RedisPipeline
     completed: bool
 
     keys: List[str]
     get_result: List[bytes]
 
-    _set_inputs: List[SetInput]
+    set_inputs: List[SetInput]
     set_result: List[bytes]
 
-    _delete_keys: List[str]
+    delete_keys: List[str]
     delete_result: List[int]
 
+    # the error of the whole stage
     redis_error: Optional[str]
 
-    def __init__(self, pipe: RedisPipeline):
-        self._pipe = pipe
+    def __init__(self):
         self.completed = False
 
         self.keys = []
-        self._set_inputs = []
-        self._delete_keys = []
+        self.set_inputs = []
+        self.delete_keys = []
 
         self.redis_error = None
 
+    def add_get_op(self, key: str) -> int:
+        """Add lease get operation, returns its index."""
+        self.keys.append(key)
+        return len(self.keys) - 1
+
     def add_set_op(self, key: str, cas: int, val: bytes, ttl: int) -> int:
         """Add set key operation."""
-        index = len(self._set_inputs)
-        self._set_inputs.append(SetInput(key=key, cas=cas, val=val, ttl=ttl))
+        index = len(self.set_inputs)
+        self.set_inputs.append(SetInput(key=key, cas=cas, val=val, ttl=ttl))
         return index
 
     def add_delete_op(self, key: str) -> int:
         """Add delete operation."""
-        index = len(self._delete_keys)
-        self._delete_keys.append(key)
+        index = len(self.delete_keys)
+        self.delete_keys.append(key)
+        return index
+
+    def get_error(self, _index: int) -> Optional[str]:
+        """The error of the lease get operation at the index, None if succeeded."""
+        return self.redis_error
+
+    def set_error(self, _index: int) -> Optional[str]:
+        """The error of the lease set operation at the index, None if succeeded."""
+        return self.redis_error
+
+    def delete_error(self, _index: int) -> Optional[str]:
+        """The error of the delete operation at the index, None if succeeded."""
+        return self.redis_error
+
+    def lease_get_response(self, index: int) -> LeaseGetResponse:
+        """The response of the lease get operation at the index, after executed."""
+        error = self.get_error(index)
+        if error is not None:
+            return 3, b'', 0, f'Redis Get: {error}'
+
+        return parse_lease_get_resp(self.get_result[index])
+
+    def lease_set_response(self, index: int) -> LeaseSetResponse:
+        """The response of the lease set operation at the index, after executed."""
+        error = self.set_error(index)
+        if error is not None:
+            return LeaseSetResponse(
+                status=LeaseSetStatus.ERROR,
+                error=f'Redis Set: {error}'
+            )
+
+        return parse_lease_set_resp(self.set_result[index])
+
+    def delete_response(self, index: int) -> DeleteResponse:
+        """The response of the delete operation at the index, after executed."""
+        error = self.delete_error(index)
+        if error is not None:
+            return DeleteResponse(
+                status=DeleteStatus.ERROR,
+                error=f'Redis Delete: {error}'
+            )
+
+        resp = self.delete_result[index]
+        status = DeleteStatus.OK if resp == 1 else DeleteStatus.NOT_FOUND
+        return DeleteResponse(status=status)
+
+
+class SyncPipelineStateBase(PipelineStateBase):  # pylint: disable=too-many-instance-attributes
+    """The state of a stage executed synchronously."""
+
+    __slots__ = ()
+
+    def execute(self) -> None:
+        """Execute collected operations."""
+        raise NotImplementedError
+
+
+class RedisPipelineState(SyncPipelineStateBase):
+    """
+    State between pipeline stages.
+    A pipeline stage is a duration start with collecting operations, e.g. lease get/set,
+    then finish by executing it.
+    """
+
+    __slots__ = ('_pipe', 'key_index')
+
+    _pipe: RedisPipeline
+    key_index: Dict[str, int]
+
+    def __init__(self, pipe: RedisPipeline):
+        super().__init__()
+        self._pipe = pipe
+        self.key_index = {}
+
+    def add_get_op(self, key: str) -> int:
+        """Add lease get operation, the same key is only fetched once per stage."""
+        index = self.key_index.get(key)
+        if index is None:
+            index = len(self.keys)
+            self.keys.append(key)
+            self.key_index[key] = index
         return index
 
     def execute(self) -> None:
@@ -126,219 +234,372 @@ class RedisPipelineState:  # pylint: disable=too-many-instance-attributes
             self.redis_error = str(e)
 
     def _execute_in_try(self) -> None:
-        if len(self.keys) > 0:
-            self._execute_lease_get()
+        batch_size = self._pipe.max_keys_per_batch
 
-        if len(self._set_inputs) > 0:
-            self._execute_lease_set()
+        commands: List[_Command] = []
+        for n in range(0, len(self.keys), batch_size):
+            keys = self.keys[n: n + batch_size]
+            if self._pipe.mget_first:
+                commands.append(_mget_command(keys))
+            else:
+                commands.append(self._get_script_command(keys))
+        num_gets = len(commands)
 
-        if len(self._delete_keys) > 0:
-            with self._pipe.client.pipeline(transaction=False) as pipe:
-                for key in self._delete_keys:
-                    pipe.delete(key)
-                self.delete_result = pipe.execute()
+        for n in range(0, len(self.set_inputs), batch_size):
+            inputs = self.set_inputs[n: n + batch_size]
+            keys = [i.key for i in inputs]
+            commands.append(_script_command(self._pipe.set_script, keys, lease_set_args(inputs)))
+        num_sets = len(commands) - num_gets
+
+        for key in self.delete_keys:
+            commands.append(_delete_command(key))
+
+        results = self._run_commands(commands)
+
+        self.get_result = []
+        for r in results[:num_gets]:
+            self.get_result.extend(r)
+
+        self.set_result = []
+        for r in results[num_gets:num_gets + num_sets]:
+            self.set_result.extend(r)
+
+        self.delete_result = results[num_gets + num_sets:]
+
+        if self._pipe.mget_first:
+            self._execute_mget_misses()
 
         self.completed = True
 
-    def _execute_lease_get(self) -> None:
+    def _run_commands(self, commands: List[_Command]) -> List[Any]:
+        """
+        Send all commands of a stage in one round trip.
+        Scripts are called by EVALSHA inside the pipeline,
+        they are only loaded and resent if the server responds with NOSCRIPT.
+        """
+        client = self._pipe.client
+
+        if len(commands) == 1:
+            return [commands[0](client)]
+
+        if not self._pipe.script_state.loaded:
+            self._load_scripts()
+
+        results = _execute_pipeline(client, commands)
+
+        no_script_indices = [i for i, r in enumerate(results) if isinstance(r, NoScriptError)]
+        if len(no_script_indices) > 0:
+            # scripts were flushed since loaded, the retried commands are executed
+            # after the other commands of this stage
+            self._load_scripts()
+            retry_results = _execute_pipeline(client, [commands[i] for i in no_script_indices])
+            for i, r in zip(no_script_indices, retry_results):
+                results[i] = r
+
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+
+        return results
+
+    def _get_script_command(self, keys: List[str]) -> _Command:
+        lease_wait_arg = b'w' if self._pipe.lease_wait else b'-'
+
+        if self._pipe.early_refresh_delta > 0:
+            args: List[Any] = [lease_wait_arg]
+            args.extend(self._pipe.early_refresh_threshold() for _ in keys)
+            return _script_command(self._pipe.get_script, keys, args)
+
+        if self._pipe.lease_wait:
+            return _script_command(self._pipe.get_script, keys, [lease_wait_arg])
+        return _script_command(self._pipe.get_script, keys)
+
+    def _load_scripts(self) -> None:
+        scripts = [
+            script for script in (self._pipe.get_script, self._pipe.set_script)
+            if getattr(script, 'sha', None) is not None
+        ]
+        if len(scripts) > 0:
+            with self._pipe.client.pipeline(transaction=False) as pipe:
+                for script in scripts:
+                    pipe.script_load(script.script)
+                pipe.execute()
+        self._pipe.script_state.loaded = True
+
+    def _execute_mget_misses(self) -> None:
+        """
+        Hits are served by a plain MGET, which is much cheaper than a Lua script on the server.
+        Only the missed keys are sent to the lease get script, costing one more round trip.
+        """
+        values = cast(List[Optional[bytes]], self.get_result)
+
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            if v.startswith(b'rfs:'):
+                # early refresh is not granted for keys served by the MGET fast lane
+                self.get_result[i] = b'val:' + v.split(b':', 2)[2]
+            elif self._pipe.lease_wait and v.startswith(b'cas:'):
+                self.get_result[i] = b'wait:' + v[len(b'cas:'):]
+
+        miss_indices = [i for i, v in enumerate(values) if v is None]
+        if len(miss_indices) == 0:
+            return
+
         batch_size = self._pipe.max_keys_per_batch
+        miss_keys = [self.keys[i] for i in miss_indices]
 
-        if len(self.keys) <= batch_size:
-            self.get_result = self._pipe.get_script(keys=self.keys, client=self._pipe.client)
-            return
+        commands = [
+            self._get_script_command(miss_keys[n: n + batch_size])
+            for n in range(0, len(miss_keys), batch_size)
+        ]
 
-        with self._pipe.client.pipeline(transaction=False) as pipe:
-            for n in range(0, len(self.keys), batch_size):
-                keys = self.keys[n: n + batch_size]
-                self._pipe.get_script(keys=keys, client=pipe)
-            pipe_result = pipe.execute()
+        lease_result: List[bytes] = []
+        for r in self._run_commands(commands):
+            lease_result.extend(r)
 
-        self.get_result = []
-        for r in pipe_result:
-            self.get_result.extend(r)
+        for i, r in zip(miss_indices, lease_result):
+            self.get_result[i] = r
 
-    def _execute_lease_set(self) -> None:
-        batch_size = self._pipe.max_keys_per_batch
 
-        if len(self._set_inputs) <= batch_size:
-            self.set_result = self._execute_lease_set_inputs(self._set_inputs, self._pipe.client)
-            return
+class ScriptState:  # pylint: disable=too-few-public-methods
+    """Whether the lease scripts are known to be loaded on the redis server, shared by pipelines."""
+    __slots__ = ('loaded',)
 
-        with self._pipe.client.pipeline(transaction=False) as pipe:
-            for n in range(0, len(self._set_inputs), batch_size):
-                inputs = self._set_inputs[n: n + batch_size]
-                self._execute_lease_set_inputs(inputs, pipe)
+    loaded: bool
 
-            pipe_result = pipe.execute()
+    def __init__(self):
+        self.loaded = False
 
-        self.set_result = []
-        for r in pipe_result:
-            self.set_result.extend(r)
 
-    def _execute_lease_set_inputs(self, inputs: List[SetInput], client) -> List[bytes]:
-        keys = [i.key for i in inputs]
+_Command = Callable[[Any], Any]  # redis client or pipeline -> result
 
-        args: List[Union[int, bytes]] = []
-        for i in inputs:
-            args.append(i.cas)
-            args.append(i.val)
-            args.append(i.ttl)
 
-        return self._pipe.set_script(keys=keys, args=args, client=client)
+def _script_command(script: Any, keys: List[str], args: Optional[List[Any]] = None) -> _Command:
+    def command(client: Any) -> Any:
+        sha = getattr(script, 'sha', None)
+        if sha is not None and isinstance(client, redis.client.Pipeline):
+            # bypass the SCRIPT EXISTS round trip of redis-py pipelines
+            return client.evalsha(sha, len(keys), *keys, *(args or []))
 
+        if args is None:
+            return script(keys=keys, client=client)
+        return script(keys=keys, args=args, client=client)
 
-class _RedisGetResult:  # pylint: disable=too-few-public-methods
-    __slots__ = 'pipe', 'state', 'index'
+    return command
 
-    pipe: RedisPipeline
-    state: RedisPipelineState
-    index: int
 
-    def result(self) -> LeaseGetResponse:
-        """Implementation of LeaseGetResult protocol."""
-        state = self.state
-        if not state.completed:
-            self.pipe.execute(state)  # pylint: disable=no-member
+def _mget_command(keys: List[str]) -> _Command:
+    return lambda client: client.mget(keys)
 
-        if state.redis_error is not None:
-            return 3, b'', 0, f'Redis Get: {state.redis_error}'
 
-        get_resp = state.get_result[self.index]
+def _delete_command(key: str) -> _Command:
+    return lambda client: client.delete(key)
 
-        if get_resp.startswith(b'val:'):
-            return 1, get_resp[len(b'val:'):], 0, None
 
-        if get_resp.startswith(b'cas:'):
-            num_str = get_resp[len(b'cas:'):].decode()
-            if not num_str.isnumeric():
-                return 3, b'', 0, f'Value "{num_str}" is not a number'
+def _execute_pipeline(client: redis.Redis, commands: List[_Command]) -> List[Any]:
+    with client.pipeline(transaction=False) as pipe:
+        for command in commands:
+            command(pipe)
+        return pipe.execute(raise_on_error=False)
 
-            cas = int(num_str)
-            return 2, b'', cas, None
 
-        return 1, get_resp, 0, None
+def parse_lease_get_resp(get_resp: bytes) -> LeaseGetResponse:  # pylint: disable=too-many-return-statements
+    """Convert a result of LEASE_GET_SCRIPT to lease get response."""
+    if get_resp.startswith(b'val:'):
+        return 1, get_resp[len(b'val:'):], 0, None
 
+    if get_resp.startswith(b'cas:'):
+        num_str = get_resp[len(b'cas:'):].decode()
+        if not num_str.isnumeric():
+            return 3, b'', 0, f'Value "{num_str}" is not a number'
 
-class RedisPipeline:  # pylint: disable=too-many-instance-attributes
-    """A implementation of Pipeline using redis."""
+        cas = int(num_str)
+        return 2, b'', cas, None
 
-    __slots__ = ('client', 'get_script', 'set_script', '_sess',
-                 '_min_ttl', '_max_ttl', 'max_keys_per_batch',
-                 '_state', '_rand')
+    if get_resp.startswith(b'rfs:'):
+        parts = get_resp.split(b':', 2)
+        if len(parts) < 3 or not parts[1].isdigit():
+            return 3, b'', 0, f'Invalid refresh value "{get_resp[:32]!r}"'
 
-    client: redis.Redis
-    get_script: Any
-    set_script: Any
+        # a hit with the refresh lease granted
+        return 1, parts[2], int(parts[1]), None
 
-    _sess: Session
+    if get_resp.startswith(b'wait:'):
+        num_str = get_resp[len(b'wait:'):].decode()
+        if not num_str.isnumeric():
+            return 3, b'', 0, f'Value "{num_str}" is not a number'
 
-    _min_ttl: int
-    _max_ttl: int
+        return 4, b'', int(num_str), None
 
-    max_keys_per_batch: int
+    return 1, get_resp, 0, None
 
-    _state: Optional[RedisPipelineState]
-    _rand: Optional[random.Random]
 
-    def __init__(  # pylint: disable=too-many-arguments
-            self, r: redis.Redis,
-            get_script: Any, set_script: Any,
-            min_ttl: int, max_ttl: int,
-            sess: Optional[Session],
-            max_keys_per_batch: int,
-    ):
-        self.client = r
-        self.get_script = get_script
-        self.set_script = set_script
+def parse_lease_set_resp(set_resp: bytes) -> LeaseSetResponse:
+    """Convert a result of LEASE_SET_SCRIPT to lease set response."""
+    if set_resp == b'OK':
+        status = LeaseSetStatus.OK
+    elif set_resp == b'NF':
+        status = LeaseSetStatus.NOT_FOUND
+    else:
+        status = LeaseSetStatus.CAS_MISMATCH
 
-        self._sess = sess or Session()
+    return LeaseSetResponse(status=status)
+
+
+def lease_set_args(inputs: List[SetInput]) -> List[Union[int, bytes]]:
+    """Flatten set inputs to the ARGV of LEASE_SET_SCRIPT."""
+    args: List[Union[int, bytes]] = []
+    for i in inputs:
+        args.append(i.cas)
+        args.append(i.val)
+        args.append(i.ttl)
+    return args
 
+
+class LeaseTTL:  # pylint: disable=too-few-public-methods
+    """Random TTL ranges of lease sets, the negative range is for negative cache entries."""
+    __slots__ = ('_min_ttl', '_max_ttl', '_negative_min_ttl', '_negative_max_ttl', '_rand')
+
+    _min_ttl: int
+    _max_ttl: int
+    _negative_min_ttl: int
+    _negative_max_ttl: int
+    _rand: Optional[random.Random]
+
+    def __init__(
+            self, min_ttl: int, max_ttl: int,
+            negative_min_ttl: Optional[int] = None, negative_max_ttl: Optional[int] = None,
+    ):
         self._min_ttl = min_ttl
         self._max_ttl = max_ttl
+        self._negative_min_ttl = min_ttl if negative_min_ttl is None else negative_min_ttl
+        self._negative_max_ttl = max_ttl if negative_max_ttl is None else negative_max_ttl
+        self._rand = None
 
-        self.max_keys_per_batch = max_keys_per_batch
+    def rand(self) -> random.Random:
+        """Returns the random object, created lazily."""
+        if self._rand is None:
+            self._rand = random.Random(time.time_ns())
+        return self._rand
 
-        self._state = None
-        self._rand = None
+    def new_ttl(self, negative: bool) -> int:
+        """Returns a random TTL in seconds."""
+        if negative:
+            return self.rand().randrange(self._negative_min_ttl, self._negative_max_ttl + 1)
+        return self.rand().randrange(self._min_ttl, self._max_ttl + 1)
 
-    def _get_state(self) -> RedisPipelineState:
-        if self._state is None:
-            self._state = RedisPipelineState(self)
-        return self._state
 
-    def execute(self, state: RedisPipelineState):
-        """Executing the pipeline state."""
+StateT = TypeVar("StateT", bound=PipelineStateBase)
+SyncStateT = TypeVar("SyncStateT", bound=SyncPipelineStateBase)
+PipeT = TypeVar("PipeT")
+
+
+class GetResultBase(Generic[PipeT, StateT]):  # pylint: disable=too-few-public-methods
+    """A lease get operation of a pipeline stage, shared by the sync and asyncio pipelines."""
+    __slots__ = 'pipe', 'state', 'index'
+
+    pipe: PipeT
+    state: StateT
+    index: int
+
+    def __init__(self, pipe: PipeT, state: StateT, index: int):
+        self.pipe = pipe
+        self.state = state
+        self.index = index
+
+
+class _SyncGetResult(GetResultBase['SyncPipelineBase', SyncPipelineStateBase]):  # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
+    def result(self) -> LeaseGetResponse:
+        """Implementation of LeaseGetResult protocol."""
+        state = self.state
         if not state.completed:
-            state.execute()
-            self._state = None
+            self.pipe.execute(state)
+
+        return state.lease_get_response(self.index)
 
-    def lease_get(self, key: str) -> LeaseGetResult:
-        """Lease get from cache."""
-        if self._state is None:
-            self._state = RedisPipelineState(self)
 
-        state = self._state
+class PipelineBase(Generic[StateT]):  # pylint: disable=too-few-public-methods
+    """Collecting the operations of the current stage, shared by the redis pipelines."""
 
-        index = len(state.keys)
-        state.keys.append(key)
+    __slots__ = ('_ttl', '_state')
+
+    _ttl: LeaseTTL
+    _state: Optional[StateT]
+
+    def __init__(self, ttl: LeaseTTL):
+        self._ttl = ttl
+        self._state = None
 
-        result = _RedisGetResult()
-        result.pipe = self
-        result.state = state
-        result.index = index
-        # end init get result
+    def _new_state(self) -> StateT:
+        raise NotImplementedError
 
-        return result
+    def _get_state(self) -> StateT:
+        if self._state is None:
+            self._state = self._new_state()
+        return self._state
 
-    def lease_set(self, key: str, cas: int, data: bytes) -> Promise[LeaseSetResponse]:
-        """Set data into cache if cas number is matched."""
+    def _add_set_op(self, key: str, cas: int, data: bytes, negative: bool) -> Tuple[StateT, int]:
         state = self._get_state()
+        index = state.add_set_op(key=key, cas=cas, val=data, ttl=self._ttl.new_ttl(negative))
+        return state, index
 
-        if self._rand is None:
-            self._rand = random.Random(time.time_ns())
+    def _add_delete_op(self, key: str) -> Tuple[StateT, int]:
+        state = self._get_state()
+        return state, state.add_delete_op(key)
 
-        ttl = self._rand.randrange(self._min_ttl, self._max_ttl + 1)
+    def _end_stage(self, state: StateT) -> None:
+        """Operations added from now on belong to the next state."""
+        if self._state is state:
+            self._state = None
 
-        index = state.add_set_op(key=key, cas=cas, val=data, ttl=ttl)
 
-        def lease_set_fn() -> LeaseSetResponse:
-            self.execute(state)
+class SyncPipelineBase(PipelineBase[SyncStateT]):  # pylint: disable=abstract-method
+    """Implement the Pipeline protocol, shared by redis and redis cluster."""
+
+    __slots__ = ('_sess',)
 
-            if state.redis_error is not None:
-                return LeaseSetResponse(
-                    status=LeaseSetStatus.ERROR,
-                    error=f'Redis Set: {state.redis_error}'
-                )
+    _sess: Session
 
-            set_resp = state.set_result[index]
+    def __init__(self, ttl: LeaseTTL, sess: Optional[Session]):
+        super().__init__(ttl)
+        self._sess = sess or Session()
 
-            if set_resp == b'OK':
-                status = LeaseSetStatus.OK
-            elif set_resp == b'NF':
-                status = LeaseSetStatus.NOT_FOUND
-            else:
-                status = LeaseSetStatus.CAS_MISMATCH
+    def execute(self, state: SyncStateT):
+        """Executing the pipeline state."""
+        if not state.completed:
+            state.execute()
+            self._end_stage(state)
+
+    def lease_get(self, key: str) -> LeaseGetResult:
+        """Lease get from cache."""
+        state = self._get_state()
+        return _SyncGetResult(self, state, state.add_get_op(key))
+
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> Promise[LeaseSetResponse]:
+        """
+        Set data into cache if cas number is matched.
+        A negative cache entry (a tombstone of a not found key) is set with the negative TTL range.
+        """
+        state, index = self._add_set_op(key, cas, data, negative)
 
-            return LeaseSetResponse(status=status)
+        def lease_set_fn() -> LeaseSetResponse:
+            self.execute(state)
+            return state.lease_set_response(index)
 
         return lease_set_fn
 
     def delete(self, key: str) -> Promise[DeleteResponse]:
         """Delete cache key."""
-        state = self._get_state()
-        index = state.add_delete_op(key)
+        state, index = self._add_delete_op(key)
 
         def delete_fn() -> DeleteResponse:
             self.execute(state)
-            if state.redis_error is not None:
-                return DeleteResponse(
-                    status=DeleteStatus.ERROR,
-                    error=f'Redis Delete: {state.redis_error}'
-                )
-
-            resp = state.delete_result[index]
-            status = DeleteStatus.OK if resp == 1 else DeleteStatus.NOT_FOUND
-            return DeleteResponse(status=status)
+            return state.delete_response(index)
 
         return delete_fn
 
@@ -348,6 +609,7 @@ class RedisPipeline:  # pylint: disable=too-many-instance-attributes
 
     def finish(self) -> None:
         """Do clean up."""
+        self._sess.execute_lower()
         if self._state is not None:
             self.execute(self._state)
 
@@ -360,37 +622,159 @@ class RedisPipeline:  # pylint: disable=too-many-instance-attributes
         self.finish()
 
 
-class RedisClient:  # pylint: disable=too-few-public-methods
-    """An implementation of Cache Client using redis."""
+class RedisPipeline(SyncPipelineBase[RedisPipelineState]):  # pylint: disable=too-many-instance-attributes
+    """A implementation of Pipeline using redis."""
+
+    __slots__ = ('client', 'get_script', 'set_script',
+                 'max_keys_per_batch', 'mget_first',
+                 'lease_wait', 'early_refresh_delta', 'early_refresh_beta',
+                 'script_state')
+
+    client: redis.Redis
+    get_script: Any
+    set_script: Any
+
+    max_keys_per_batch: int
+    mget_first: bool
+    lease_wait: bool
+    early_refresh_delta: float
+    early_refresh_beta: float
+    script_state: ScriptState
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, r: redis.Redis,
+            get_script: Any, set_script: Any,
+            min_ttl: int, max_ttl: int,
+            sess: Optional[Session],
+            max_keys_per_batch: int,
+            mget_first: bool = False,
+            script_state: Optional[ScriptState] = None,
+            lease_wait: bool = False,
+            early_refresh_delta: float = 0.0,
+            early_refresh_beta: float = 1.0,
+            negative_min_ttl: Optional[int] = None,
+            negative_max_ttl: Optional[int] = None,
+    ):
+        super().__init__(LeaseTTL(min_ttl, max_ttl, negative_min_ttl, negative_max_ttl), sess)
+
+        self.client = r
+        self.get_script = get_script
+        self.set_script = set_script
+
+        self.max_keys_per_batch = max_keys_per_batch
+        self.mget_first = mget_first
+        self.lease_wait = lease_wait
+        self.early_refresh_delta = early_refresh_delta
+        self.early_refresh_beta = early_refresh_beta
+        self.script_state = script_state or ScriptState()
+
+    def _new_state(self) -> RedisPipelineState:
+        return RedisPipelineState(self)
+
+    def early_refresh_threshold(self) -> int:
+        """
+        Random threshold (in milliseconds) of the remaining TTL for refreshing a key early,
+        following the XFetch algorithm: -delta * beta * ln(rand()).
+        """
+        delta_ms = self.early_refresh_delta * 1000.0
+        return int(-delta_ms * self.early_refresh_beta * math.log(1.0 - self._ttl.rand().random()))
+
+
+class RedisClientBase:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Lease scripts and options of pipelines, shared by RedisClient and AsyncRedisClient."""
     __slots__ = ('_client', '_get_script', '_set_script',
-                 '_min_ttl', '_max_ttl', '_max_keys_per_batch')
-    _client: redis.Redis
+                 '_min_ttl', '_max_ttl', '_negative_min_ttl', '_negative_max_ttl',
+                 '_max_keys_per_batch', '_lease_wait')
+    _client: Any
     _get_script: Any
     _set_script: Any
     _min_ttl: int
     _max_ttl: int
+    _negative_min_ttl: int
+    _negative_max_ttl: int
     _max_keys_per_batch: int
+    _lease_wait: bool
 
-    def __init__(
-            self, r: redis.Redis,
-            min_ttl=6 * 3600, max_ttl=12 * 3600,
-            max_keys_per_batch=100,
+    def __init__(  # pylint: disable=too-many-arguments
+            self, r: Any,
+            min_ttl: int, max_ttl: int,
+            max_keys_per_batch: int,
+            lease_wait: bool,
+            negative_min_ttl: int, negative_max_ttl: int,
     ):
         self._client = r
         self._get_script = self._client.register_script(LEASE_GET_SCRIPT)
         self._set_script = self._client.register_script(LEASE_SET_SCRIPT)
         self._min_ttl = min_ttl
         self._max_ttl = max_ttl
+        self._negative_min_ttl = negative_min_ttl
+        self._negative_max_ttl = negative_max_ttl
         self._max_keys_per_batch = max_keys_per_batch
+        self._lease_wait = lease_wait
+
+    def _pipeline_kwargs(self) -> Dict[str, Any]:
+        """Arguments of the pipeline constructors."""
+        return {
+            'r': self._client,
+            'get_script': self._get_script,
+            'set_script': self._set_script,
+            'min_ttl': self._min_ttl,
+            'max_ttl': self._max_ttl,
+            'max_keys_per_batch': self._max_keys_per_batch,
+            'lease_wait': self._lease_wait,
+            'negative_min_ttl': self._negative_min_ttl,
+            'negative_max_ttl': self._negative_max_ttl,
+        }
+
+
+class RedisClient(RedisClientBase):  # pylint: disable=too-few-public-methods
+    """
+    An implementation of Cache Client using redis.
+    With mget_first=True, lease gets are done by a plain MGET first,
+    only missed keys are sent to the lease get script in a second round trip.
+    It reduces CPU usage of redis servers when the hit rate is high.
+    With lease_wait=True, only the first caller of a missed key is granted the lease,
+    other callers get the LEASE_HELD status (4) until the value is set back.
+    With early_refresh_delta > 0 (the expected duration in seconds of filling a key),
+    a hit is probabilistically granted a refresh lease before the key expires (XFetch),
+    returned as status 1 with cas > 0. Item refreshes such keys in a lower priority session.
+    Negative cache entries of Item (lease sets with negative=True) are set with
+    the TTL range of negative_min_ttl & negative_max_ttl.
+    """
+    __slots__ = ('_mget_first', '_early_refresh_delta', '_early_refresh_beta', '_script_state')
+    _client: redis.Redis
+    _mget_first: bool
+    _early_refresh_delta: float
+    _early_refresh_beta: float
+    _script_state: ScriptState
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, r: redis.Redis,
+            min_ttl=6 * 3600, max_ttl=12 * 3600,
+            max_keys_per_batch=100,
+            mget_first=False,
+            lease_wait=False,
+            early_refresh_delta=0.0,
+            early_refresh_beta=1.0,
+            negative_min_ttl=60, negative_max_ttl=120,
+    ):
+        super().__init__(
+            r=r, min_ttl=min_ttl, max_ttl=max_ttl, max_keys_per_batch=max_keys_per_batch,
+            lease_wait=lease_wait,
+            negative_min_ttl=negative_min_ttl, negative_max_ttl=negative_max_ttl,
+        )
+        self._mget_first = mget_first
+        self._early_refresh_delta = early_refresh_delta
+        self._early_refresh_beta = early_refresh_beta
+        self._script_state = ScriptState()
 
     def pipeline(self, sess: Optional[Session] = None) -> Pipeline:
         """Creates a new pipeline."""
         return RedisPipeline(
-            r=self._client,
-            get_script=self._get_script,
-            set_script=self._set_script,
-            min_ttl=self._min_ttl,
-            max_ttl=self._max_ttl,
             sess=sess,
-            max_keys_per_batch=self._max_keys_per_batch,
+            mget_first=self._mget_first,
+            script_state=self._script_state,
+            early_refresh_delta=self._early_refresh_delta,
+            early_refresh_beta=self._early_refresh_beta,
+            **self._pipeline_kwargs(),
         )
@@ -3,19 +3,21 @@ Session implementation.
 """
 from __future__ import annotations
 
-from typing import List, Callable, Optional
+from typing import List, Callable, Optional, Generic, TypeVar
 
 NextCallFunc = Callable[[], None]
 
+C = TypeVar("C")  # the type of defer funcs
 
-class Session:
-    """Session class is for deferring function calls."""
+
+class _BaseSession(Generic[C]):  # pylint: disable=too-few-public-methods
+    """The list of defer funcs and the dirty flags, shared by Session and AsyncSession."""
 
     __slots__ = 'next_calls', '_lower', '_higher', 'is_dirty'
 
-    next_calls: List[NextCallFunc]
-    _lower: Optional[Session]
-    _higher: Optional[Session]
+    next_calls: List[C]
+    _lower: Optional[_BaseSession[C]]
+    _higher: Optional[_BaseSession[C]]
     is_dirty: bool
 
     def __init__(self):
@@ -24,18 +26,34 @@ class Session:
         self._higher = None
         self.is_dirty = False
 
-    def add_next_call(self, fn: NextCallFunc) -> None:
+    def add_next_call(self, fn: C) -> None:
         """Add delay call to the list of defer funcs."""
         self.next_calls.append(fn)
 
         if self.is_dirty:
             return
 
-        s: Optional[Session] = self
+        s: Optional[_BaseSession[C]] = self
         while s and not s.is_dirty:
             s.is_dirty = True
             s = s._lower  # pylint: disable=protected-access
 
+    def _take_next_calls(self) -> List[C]:
+        """Returns the defer funcs to be called and clears the dirty flag."""
+        call_list = self.next_calls
+        self.next_calls = []
+        self.is_dirty = False
+        return call_list
+
+
+class Session(_BaseSession[NextCallFunc]):
+    """Session class is for deferring function calls."""
+
+    __slots__ = ()
+
+    _lower: Optional[Session]
+    _higher: Optional[Session]
+
     def execute(self) -> None:
         """
         Execute defer funcs.
@@ -49,13 +67,24 @@ class Session:
             higher.execute()
 
         while self.is_dirty:
-            call_list = self.next_calls
-            self.next_calls = []
-            self.is_dirty = False
-
-            for fn in call_list:
+            for fn in self._take_next_calls():
                 fn()
 
+    def execute_lower(self) -> None:
+        """
+        Execute defer funcs of lower priority sessions, e.g. background works
+        when a pipeline finishes.
+        Executing a lower session also executes the higher ones first.
+        """
+        s = self._lower
+        while s is not None:
+            if s.is_dirty:
+                s.execute()
+                # defer funcs can add calls to any session
+                s = self._lower
+                continue
+            s = s._lower  # pylint: disable=protected-access
+
     def get_lower(self) -> Session:
         """Returns a lower priority session."""
         if self._lower is None:
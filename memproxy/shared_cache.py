@@ -0,0 +1,394 @@
+"""
+Shared memory near cache (L1) for processes on the same host, e.g. pre-fork workers.
+It can be used in place of NearCache in NearCacheClient.
+"""
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import Optional, Dict, Tuple
+
+from .near_cache import NowFunc
+
+_MAGIC = b'MPSHC002'
+
+# magic, number of buckets, ways per bucket, slot size
+# followed by the invalidation versions of buckets, then the slots of buckets
+_HEADER = struct.Struct('<8sIII')
+_HEADER_SIZE = 64
+_VERSION = struct.Struct('<Q')
+
+# seq, key hash, key length, data length, expire at, last access
+# seq is odd while the slot is being written
+_SLOT = struct.Struct('<QIHIdd')
+_SEQ = struct.Struct('<Q')
+_LAST_ACCESS = struct.Struct('<d')
+_LAST_ACCESS_OFFSET = 26
+
+_READ_RETRIES = 4
+
+
+def _shm_dir() -> Optional[str]:
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return None
+
+
+class _FileMutex:  # pylint: disable=too-few-public-methods
+    """Mutex of a file shared by all SharedCache objects of the process using that file."""
+    __slots__ = ('mut', 'refs')
+
+    mut: threading.Lock
+    refs: int
+
+    def __init__(self):
+        self.mut = threading.Lock()
+        self.refs = 0
+
+
+FileKey = Tuple[int, int]  # device & inode
+
+_file_mutexes_mut = threading.Lock()
+_file_mutexes: Dict[FileKey, _FileMutex] = {}
+
+
+def _acquire_file_mutex(fd: int) -> Tuple[FileKey, threading.Lock]:
+    st = os.fstat(fd)
+    key = (st.st_dev, st.st_ino)
+    with _file_mutexes_mut:
+        entry = _file_mutexes.get(key)
+        if entry is None:
+            entry = _FileMutex()
+            _file_mutexes[key] = entry
+        entry.refs += 1
+        return key, entry.mut
+
+
+def _release_file_mutex(key: FileKey) -> None:
+    with _file_mutexes_mut:
+        entry = _file_mutexes[key]
+        entry.refs -= 1
+        if entry.refs == 0:
+            del _file_mutexes[key]
+
+
+class SharedCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Cache in a memory mapped file, shared by all processes mapping the same file.
+    With path=None, an unlinked temporary file is used, it is shared with processes forked later.
+
+    The file is a hash table of buckets, each bucket has a fixed number of fixed-size slots.
+    Reads are lock-free using the sequence number of slots, writes lock the bucket
+    with fcntl record locks. When a bucket is full, the least recently read slot is evicted.
+    Keys and data bigger than a slot are not cached.
+
+    Record locks are owned by the process, so objects of the same file in a process
+    share a mutex, which is also held when closing the file.
+    Each bucket has an invalidation version, same as NearCache, invalidate() only rejects
+    in-flight put_if() calls of keys in the same bucket, in all processes.
+    """
+
+    __slots__ = (
+        '_num_buckets', '_ways', '_slot_size', '_slots_offset', '_ttl', '_now',
+        '_fd', '_mm', '_mut', '_file_key',
+        '_hit_count', '_miss_count', '_evict_count',
+    )
+
+    _num_buckets: int
+    _ways: int
+    _slot_size: int
+    _slots_offset: int
+    _ttl: float
+    _now: NowFunc
+
+    _fd: int
+    _mm: mmap.mmap
+    _mut: threading.Lock  # shared by objects of the same file
+    _file_key: Optional[FileKey]
+
+    _hit_count: int
+    _miss_count: int
+    _evict_count: int
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            path: Optional[str] = None,
+            num_slots: int = 64 * 1024,
+            slot_size: int = 1024,
+            ways: int = 8,
+            ttl: float = 30.0,
+            now_func: NowFunc = time.time,
+    ):
+        """
+        :param path: file path for sharing between unrelated processes, e.g. under /dev/shm
+        :param num_slots: total number of slots, the file size is about num_slots * slot_size
+        :param ways: number of slots per bucket
+        :param now_func: must be the same clock for all processes
+        """
+        if ways <= 0 or num_slots < ways:
+            raise ValueError("ways must be positive and num_slots must be at least ways")
+        if slot_size <= _SLOT.size:
+            raise ValueError(f"slot_size must be greater than {_SLOT.size}")
+
+        self._num_buckets = num_slots // ways
+        self._ways = ways
+        self._slot_size = slot_size
+        self._slots_offset = _HEADER_SIZE + self._num_buckets * _VERSION.size
+        self._ttl = ttl
+        self._now = now_func
+
+        if path is None:
+            self._fd, tmp_path = tempfile.mkstemp(prefix='memproxy-', dir=_shm_dir())
+            os.unlink(tmp_path)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        self._file_key, self._mut = _acquire_file_mutex(self._fd)
+        try:
+            with self._mut:
+                self._mm = self._init_mapping()
+        except Exception:
+            os.close(self._fd)
+            _release_file_mutex(self._file_key)
+            raise
+
+        self._hit_count = 0
+        self._miss_count = 0
+        self._evict_count = 0
+
+    def _init_mapping(self) -> mmap.mmap:
+        size = self._slots_offset + self._num_buckets * self._ways * self._slot_size
+
+        self._lock(0)
+        try:
+            file_size = os.fstat(self._fd).st_size
+            if file_size == 0:
+                os.ftruncate(self._fd, size)
+                mm = mmap.mmap(self._fd, size)
+                _HEADER.pack_into(mm, 0, _MAGIC, self._num_buckets, self._ways, self._slot_size)
+                return mm
+
+            if file_size != size:
+                raise ValueError("Shared cache file was created with different params")
+
+            mm = mmap.mmap(self._fd, size)
+            magic, num_buckets, ways, slot_size = _HEADER.unpack_from(mm, 0)
+            if (magic, num_buckets, ways, slot_size) != (
+                    _MAGIC, self._num_buckets, self._ways, self._slot_size):
+                mm.close()
+                raise ValueError("Shared cache file was created with different params")
+            return mm
+        finally:
+            self._unlock(0)
+
+    def _lock(self, offset: int, length: int = 1) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+
+    def _unlock(self, offset: int, length: int = 1) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _bucket_offset(self, key_hash: int) -> int:
+        return self._slots_offset + (key_hash % self._num_buckets) * self._ways * self._slot_size
+
+    def _version_offset(self, key_hash: int) -> int:
+        """Offset of the invalidation version of the bucket, changed with the bucket locked."""
+        return _HEADER_SIZE + (key_hash % self._num_buckets) * _VERSION.size
+
+    def _read(self, key_bytes: bytes, key_hash: int) -> Optional[bytes]:
+        mm = self._mm
+        now = self._now()
+
+        offset = self._bucket_offset(key_hash)
+        for _ in range(self._ways):
+            for _ in range(_READ_RETRIES):
+                seq, slot_hash, key_len, data_len, expire_at, _ = _SLOT.unpack_from(mm, offset)
+                if seq & 1:
+                    continue
+                if slot_hash != key_hash or key_len != len(key_bytes) or expire_at <= now:
+                    break
+
+                start = offset + _SLOT.size
+                buf = mm[start:start + key_len + data_len]
+                if _SEQ.unpack_from(mm, offset)[0] != seq:
+                    # written while reading, read again
+                    continue
+                if buf[:key_len] != key_bytes:
+                    break
+
+                _LAST_ACCESS.pack_into(mm, offset + _LAST_ACCESS_OFFSET, now)
+                return buf[key_len:]
+
+            offset += self._slot_size
+
+        return None
+
+    def _find_slot(self, key_bytes: bytes, key_hash: int) -> int:
+        """Returns offset of the slot of the key or -1, must be called with the bucket locked."""
+        mm = self._mm
+
+        offset = self._bucket_offset(key_hash)
+        for _ in range(self._ways):
+            _, slot_hash, key_len, _, _, _ = _SLOT.unpack_from(mm, offset)
+            start = offset + _SLOT.size
+            if slot_hash == key_hash and key_len == len(key_bytes) \
+                    and mm[start:start + key_len] == key_bytes:
+                return offset
+            offset += self._slot_size
+
+        return -1
+
+    def _find_victim(self, key_hash: int, now: float) -> int:
+        """Returns offset of an empty, expired or the least recently read slot of the bucket."""
+        mm = self._mm
+
+        victim = -1
+        victim_access = 0.0
+
+        offset = self._bucket_offset(key_hash)
+        for _ in range(self._ways):
+            _, _, _, _, expire_at, last_access = _SLOT.unpack_from(mm, offset)
+            if expire_at <= now:
+                return offset
+            if victim < 0 or last_access < victim_access:
+                victim = offset
+                victim_access = last_access
+            offset += self._slot_size
+
+        self._evict_count += 1
+        return victim
+
+    def _write_slot(  # pylint: disable=too-many-arguments
+            self, offset: int, key_hash: int, key_bytes: bytes, data: bytes,
+            expire_at: float, now: float,
+    ) -> None:
+        mm = self._mm
+        seq = _SEQ.unpack_from(mm, offset)[0] + 1
+        _SEQ.pack_into(mm, offset, seq)
+
+        start = offset + _SLOT.size
+        mid = start + len(key_bytes)
+        mm[start:mid] = key_bytes
+        mm[mid:mid + len(data)] = data
+        _SLOT.pack_into(mm, offset, seq, key_hash, len(key_bytes), len(data), expire_at, now)
+
+        # readers only accept the slot after seq becomes even again
+        _SEQ.pack_into(mm, offset, seq + 1)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns cached data or None if not found or expired."""
+        key_bytes = key.encode()
+        data = self._read(key_bytes, zlib.crc32(key_bytes))
+        if data is None:
+            self._miss_count += 1
+        else:
+            self._hit_count += 1
+        return data
+
+    def version(self, key: str) -> int:
+        """Returns the invalidation version of the bucket of the key, see NearCache.version()."""
+        return _VERSION.unpack_from(self._mm, self._version_offset(zlib.crc32(key.encode())))[0]
+
+    def put_if(self, key: str, data: bytes, version: int) -> bool:
+        """Put data into cache if no invalidation happened since the version was observed."""
+        key_bytes = key.encode()
+        if _SLOT.size + len(key_bytes) + len(data) > self._slot_size:
+            return False
+
+        key_hash = zlib.crc32(key_bytes)
+        bucket = self._bucket_offset(key_hash)
+
+        with self._mut:
+            self._lock(bucket)
+            try:
+                if version != _VERSION.unpack_from(self._mm, self._version_offset(key_hash))[0]:
+                    return False
+
+                now = self._now()
+                offset = self._find_slot(key_bytes, key_hash)
+                if offset < 0:
+                    offset = self._find_victim(key_hash, now)
+
+                self._write_slot(offset, key_hash, key_bytes, data, now + self._ttl, now)
+                return True
+            finally:
+                self._unlock(bucket)
+
+    def _incr_version(self, offset: int) -> None:
+        _VERSION.pack_into(self._mm, offset, _VERSION.unpack_from(self._mm, offset)[0] + 1)
+
+    def invalidate(self, key: str) -> None:
+        """Remove key from cache, in-flight reads of its bucket will not be put into cache."""
+        key_bytes = key.encode()
+        key_hash = zlib.crc32(key_bytes)
+        bucket = self._bucket_offset(key_hash)
+
+        with self._mut:
+            self._lock(bucket)
+            try:
+                self._incr_version(self._version_offset(key_hash))
+                offset = self._find_slot(key_bytes, key_hash)
+                if offset >= 0:
+                    self._write_slot(offset, 0, b'', b'', 0.0, 0.0)
+            finally:
+                self._unlock(bucket)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._mut:
+            # lock the whole file
+            self._lock(0, 0)
+            try:
+                for i in range(self._num_buckets):
+                    self._incr_version(_HEADER_SIZE + i * _VERSION.size)
+
+                offset = self._slots_offset
+                for _ in range(self._num_buckets * self._ways):
+                    self._write_slot(offset, 0, b'', b'', 0.0, 0.0)
+                    offset += self._slot_size
+            finally:
+                self._unlock(0, 0)
+
+    def close(self) -> None:
+        """Unmap and close the file, other processes can still use it."""
+        key = self._file_key
+        if key is None:
+            return
+        self._file_key = None
+
+        # closing releases all record locks of the process on the file
+        with self._mut:
+            self._mm.close()
+            os.close(self._fd)
+        _release_file_mutex(key)
+
+    def __len__(self) -> int:
+        now = self._now()
+        count = 0
+        offset = self._slots_offset
+        for _ in range(self._num_buckets * self._ways):
+            _, _, key_len, _, expire_at, _ = _SLOT.unpack_from(self._mm, offset)
+            if key_len > 0 and expire_at > now:
+                count += 1
+            offset += self._slot_size
+        return count
+
+    @property
+    def hit_count(self) -> int:
+        """Number of times get() found data in this process."""
+        return self._hit_count
+
+    @property
+    def miss_count(self) -> int:
+        """Number of times get() did not find data in this process."""
+        return self._miss_count
+
+    @property
+    def evict_count(self) -> int:
+        """Number of live entries replaced for making room by this process."""
+        return self._evict_count
@@ -31,11 +31,18 @@ setuptools.setup(
     package_data={
         'memproxy': ['py.typed'],
         'memproxy.proxy': ['py.typed'],
+        'memproxy.aio': ['py.typed'],
     },
-    packages=['memproxy', 'memproxy.proxy'],
+    packages=['memproxy', 'memproxy.proxy', 'memproxy.aio'],
     python_requires=">=3.8",
     setup_requires=['wheel'],
     install_requires=[
         'redis>=3.2.0',
     ],
+    extras_require={
+        # memproxy.aio.redis uses redis.asyncio
+        'aio': ['redis>=4.2.0'],
+        # memproxy.cluster uses redis.cluster
+        'cluster': ['redis>=4.1.0'],
+    },
 )
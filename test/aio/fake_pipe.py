@@ -0,0 +1,117 @@
+import asyncio
+from typing import List, Dict, Optional
+
+from memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from memproxy import LeaseSetStatus, DeleteStatus
+from memproxy.aio import AsyncSession, AsyncLeaseGetResult, AsyncPromise
+from memproxy.aio.memproxy import AsyncLeaseGetResultFunc
+
+
+class _Batch:
+    keys: List[str]
+    result: List[LeaseGetResponse]
+    completed: bool
+
+    def __init__(self):
+        self.keys = []
+        self.result = []
+        self.completed = False
+
+
+class AsyncPipelineFake:
+    """In-memory implementation of the lease protocol, counting round trips."""
+
+    data: Dict[str, bytes]
+    leases: Dict[str, int]
+    next_cas: int
+
+    round_trips: List[List[str]]
+    set_calls: List[str]
+
+    sess: AsyncSession
+    _batch: Optional[_Batch]
+
+    def __init__(self):
+        self.data = {}
+        self.leases = {}
+        self.next_cas = 0
+
+        self.round_trips = []
+        self.set_calls = []
+
+        self.sess = AsyncSession()
+        self._batch = None
+
+    async def _execute(self, batch: _Batch) -> None:
+        if batch.completed:
+            return
+
+        batch.completed = True
+        if self._batch is batch:
+            self._batch = None
+
+        self.round_trips.append(batch.keys)
+        await asyncio.sleep(0)
+
+        for key in batch.keys:
+            value = self.data.get(key)
+            if value is not None:
+                batch.result.append((1, value, 0, None))
+                continue
+
+            cas = self.leases.get(key)
+            if cas is None:
+                self.next_cas += 1
+                cas = self.next_cas
+                self.leases[key] = cas
+            batch.result.append((2, b'', cas, None))
+
+    def lease_get(self, key: str) -> AsyncLeaseGetResult:
+        if self._batch is None:
+            self._batch = _Batch()
+
+        batch = self._batch
+        index = len(batch.keys)
+        batch.keys.append(key)
+
+        async def get_func() -> LeaseGetResponse:
+            await self._execute(batch)
+            return batch.result[index]
+
+        return AsyncLeaseGetResultFunc(get_func)
+
+    def lease_set(
+            self, key: str, cas: int, data: bytes, negative: bool = False,
+    ) -> AsyncPromise[LeaseSetResponse]:
+        self.set_calls.append(key)
+
+        async def set_func() -> LeaseSetResponse:
+            if self.leases.get(key) != cas:
+                return LeaseSetResponse(status=LeaseSetStatus.CAS_MISMATCH)
+            del self.leases[key]
+            self.data[key] = data
+            return LeaseSetResponse(status=LeaseSetStatus.OK)
+
+        return set_func
+
+    def delete(self, key: str) -> AsyncPromise[DeleteResponse]:
+        async def delete_func() -> DeleteResponse:
+            self.leases.pop(key, None)
+            if self.data.pop(key, None) is None:
+                return DeleteResponse(status=DeleteStatus.NOT_FOUND)
+            return DeleteResponse(status=DeleteStatus.OK)
+
+        return delete_func
+
+    def lower_session(self) -> AsyncSession:
+        return self.sess
+
+    async def finish(self) -> None:
+        if self._batch is not None:
+            await self._execute(self._batch)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.finish()
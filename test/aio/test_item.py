@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from dataclasses import dataclass
+from typing import List
+
+from memproxy import new_json_codec
+from memproxy.aio import AsyncItem, AsyncPromise, new_async_multi_get_filler
+from .fake_pipe import AsyncPipelineFake
+
+
+@dataclass
+class UserTest:
+    id: int
+    name: str
+    age: int
+
+    @staticmethod
+    def get_key(u: UserTest) -> int:
+        return u.id
+
+
+class TestAsyncItem(unittest.IsolatedAsyncioTestCase):
+    fill_keys: List[int]
+    age: int
+
+    def setUp(self) -> None:
+        self.pipe = AsyncPipelineFake()
+        self.fill_keys = []
+        self.age = 81
+
+    def new_item(self) -> AsyncItem[UserTest, int]:
+        return AsyncItem(
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=new_json_codec(UserTest),
+        )
+
+    def filler_func(self, key: int) -> AsyncPromise[UserTest]:
+        self.fill_keys.append(key)
+
+        async def fill() -> UserTest:
+            await asyncio.sleep(0)
+            return UserTest(id=key, name=f'user-data:{key}', age=self.age)
+
+        return fill
+
+    async def test_normal(self) -> None:
+        it = self.new_item()
+
+        u = await it.get(21)()
+        self.assertEqual(UserTest(id=21, name='user-data:21', age=81), u)
+
+        self.assertEqual([21], self.fill_keys)
+        self.assertEqual(b'{"id": 21, "name": "user-data:21", "age": 81}', self.pipe.data['user:21'])
+        self.assertEqual(0, it.hit_count)
+        self.assertEqual(1, it.fill_count)
+
+        # Get Again
+        u = await it.get(21)()
+        self.assertEqual(UserTest(id=21, name='user-data:21', age=81), u)
+
+        self.assertEqual([21], self.fill_keys)
+        self.assertEqual(1, it.hit_count)
+        self.assertEqual(1, it.fill_count)
+        self.assertEqual(len(b'{"id": 21, "name": "user-data:21", "age": 81}'), it.bytes_read)
+        self.assertEqual('user:23', it.compute_key_name(23))
+
+    async def test_batching(self) -> None:
+        it = self.new_item()
+
+        fn1 = it.get(21)
+        fn2 = it.get(22)
+        fn3 = it.get_multi([23, 24])
+
+        self.assertEqual(UserTest(id=21, name='user-data:21', age=81), await fn1())
+        self.assertEqual(UserTest(id=22, name='user-data:22', age=81), await fn2())
+        self.assertEqual([
+            UserTest(id=23, name='user-data:23', age=81),
+            UserTest(id=24, name='user-data:24', age=81),
+        ], await fn3())
+
+        self.assertEqual([['user:21', 'user:22', 'user:23', 'user:24']], self.pipe.round_trips)
+        self.assertEqual(['user:21', 'user:22', 'user:23', 'user:24'], self.pipe.set_calls)
+
+    async def test_concurrent_tasks_share_round_trip(self) -> None:
+        it = self.new_item()
+
+        fn1 = it.get(21)
+        fn2 = it.get(22)
+
+        u1, u2 = await asyncio.gather(fn1(), fn2())
+        self.assertEqual(21, u1.id)
+        self.assertEqual(22, u2.id)
+
+        self.assertEqual([['user:21', 'user:22']], self.pipe.round_trips)
+
+    async def test_decode_error(self) -> None:
+        self.pipe.data['user:21'] = b'invalid'
+
+        it = self.new_item()
+        u = await it.get(21)()
+
+        self.assertEqual(UserTest(id=21, name='user-data:21', age=81), u)
+        self.assertEqual(1, it.decode_error_count)
+        self.assertEqual([], self.pipe.set_calls)
+
+    async def test_multi_get_filler(self) -> None:
+        fill_calls: List[List[int]] = []
+
+        async def fill_multi(keys: List[int]) -> List[UserTest]:
+            fill_calls.append(keys)
+            return [UserTest(id=k, name=f'user:{k}', age=self.age) for k in keys if k != 23]
+
+        it = AsyncItem[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_async_multi_get_filler(
+                fill_func=fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: UserTest(id=0, name='', age=0),
+            ),
+            codec=new_json_codec(UserTest),
+        )
+
+        result = await it.get_multi([21, 22, 23])()
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=22, name='user:22', age=81),
+            UserTest(id=0, name='', age=0),
+        ], result)
+
+        self.assertEqual([[21, 22, 23]], fill_calls)
@@ -0,0 +1,234 @@
+import asyncio
+import unittest
+from typing import List, Any, Optional
+
+import redis
+from redis import asyncio as aioredis
+
+from memproxy import LeaseGetResponse, LeaseSetResponse, DeleteResponse
+from memproxy import LeaseSetStatus, DeleteStatus, new_json_codec
+from memproxy.aio import AsyncItem, AsyncPromise
+from memproxy.aio.redis import AsyncRedisClient
+from ..test_item import UserTest
+
+FOUND = 1
+LEASE_GRANTED: int = 2
+ERROR = 3
+
+
+def lease_get_resp(status: int, data: bytes, cas: int, error: Optional[str] = None) -> LeaseGetResponse:
+    return status, data, cas, error
+
+
+class CapturingAsyncRedis(aioredis.Redis):
+    script_keys: List[List[str]]
+
+    def __init__(self, **kwargs):
+        self.script_keys = []
+        super().__init__(**kwargs)
+
+    def register_script(self, script: Any) -> Any:
+        redis_script = super().register_script(script)
+
+        async def script_wrapper(**kwargs):
+            self.script_keys.append(kwargs['keys'])
+            return await redis_script(**kwargs)
+
+        result: Any = script_wrapper
+        return result
+
+
+class TestAsyncRedisClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        sync_client = redis.Redis()
+        sync_client.flushall()
+        sync_client.script_flush()
+
+        self.redis = CapturingAsyncRedis()
+
+    async def asyncTearDown(self) -> None:
+        await self.redis.connection_pool.disconnect()
+
+    async def test_get_then_set(self) -> None:
+        c = AsyncRedisClient(self.redis, min_ttl=80, max_ttl=90)
+        pipe = c.pipeline()
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=1), await fn1.result())
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=2), await fn2.result())
+
+        set_fn1 = pipe.lease_set('key01', 1, b'some-data')
+        set_fn2 = pipe.lease_set('key02', 3, b'some-data')
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), await set_fn1())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.CAS_MISMATCH), await set_fn2())
+
+        fn1 = pipe.lease_get('key01')
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'some-data', cas=0), await fn1.result())
+
+        ttl = await self.redis.ttl('key01')
+        self.assertGreater(ttl, 80 - 2)
+        self.assertLess(ttl, 90 + 2)
+
+        self.assertEqual([['key01', 'key02'], ['key01']], self.redis.script_keys[:1] + self.redis.script_keys[2:])
+
+    async def test_get_then_delete(self) -> None:
+        c = AsyncRedisClient(self.redis)
+        async with c.pipeline() as pipe:
+            await pipe.lease_get('key01').result()
+
+            delete_fn1 = pipe.delete('key01')
+            delete_fn2 = pipe.delete('key02')
+            self.assertEqual(DeleteResponse(status=DeleteStatus.OK), await delete_fn1())
+            self.assertEqual(DeleteResponse(status=DeleteStatus.NOT_FOUND), await delete_fn2())
+
+    async def test_finish(self) -> None:
+        c = AsyncRedisClient(self.redis)
+        pipe = c.pipeline()
+
+        resp = await pipe.lease_get('key01').result()
+        pipe.lease_set('key01', resp[2], b'value01')
+        await pipe.finish()
+
+        self.assertEqual(b'val:value01', await self.redis.get('key01'))
+
+    async def test_set_negative_entry(self) -> None:
+        c = AsyncRedisClient(self.redis, negative_min_ttl=30, negative_max_ttl=40)
+        pipe = c.pipeline()
+
+        resp1 = await pipe.lease_get('key01').result()
+        resp2 = await pipe.lease_get('key02').result()
+
+        set_fn1 = pipe.lease_set('key01', resp1[2], b'', negative=True)
+        set_fn2 = pipe.lease_set('key02', resp2[2], b'data02')
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), await set_fn1())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), await set_fn2())
+
+        self.assertEqual(b'val:', await self.redis.get('key01'))
+        ttl = await self.redis.ttl('key01')
+        self.assertGreaterEqual(ttl, 29)
+        self.assertLessEqual(ttl, 40)
+
+        self.assertGreater(await self.redis.ttl('key02'), 6 * 3600 - 10)
+
+    async def test_cancel_one_caller(self) -> None:
+        c = AsyncRedisClient(self.redis)
+        pipe = c.pipeline()
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        task1 = asyncio.ensure_future(fn1.result())
+        task2 = asyncio.ensure_future(fn2.result())
+        await asyncio.sleep(0)
+
+        task1.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task1
+
+        # the shared execution is not cancelled for other callers
+        self.assertEqual(LEASE_GRANTED, (await task2)[0])
+
+    async def test_get_multi_keys__exceed_max_batch(self) -> None:
+        c = AsyncRedisClient(self.redis, max_keys_per_batch=3)
+        pipe = c.pipeline()
+
+        fn_list = [pipe.lease_get(f'key0{i}') for i in range(1, 5)]
+        resp_list = [await fn.result() for fn in fn_list]
+
+        self.assertEqual([LEASE_GRANTED] * 4, [r[0] for r in resp_list])
+        self.assertEqual({1, 2, 3, 4}, {r[2] for r in resp_list})
+
+        self.assertEqual([
+            ['key01', 'key02', 'key03'],
+            ['key04'],
+        ], self.redis.script_keys)
+
+        set_list = [pipe.lease_set(f'key0{i + 1}', r[2], b'value') for i, r in enumerate(resp_list)]
+        for set_fn in set_list:
+            self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), await set_fn())
+
+        self.assertEqual([['key01', 'key02', 'key03'], ['key04']], self.redis.script_keys[2:])
+
+    async def test_item(self) -> None:
+        c = AsyncRedisClient(self.redis)
+        fill_keys: List[int] = []
+
+        def filler(key: int) -> AsyncPromise[UserTest]:
+            fill_keys.append(key)
+
+            async def fill() -> UserTest:
+                return UserTest(id=key, name=f'user:{key}', age=81)
+
+            return fill
+
+        for _ in range(2):
+            it = AsyncItem[UserTest, int](
+                pipe=c.pipeline(),
+                key_fn=lambda user_id: f'user:{user_id}',
+                filler=filler,
+                codec=new_json_codec(UserTest),
+            )
+
+            users = await it.get_multi([21, 22])()
+            self.assertEqual([
+                UserTest(id=21, name='user:21', age=81),
+                UserTest(id=22, name='user:22', age=81),
+            ], users)
+
+        self.assertEqual([21, 22], fill_keys)
+
+
+    async def test_item_lease_wait(self) -> None:
+        c = AsyncRedisClient(self.redis, lease_wait=True)
+        await self.redis.set('user:21', b'cas:15')
+
+        fill_keys: List[int] = []
+
+        def filler(key: int) -> AsyncPromise[UserTest]:
+            fill_keys.append(key)
+
+            async def fill() -> UserTest:
+                return UserTest(id=key, name=f'user:{key}', age=81)
+
+            return fill
+
+        async def release_lease() -> None:
+            await asyncio.sleep(0.03)
+            await self.redis.set('user:21', b'val:' + new_json_codec(UserTest).encode(
+                UserTest(id=21, name='holder', age=82),
+            ))
+
+        it = AsyncItem[UserTest, int](
+            pipe=c.pipeline(),
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=filler,
+            codec=new_json_codec(UserTest),
+            lease_wait_durations=[0.01] * 10,
+        )
+
+        users, _ = await asyncio.gather(it.get_multi([21, 22])(), release_lease())
+        self.assertEqual([
+            UserTest(id=21, name='holder', age=82),
+            UserTest(id=22, name='user:22', age=81),
+        ], users)
+
+        self.assertEqual([22], fill_keys)
+        self.assertGreater(it.lease_wait_count, 0)
+
+class TestAsyncRedisClientError(unittest.IsolatedAsyncioTestCase):
+    async def test_lease_get(self) -> None:
+        r = aioredis.Redis(port=6400)
+        c = AsyncRedisClient(r)
+        pipe = c.pipeline()
+
+        resp = await pipe.lease_get('key01').result()
+        self.assertEqual(ERROR, resp[0])
+        self.assertTrue(resp[3] and resp[3].startswith('Redis Get: '))
+
+        set_resp = await pipe.lease_set('key01', 1, b'data')()
+        self.assertEqual(LeaseSetStatus.ERROR, set_resp.status)
+
+        delete_resp = await pipe.delete('key01')()
+        self.assertEqual(DeleteStatus.ERROR, delete_resp.status)
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from typing import List
+
+from memproxy.aio import AsyncSession
+
+
+class TestAsyncSession(unittest.IsolatedAsyncioTestCase):
+    async def test_simple(self) -> None:
+        calls: List[str] = []
+        sess = AsyncSession()
+
+        async def call_a():
+            calls.append('A')
+
+        async def call_b():
+            calls.append('B')
+
+        sess.add_next_call(call_a)
+        sess.add_next_call(call_b)
+
+        await sess.execute()
+        self.assertEqual(['A', 'B'], calls)
+        self.assertFalse(sess.is_dirty)
+
+    async def test_add_next_call_inside(self) -> None:
+        sess = AsyncSession()
+        calls: List[int] = []
+
+        async def handler_02():
+            calls.append(12)
+
+        async def handler_01():
+            sess.add_next_call(handler_02)
+            calls.append(11)
+
+        sess.add_next_call(handler_01)
+        await sess.execute()
+
+        self.assertEqual([11, 12], calls)
+
+    async def test_lower_session(self) -> None:
+        sess = AsyncSession()
+        lower = sess.get_lower()
+        self.assertIs(lower, sess.get_lower())
+
+        calls: List[int] = []
+
+        async def lower_call():
+            calls.append(31)
+
+        async def higher_call():
+            calls.append(21)
+
+        lower.add_next_call(lower_call)
+        sess.add_next_call(higher_call)
+
+        await lower.execute()
+        self.assertEqual([21, 31], calls)
+
+    async def test_execute_inside_call(self) -> None:
+        sess = AsyncSession()
+        calls: List[int] = []
+
+        async def nested():
+            calls.append(2)
+
+        async def outer():
+            sess.add_next_call(nested)
+            await sess.execute()
+            calls.append(1)
+
+        sess.add_next_call(outer)
+        await sess.execute()
+
+        self.assertEqual([2, 1], calls)
+
+    async def test_concurrent_execute_waits_for_running(self) -> None:
+        sess = AsyncSession()
+        calls: List[str] = []
+
+        async def slow_call():
+            await asyncio.sleep(0.01)
+            calls.append('slow')
+
+        sess.add_next_call(slow_call)
+
+        async def other() -> None:
+            await sess.execute()
+            calls.append('other done')
+
+        await asyncio.gather(sess.execute(), other())
+
+        self.assertEqual(['slow', 'other done'], calls)
@@ -1,3 +1,5 @@
+import threading
+import time
 from dataclasses import dataclass
 from typing import List, Optional
 
@@ -32,10 +34,22 @@ class PipelineFake:
 
     delete_resp: DeleteResponse
 
+    # sleep duration of the first func call after each action, simulating the round trip
+    delay: float
+    func_threads: List[int]
+    _pending: bool
+
     def append_action(self, action: str):
         self.actions.append(action)
         global_actions.append(action)
 
+    def _call_func(self, action: str):
+        self.func_threads.append(threading.get_ident())
+        if self._pending and self.delay > 0:
+            time.sleep(self.delay)
+        self._pending = False
+        self.append_action(action)
+
     def __init__(self):
         self.actions = []
         self.sess = Session()
@@ -48,19 +62,24 @@ class PipelineFake:
 
         self.delete_resp = DeleteResponse(status=DeleteStatus.OK)
 
+        self.delay = 0.0
+        self.func_threads = []
+        self._pending = False
+
     def lease_get(self, key: str) -> LeaseGetResult:
         index = len(self.get_keys)
         self.get_keys.append(key)
 
         self.append_action(key)
+        self._pending = True
 
         def get_func():
-            self.append_action(f'{key}:func')
+            self._call_func(f'{key}:func')
             return self.get_results[index]
 
         return LeaseGetResultFunc(get_func)
 
-    def lease_set(self, key: str, cas: int, data: bytes) -> Promise[LeaseSetResponse]:
+    def lease_set(self, key: str, cas: int, data: bytes, negative: bool = False) -> Promise[LeaseSetResponse]:
         self.set_calls.append(SetInput(
             key=key,
             cas=cas,
@@ -68,18 +87,20 @@ class PipelineFake:
         ))
 
         self.append_action(f'set {key}')
+        self._pending = True
 
         def set_func() -> LeaseSetResponse:
-            self.append_action(f'set {key}:func')
+            self._call_func(f'set {key}:func')
             return LeaseSetResponse(status=LeaseSetStatus.OK)
 
         return set_func
 
     def delete(self, key: str) -> Promise[DeleteResponse]:
         self.append_action(f'del {key}')
+        self._pending = True
 
         def delete_func() -> DeleteResponse:
-            self.append_action(f'del {key}:func')
+            self._call_func(f'del {key}:func')
             return self.delete_resp
 
         return delete_func
@@ -8,6 +8,7 @@ class StatsFake:
     notify_calls: List[int]
 
     mem: Dict[int, float]
+    fail_on_notify: bool
 
     def __init__(self):
         self.failed_servers = set()
@@ -16,6 +17,7 @@ class StatsFake:
         self.notify_calls = []
 
         self.mem = {}
+        self.fail_on_notify = True
 
     def get_mem_usage(self, server_id: int) -> Optional[float]:
         self.get_calls.append(server_id)
@@ -27,4 +29,8 @@ class StatsFake:
 
     def notify_server_failed(self, server_id: int) -> None:
         self.notify_calls.append(server_id)
-        self.failed_servers.add(server_id)
+        if self.fail_on_notify:
+            self.failed_servers.add(server_id)
+
+    def generation(self) -> int:
+        return hash((tuple(sorted(self.mem.items())), tuple(sorted(self.failed_servers))))
@@ -0,0 +1,283 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Dict, Callable, Set
+
+from memproxy import CacheClient, Pipeline, Session, Promise
+from memproxy import LeaseGetResponse, LeaseSetResponse, LeaseSetStatus
+from memproxy import DeleteResponse, DeleteStatus
+from memproxy.memproxy import LeaseGetResultFunc, LeaseGetResult
+from memproxy.proxy import ProxyCacheClient, ReplicatedRoute, HedgePolicy
+from .fake_stats import StatsFake
+
+FOUND = 1
+LEASE_GRANTED = 2
+
+
+class ServerFake:
+    """Cache server granting leases, each pipeline waits for the delay on its first result."""
+
+    def __init__(self, server_id: int):
+        self.server_id = server_id
+        self.delay = 0.0
+        self.mut = threading.Lock()
+        self.get_keys: List[str] = []
+        self.set_keys: List[Tuple[str, int]] = []
+        self.delete_keys: List[str] = []
+        self.delete_threads: List[threading.Thread] = []
+        # keys answered with an error
+        self.error_keys: Set[str] = set()
+        # keys answered as found with a refresh lease
+        self.refresh_values: Dict[str, bytes] = {}
+
+    def pipeline(self, sess: Optional[Session] = None) -> Pipeline:
+        return PipelineFake(self, sess)
+
+
+class PipelineFake:
+    def __init__(self, server: ServerFake, sess: Optional[Session]):
+        self.server = server
+        self.sess = sess or Session()
+        self.executed = False
+
+    def _execute(self) -> None:
+        if not self.executed:
+            self.executed = True
+            time.sleep(self.server.delay)
+
+    def lease_get(self, key: str) -> LeaseGetResult:
+        def get_fn() -> LeaseGetResponse:
+            self._execute()
+            with self.server.mut:
+                self.server.get_keys.append(key)
+                value = self.server.refresh_values.get(key)
+            if key in self.server.error_keys:
+                return 3, b'', 0, 'server error'
+            if value is not None:
+                return FOUND, value, self.server.server_id, None
+            return LEASE_GRANTED, b'', self.server.server_id, None
+
+        return LeaseGetResultFunc(get_fn)
+
+    def lease_set(self, key: str, cas: int, _: bytes, negative: bool = False) -> Promise[LeaseSetResponse]:
+        def set_fn() -> LeaseSetResponse:
+            self._execute()
+            with self.server.mut:
+                self.server.set_keys.append((key, cas))
+            return LeaseSetResponse(status=LeaseSetStatus.OK)
+
+        return set_fn
+
+    def delete(self, key: str) -> Promise[DeleteResponse]:
+        def delete_fn() -> DeleteResponse:
+            self._execute()
+            with self.server.mut:
+                self.server.delete_keys.append(key)
+                self.server.delete_threads.append(threading.current_thread())
+                self.server.refresh_values.pop(key, None)
+            return DeleteResponse(status=DeleteStatus.OK)
+
+        return delete_fn
+
+    def lower_session(self) -> Session:
+        return self.sess
+
+    def finish(self) -> None:
+        self.sess.execute_lower()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+
+def wait_until(cond: Callable[[], bool], timeout: float = 2.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not cond() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+
+class TestHedgePolicy(unittest.TestCase):
+    def test_delay_by_percentile(self) -> None:
+        hedge = HedgePolicy(percentile=90, min_delay=0.0, window=100, min_samples=10)
+
+        for i in range(9):
+            hedge.observe(i / 1000)
+        self.assertIsNone(hedge.delay())
+
+        hedge.observe(0.009)
+        self.assertEqual(0.009, hedge.delay())
+
+        # recomputed after window / 10 new samples
+        for _ in range(9):
+            hedge.observe(0.1)
+        self.assertEqual(0.009, hedge.delay())
+        hedge.observe(0.1)
+        self.assertEqual(0.1, hedge.delay())
+
+    def test_min_delay(self) -> None:
+        hedge = HedgePolicy(min_delay=0.005, min_samples=1)
+        hedge.observe(0.001)
+        self.assertEqual(0.005, hedge.delay())
+
+    def test_budget(self) -> None:
+        hedge = HedgePolicy(budget_percent=25)
+
+        self.assertFalse(hedge.try_hedge())
+        for _ in range(4):
+            hedge.add_request()
+        self.assertTrue(hedge.try_hedge())
+        self.assertFalse(hedge.try_hedge())
+
+    def test_invalid_params(self) -> None:
+        with self.assertRaises(ValueError):
+            HedgePolicy(percentile=100)
+        with self.assertRaises(ValueError):
+            HedgePolicy(window=10, min_samples=20)
+
+
+class TestProxyHedge(unittest.TestCase):
+    servers: Dict[int, ServerFake]
+
+    def setUp(self) -> None:
+        self.server_ids = [21, 22]
+        self.servers = {server_id: ServerFake(server_id) for server_id in self.server_ids}
+
+        self.stats = StatsFake()
+        self.stats.mem = {21: 100, 22: 100}
+
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+        # always choose server 21 first
+        self.route = ReplicatedRoute(self.server_ids, self.stats, rand=lambda: lambda _: 0)
+
+        self.hedge = HedgePolicy(min_delay=0.02, budget_percent=100, min_samples=1)
+        self.hedge.observe(0.001)
+
+        self.client = ProxyCacheClient(
+            self.server_ids, self.new_func, self.route,
+            executor=self.executor, hedge=self.hedge,
+        )
+
+    def new_func(self, server_id: int) -> CacheClient:
+        return self.servers[server_id]
+
+    def test_requires_executor(self) -> None:
+        with self.assertRaises(ValueError):
+            ProxyCacheClient(self.server_ids, self.new_func, self.route, hedge=self.hedge)
+
+    def test_fast_server_not_hedged(self) -> None:
+        pipe = self.client.pipeline()
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), pipe.lease_get('key01').result())
+        pipe.finish()
+
+        self.assertEqual(['key01'], self.servers[21].get_keys)
+        self.assertEqual([], self.servers[22].get_keys)
+
+    def test_slow_server_hedged(self) -> None:
+        self.servers[21].delay = 0.3
+
+        pipe = self.client.pipeline()
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        start = time.perf_counter()
+        self.assertEqual((LEASE_GRANTED, b'', 22, None), fn1.result())
+        self.assertEqual((LEASE_GRANTED, b'', 22, None), fn2.result())
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+        # lease set goes to the server granting the lease
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe.lease_set('key01', 22, b'data')())
+        pipe.finish()
+
+        self.assertEqual([('key01', 22)], self.servers[22].set_keys)
+        self.assertEqual([], self.servers[21].set_keys)
+
+        # leases granted by the slow server are released
+        wait_until(lambda: len(self.servers[21].delete_keys) == 2)
+        self.assertEqual(['key01', 'key02'], self.servers[21].get_keys)
+        self.assertEqual(['key01', 'key02'], self.servers[21].delete_keys)
+        self.assertEqual([], self.servers[22].delete_keys)
+
+    def test_server_answers_before_hedged(self) -> None:
+        self.servers[21].delay = 0.05
+        self.servers[22].delay = 0.2
+
+        pipe = self.client.pipeline()
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), pipe.lease_get('key01').result())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe.lease_set('key01', 21, b'data')())
+        pipe.finish()
+
+        self.assertEqual([('key01', 21)], self.servers[21].set_keys)
+
+        # the lease granted by the hedged request is released
+        wait_until(lambda: len(self.servers[22].delete_keys) == 1)
+        self.assertEqual(['key01'], self.servers[22].get_keys)
+        self.assertEqual(['key01'], self.servers[22].delete_keys)
+        self.assertEqual([], self.servers[21].delete_keys)
+
+    def test_refresh_lease_of_hedged_not_released(self) -> None:
+        self.servers[21].delay = 0.05
+        self.servers[22].delay = 0.2
+        self.servers[22].refresh_values['key01'] = b'data'
+
+        pipe = self.client.pipeline()
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), fn1.result())
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), fn2.result())
+        pipe.finish()
+
+        # only the lease granted by the hedged requests is released
+        wait_until(lambda: len(self.servers[22].delete_keys) == 1)
+        self.assertEqual(['key01', 'key02'], self.servers[22].get_keys)
+        self.assertEqual(['key02'], self.servers[22].delete_keys)
+        self.assertEqual({'key01': b'data'}, self.servers[22].refresh_values)
+
+    def test_release_not_on_caller_thread(self) -> None:
+        self.servers[21].delay = 0.1
+        self.servers[22].error_keys = {'key02'}
+
+        pipe = self.client.pipeline()
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        # the hedged requests failed, they are done before the server answers
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), fn1.result())
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), fn2.result())
+        pipe.finish()
+
+        wait_until(lambda: len(self.servers[22].delete_keys) == 1)
+        self.assertEqual(['key01'], self.servers[22].delete_keys)
+        self.assertNotIn(threading.current_thread(), self.servers[22].delete_threads)
+
+    def test_no_hedge_without_budget(self) -> None:
+        self.servers[21].delay = 0.1
+        self.hedge = HedgePolicy(min_delay=0.02, budget_percent=0, min_samples=1)
+        self.hedge.observe(0.001)
+        client = ProxyCacheClient(
+            self.server_ids, self.new_func, self.route,
+            executor=self.executor, hedge=self.hedge,
+        )
+
+        pipe = client.pipeline()
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), pipe.lease_get('key01').result())
+        pipe.finish()
+
+        self.assertEqual([], self.servers[22].get_keys)
+
+    def test_other_ops_not_hedged(self) -> None:
+        self.servers[21].delay = 0.1
+
+        pipe = self.client.pipeline()
+        delete_fn = pipe.delete('key02')
+        get_fn = pipe.lease_get('key01')
+
+        self.assertEqual((LEASE_GRANTED, b'', 21, None), get_fn.result())
+        self.assertEqual(DeleteResponse(status=DeleteStatus.OK), delete_fn())
+        pipe.finish()
+
+        self.assertEqual([], self.servers[22].get_keys)
@@ -0,0 +1,112 @@
+import time
+import unittest
+from typing import Dict, List
+
+from memproxy import CacheClient, Pipeline
+from memproxy.proxy import ProxyCacheClient, ReplicatedRoute, ServerLatency
+from .fake_pipe import ClientFake, global_actions
+from .fake_stats import StatsFake
+from .test_proxy import lease_get_resp, FOUND
+
+
+class TestServerLatency(unittest.TestCase):
+    now: float
+
+    def setUp(self) -> None:
+        self.now = 100.0
+        self.latency = ServerLatency(decay_seconds=10.0, now_func=lambda: self.now)
+
+    def observe(self, server_id: int, duration: float) -> None:
+        start = self.latency.begin(server_id)
+        self.now += duration
+        self.latency.end(server_id, start)
+
+    def test_empty(self) -> None:
+        self.assertEqual(0.0, self.latency.latency(21))
+        self.assertEqual(0, self.latency.in_flight(21))
+        self.assertEqual(0.0, self.latency.score(21))
+
+    def test_ewma(self) -> None:
+        self.observe(21, 0.1)
+        self.assertAlmostEqual(0.1, self.latency.latency(21))
+
+        self.now += 10.0 - 0.2
+        self.observe(21, 0.2)
+        # weight of the old sample is exp(-1)
+        self.assertAlmostEqual(0.1 * 0.36788 + 0.2 * 0.63212, self.latency.latency(21), places=4)
+
+    def test_decay_without_samples(self) -> None:
+        self.observe(21, 0.1)
+        self.now += 20.0
+        self.assertAlmostEqual(0.1 * 0.13534, self.latency.latency(21), places=4)
+
+    def test_in_flight(self) -> None:
+        self.observe(21, 0.1)
+
+        start = self.latency.begin(21)
+        self.latency.begin(21)
+        self.assertEqual(2, self.latency.in_flight(21))
+        self.assertAlmostEqual(0.3, self.latency.score(21))
+
+        self.latency.end(21, start)
+        self.assertEqual(1, self.latency.in_flight(21))
+
+    def test_invalid_decay(self) -> None:
+        with self.assertRaises(ValueError):
+            ServerLatency(decay_seconds=0)
+
+
+class TestProxyWithLatency(unittest.TestCase):
+    clients: Dict[int, ClientFake]
+
+    def setUp(self) -> None:
+        global_actions.clear()
+
+        self.server_ids = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {21: 100, 22: 100, 23: 100}
+        self.clients = {}
+
+    def new_func(self, server_id) -> CacheClient:
+        c = ClientFake()
+        c.pipe.delay = 0.02 if server_id == 21 else 0.001
+        self.clients[server_id] = c
+        return c
+
+    def run_gets(self, client: CacheClient, n: int) -> List[float]:
+        durations: List[float] = []
+        for i in range(n):
+            pipe: Pipeline = client.pipeline()
+            key = f'key:{i}'
+            for c in self.clients.values():
+                c.pipe.get_results.append(lease_get_resp(status=FOUND, data=b'data', cas=0))
+
+            start = time.perf_counter()
+            self.assertEqual(FOUND, pipe.lease_get(key).result()[0])
+            durations.append(time.perf_counter() - start)
+            pipe.finish()
+
+        durations.sort()
+        return durations
+
+    def test_observe_calls(self) -> None:
+        latency = ServerLatency()
+        route = ReplicatedRoute([21], self.stats, latency=latency)
+        client = ProxyCacheClient([21], self.new_func, route, latency=latency)
+
+        self.run_gets(client, 2)
+
+        self.assertGreater(latency.latency(21), 0.015)
+        self.assertEqual(0, latency.in_flight(21))
+
+    def test_degraded_replica_avoided(self) -> None:
+        latency = ServerLatency()
+        route = ReplicatedRoute(self.server_ids, self.stats, latency=latency)
+        client = ProxyCacheClient(self.server_ids, self.new_func, route, latency=latency)
+
+        durations = self.run_gets(client, 100)
+
+        # only the first calls to the slow server before its latency is known
+        slow_calls = len(self.clients[21].pipe.func_threads)
+        self.assertLess(slow_calls, 5)
+        self.assertLess(durations[95], 0.015)
@@ -1,10 +1,13 @@
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional
 
-from memproxy import CacheClient, DeleteResponse, DeleteStatus
+from memproxy import CacheClient, DeleteResponse, DeleteStatus, Pipeline
 from memproxy import LeaseGetResponse
 from memproxy import LeaseSetResponse, LeaseSetStatus
-from memproxy.proxy import ProxyCacheClient, ReplicatedRoute
+from memproxy.proxy import ProxyCacheClient, ReplicatedRoute, ShardedRoute, Route
 from .fake_pipe import ClientFake, global_actions, SetInput
 from .fake_stats import StatsFake
 
@@ -182,6 +185,26 @@ class TestProxy(unittest.TestCase):
             'key01', 'key01:func', 'set key01', 'set key01:func'
         ], pipe1.actions)
 
+    def test_lease_get_refresh_granted_then_set(self) -> None:
+        resp1 = lease_get_resp(
+            status=FOUND,
+            cas=62,
+            data=b'data 01',
+        )
+
+        pipe1 = self.clients[21].pipe
+        pipe1.get_results = [resp1]
+
+        fn1 = self.pipe.lease_get('key01')
+        self.assertEqual(resp1, fn1.result())
+
+        set_fn1 = self.pipe.lease_set('key01', resp1[2], b'data 02')
+        self.assertEqual(LeaseSetResponse(LeaseSetStatus.OK), set_fn1())
+
+        self.assertEqual([
+            SetInput(key='key01', cas=62, val=b'data 02')
+        ], pipe1.set_calls)
+
     def test_lease_set_only(self) -> None:
         pipe1 = self.clients[21].pipe
 
@@ -404,3 +427,82 @@ class TestProxy(unittest.TestCase):
             'del key01', 'del key01', 'del key01',
             'finish', 'finish', 'finish'
         ], global_actions)
+
+
+class TestProxyWithExecutor(unittest.TestCase):
+    clients: Dict[int, ClientFake]
+
+    def setUp(self) -> None:
+        global_actions.clear()
+
+        self.server_ids = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {21: 100, 22: 100, 23: 100}
+        self.clients = {}
+
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def new_func(self, server_id) -> CacheClient:
+        c = ClientFake()
+        c.pipe.delay = 0.05
+        self.clients[server_id] = c
+        return c
+
+    def new_pipe(self, route: Route) -> Pipeline:
+        client = ProxyCacheClient(self.server_ids, self.new_func, route, executor=self.executor)
+        return client.pipeline()
+
+    def test_delete_on_all_replicas(self) -> None:
+        pipe = self.new_pipe(ReplicatedRoute(self.server_ids, self.stats))
+
+        start = time.perf_counter()
+        resp = pipe.delete('key01')()
+        duration = time.perf_counter() - start
+
+        self.assertEqual(DeleteResponse(status=DeleteStatus.OK), resp)
+        self.assertLess(duration, 0.12)
+
+        threads = set()
+        for server_id in self.server_ids:
+            fake = self.clients[server_id].pipe
+            self.assertEqual(['del key01', 'del key01:func'], fake.actions)
+            threads.update(fake.func_threads)
+
+        self.assertEqual(3, len(threads))
+        self.assertIn(threading.get_ident(), threads)
+
+    def test_lease_get_on_different_servers(self) -> None:
+        route = ShardedRoute(self.server_ids, self.stats)
+        pipe = self.new_pipe(route)
+
+        keys: Dict[int, str] = {}
+        for i in range(100):
+            keys.setdefault(route.replicas_of(f'key:{i}')[0], f'key:{i}')
+        self.assertEqual(3, len(keys))
+
+        fn_list = []
+        for server_id, key in keys.items():
+            pipe.lease_get(key)  # create the fake pipeline before setting results
+            self.clients[server_id].pipe.get_results = [
+                lease_get_resp(status=FOUND, data=b'data', cas=0),
+                lease_get_resp(status=LEASE_GRANTED, data=b'', cas=server_id),
+            ]
+            fn_list.append(pipe.lease_get(key))
+
+        start = time.perf_counter()
+        for fn in fn_list:
+            self.assertEqual(LEASE_GRANTED, fn.result()[0])
+        duration = time.perf_counter() - start
+
+        self.assertLess(duration, 0.12)
+
+        for server_id, key in keys.items():
+            self.assertEqual([key, key, f'{key}:func', f'{key}:func'], self.clients[server_id].pipe.actions)
+
+        # set back to the servers of the keys
+        set_fns = [pipe.lease_set(key, server_id, b'data') for server_id, key in keys.items()]
+        for set_fn in set_fns:
+            self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), set_fn())
+        for server_id, key in keys.items():
+            self.assertEqual(f'set {key}:func', self.clients[server_id].pipe.actions[-1])
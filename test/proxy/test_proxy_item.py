@@ -308,3 +308,46 @@ class TestProxyItem(unittest.TestCase):
             ], users)
 
             self.assertEqual([11, 12, 13], self.fill_keys)
+
+
+class TestProxyItemKeyAffinity(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis1 = redis.Redis(port=6379)
+        self.redis2 = redis.Redis(port=6380)
+        for r in (self.redis1, self.redis2):
+            r.flushall()
+            r.script_flush()
+
+        self.stats = StatsFake()
+        self.stats.mem = {21: 100, 22: 100}
+
+        route = ReplicatedRoute([21, 22], self.stats, key_affinity=True)
+        self.client = ProxyCacheClient([21, 22], self.new_func, route)
+
+    def new_func(self, server_id: int) -> CacheClient:
+        if server_id == 21:
+            return RedisClient(self.redis1)
+        return RedisClient(self.redis2)
+
+    def new_item(self) -> Item[UserTest, int]:
+        pipe = self.client.pipeline()
+        self.addCleanup(pipe.finish)
+        return Item(
+            pipe=pipe,
+            key_fn=user_key_name,
+            filler=lambda user_id: lambda: UserTest(id=0, name=f'user:{user_id}'),
+            codec=user_codec,
+        )
+
+    def test_each_key_on_one_replica(self) -> None:
+        keys = list(range(40))
+        for _ in range(3):
+            it = self.new_item()
+            self.assertEqual([UserTest(id=0, name=f'user:{k}') for k in keys], it.get_multi(keys)())
+
+        keys1 = set(self.redis1.keys('users:*'))
+        keys2 = set(self.redis2.keys('users:*'))
+        self.assertEqual(set(), keys1 & keys2)
+        self.assertEqual(40, len(keys1) + len(keys2))
+        self.assertGreater(len(keys1), 5)
+        self.assertGreater(len(keys2), 5)
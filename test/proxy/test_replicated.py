@@ -1,7 +1,9 @@
+import os
+import time
 import unittest
-from typing import List
+from typing import List, Dict
 
-from memproxy.proxy import Route, ReplicatedRoute
+from memproxy.proxy import Route, ReplicatedRoute, ServerLatency
 from memproxy.proxy.replicated import RAND_MAX
 from .fake_stats import StatsFake
 
@@ -83,7 +85,8 @@ class TestReplicatedSelector(unittest.TestCase):
         self.assertEqual(23, server_id)
         self.assertEqual(True, ok)
 
-        self.assertEqual([21, 22, 23] * 3, self.stats.get_calls)
+        # usages are read only once while the stats are not changed
+        self.assertEqual([21, 22, 23], self.stats.get_calls)
         self.assertEqual([RAND_MAX] * 3, self.rand_calls)
 
     def test_choose_servers_with_min_percent(self) -> None:
@@ -345,3 +348,301 @@ class TestReplicatedSelectorFailed(unittest.TestCase):
             ReplicatedRoute([], self.stats)
 
         self.assertEqual(('server_ids must not be empty',), e.exception.args)
+
+
+class TestReplicatedSelectorWithLatency(unittest.TestCase):
+    rand_vals: List[int]
+    now: float
+
+    def setUp(self) -> None:
+        self.servers = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {
+            21: 100.0,
+            22: 100.0,
+            23: 100.0,
+        }
+
+        self.rand_vals = []
+        self.now = 100.0
+        self.latency = ServerLatency(now_func=lambda: self.now)
+
+        self.route = ReplicatedRoute(
+            self.servers, self.stats, rand=self.rand_factory, latency=self.latency,
+        )
+
+    def rand_factory(self):
+        return self.rand_func
+
+    def rand_func(self, _: int) -> int:
+        return self.rand_vals.pop(0)
+
+    def observe(self, server_id: int, duration: float) -> None:
+        start = self.latency.begin(server_id)
+        self.now += duration
+        self.latency.end(server_id, start)
+
+    def test_choose_lower_latency_of_two(self) -> None:
+        self.observe(21, 0.050)
+        self.observe(22, 0.001)
+        self.observe(23, 0.030)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+        self.assertEqual([], self.rand_vals)
+
+        self.rand_vals = [RAND_MAX - 1, RAND_MAX - 1]
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+
+        self.rand_vals = [0, RAND_MAX - 1]
+        self.assertEqual((23, True), self.route.new_selector().select_server('key01'))
+
+    def test_server_without_samples_is_tried(self) -> None:
+        self.observe(21, 0.001)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+
+    def test_keep_first_when_lower(self) -> None:
+        self.observe(21, 0.001)
+        self.observe(22, 0.050)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((21, True), self.route.new_selector().select_server('key01'))
+
+    def test_in_flight_increases_score(self) -> None:
+        self.observe(21, 0.010)
+        self.observe(22, 0.010)
+
+        self.latency.begin(21)
+        self.latency.begin(21)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+
+    def test_close_latency_keeps_weighted_choice(self) -> None:
+        self.observe(21, 0.012)
+        self.observe(22, 0.010)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((21, True), self.route.new_selector().select_server('key01'))
+
+    def test_two_replicas_keep_split_by_weights(self) -> None:
+        self.stats.mem = {21: 100.0, 22: 300.0}
+        route = ReplicatedRoute([21, 22], self.stats, rand=self.rand_factory, latency=self.latency)
+
+        for latencies in [(0.010, 0.010), (0.010, 0.012), (0.012, 0.010)]:
+            self.observe(21, latencies[0])
+            self.observe(22, latencies[1])
+
+            counts = {21: 0, 22: 0}
+            for i in range(1000):
+                self.rand_vals = [i * 1000, 0]
+                server_id, _ = route.new_selector().select_server('key01')
+                counts[server_id] += 1
+
+            self.assertEqual({21: 250, 22: 750}, counts)
+
+    def test_latency_threshold(self) -> None:
+        route = ReplicatedRoute(
+            self.servers, self.stats, rand=self.rand_factory, latency=self.latency, latency_threshold=0.0,
+        )
+        self.observe(21, 0.012)
+        self.observe(22, 0.010)
+
+        self.rand_vals = [0, 0]
+        self.assertEqual((22, True), route.new_selector().select_server('key01'))
+
+        with self.assertRaises(ValueError):
+            ReplicatedRoute(self.servers, self.stats, latency=self.latency, latency_threshold=1.0)
+
+    def test_single_remaining_server(self) -> None:
+        self.observe(23, 0.050)
+        self.stats.failed_servers.update([21, 22])
+
+        self.rand_vals = [0]
+        self.assertEqual((23, True), self.route.new_selector().select_server('key01'))
+        self.assertEqual([], self.rand_vals)
+
+
+class TestReplicatedWeightTable(unittest.TestCase):
+    def setUp(self) -> None:
+        self.servers = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {
+            21: 100.0,
+            22: 200.0,
+            23: 300.0,
+        }
+        self.rand_val = 0
+        self.route = ReplicatedRoute(self.servers, self.stats, rand=lambda: lambda _: self.rand_val)
+
+    def table(self):
+        return self.route._conf.table
+
+    def test_reuse_when_not_changed(self) -> None:
+        self.assertEqual((21, True), self.route.new_selector().select_server('key01'))
+        table = self.table()
+        assert table is not None
+        self.assertEqual((100.0, 300.0, 600.0), table.weights)
+
+        self.rand_val = 499999
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+        self.assertIs(table, self.table())
+
+        self.rand_val = 600000
+        self.assertEqual((23, True), self.route.new_selector().select_server('key01'))
+        self.assertIs(table, self.table())
+
+    def test_rebuild_when_usage_changed(self) -> None:
+        self.route.new_selector().select_server('key01')
+        table = self.table()
+
+        self.stats.mem[23] = 100.0
+        self.rand_val = 600000
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+        self.assertIsNot(table, self.table())
+
+    def test_read_usages_only_when_generation_changed(self) -> None:
+        self.route.new_selector().select_server('key01')
+        self.route.new_selector().select_server('key01')
+        self.assertEqual([21, 22, 23], self.stats.get_calls)
+
+        self.stats.mem[23] = 100.0
+        self.route.new_selector().select_server('key01')
+        self.assertEqual([21, 22, 23] * 2, self.stats.get_calls)
+
+    def test_failed_server_shared_by_selectors(self) -> None:
+        self.stats.fail_on_notify = False
+
+        selector1 = self.route.new_selector()
+        selector1.set_failed_server(22)
+
+        selector2 = self.route.new_selector()
+        self.rand_val = 300000
+        self.assertEqual((23, True), selector2.select_server('key01'))
+
+        table = self.table()
+        assert table is not None
+        self.assertEqual((100.0, None, 300.0), table.usages)
+
+        # the stats are updated after the failure
+        self.stats.mem[21] = 200.0
+        self.assertEqual((22, True), self.route.new_selector().select_server('key01'))
+
+        table = self.table()
+        assert table is not None
+        self.assertEqual((200.0, 200.0, 300.0), table.usages)
+
+        # the failed server is still skipped by the selector, without changing the shared table
+        selector1.reset()
+        self.assertEqual((21, True), selector1.select_server('key01'))
+        self.assertIs(table, self.table())
+
+    def test_rebuild_when_failed(self) -> None:
+        selector = self.route.new_selector()
+        self.assertEqual((21, True), selector.select_server('key01'))
+
+        selector.set_failed_server(21)
+        self.assertEqual((22, True), selector.select_server('key01'))
+
+        table = self.table()
+        assert table is not None
+        self.assertEqual((None, 200.0, 300.0), table.usages)
+        self.assertEqual((22, 23), table.remaining)
+
+
+class TestReplicatedSelectorBenchmark(unittest.TestCase):
+    def test_select(self) -> None:
+        num_loops = 20_000
+        env = os.getenv("LOOP_MUL")
+        if env:
+            num_loops *= int(env)
+
+        stats = StatsFake()
+        stats.mem = {server_id: 100.0 + server_id for server_id in range(8)}
+        route = ReplicatedRoute(list(range(8)), stats)
+
+        start = time.perf_counter()
+        for i in range(num_loops):
+            route.new_selector().select_server(f'key{i}')
+        duration = time.perf_counter() - start
+
+        print(f'NEW SELECTOR + SELECT: {duration * 1_000_000 / num_loops:.3f}us')
+
+
+class TestReplicatedKeyAffinity(unittest.TestCase):
+    rand_calls: List[int]
+
+    def setUp(self) -> None:
+        self.servers = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {
+            21: 100.0,
+            22: 200.0,
+            23: 300.0,
+        }
+        self.rand_calls = []
+        self.route = ReplicatedRoute(
+            self.servers, self.stats, rand=self.rand_factory, key_affinity=True,
+        )
+
+    def rand_factory(self):
+        return self.rand_func
+
+    def rand_func(self, n: int) -> int:
+        self.rand_calls.append(n)
+        return 0
+
+    def test_same_key_same_server(self) -> None:
+        chosen = self.route.new_selector().select_server('key01')
+        self.assertTrue(chosen[1])
+
+        for _ in range(5):
+            self.assertEqual(chosen, self.route.new_selector().select_server('key01'))
+
+        self.assertEqual([], self.rand_calls)
+
+    def test_spread_by_weights(self) -> None:
+        counts: Dict[int, int] = {}
+        s = self.route.new_selector()
+        for i in range(6000):
+            server_id, ok = s.select_server(f'key:{i}')
+            self.assertTrue(ok)
+            counts[server_id] = counts.get(server_id, 0) + 1
+
+        self.assertAlmostEqual(1000, counts[21], delta=150)
+        self.assertAlmostEqual(2000, counts[22], delta=200)
+        self.assertAlmostEqual(3000, counts[23], delta=200)
+
+        # stats are read once per stage
+        self.assertEqual([21, 22, 23], self.stats.get_calls)
+
+    def test_fallback_on_failed(self) -> None:
+        keys = [f'key:{i}' for i in range(100)]
+
+        s = self.route.new_selector()
+        before = {key: s.select_server(key)[0] for key in keys}
+        failed = before['key:0']
+
+        s.set_failed_server(failed)
+        for key in keys:
+            server_id, ok = s.select_server(key)
+            self.assertTrue(ok)
+            self.assertNotEqual(failed, server_id)
+            if before[key] != failed:
+                # other keys are not moved
+                self.assertEqual(before[key], server_id)
+
+        self.assertEqual([failed], self.stats.notify_calls)
+
+    def test_all_failed(self) -> None:
+        self.stats.failed_servers.update(self.servers)
+
+        server_id, ok = self.route.new_selector().select_server('key01')
+        self.assertIn(server_id, self.servers)
+        self.assertFalse(ok)
+
+    def test_delete_on_all_servers(self) -> None:
+        s = self.route.new_selector()
+        self.assertEqual(self.servers, s.select_servers_for_delete('key01'))
@@ -0,0 +1,197 @@
+import unittest
+from dataclasses import dataclass
+from typing import List, Dict
+
+import redis
+
+from memproxy import Item, RedisClient, CacheClient, Promise, new_json_codec
+from memproxy.proxy import Route, ShardedRoute, ProxyCacheClient
+from .fake_stats import StatsFake
+
+
+@dataclass
+class UserTest:
+    id: int
+    name: str
+
+
+class TestShardedSelector(unittest.TestCase):
+    rand_calls: List[int]
+    rand_val: int
+
+    def setUp(self) -> None:
+        self.servers = [21, 22, 23]
+        self.stats = StatsFake()
+        self.stats.mem = {
+            21: 100.0,
+            22: 100.0,
+            23: 100.0,
+            24: 100.0,
+        }
+
+        self.rand_calls = []
+        self.rand_val = 0
+
+    def rand_factory(self):
+        return self.rand_func
+
+    def rand_func(self, n: int) -> int:
+        self.rand_calls.append(n)
+        return self.rand_val
+
+    def new_route(self, servers: List[int], replicas: int = 1) -> ShardedRoute:
+        return ShardedRoute(servers, self.stats, replicas=replicas, rand=self.rand_factory)
+
+    def test_invalid_params(self) -> None:
+        with self.assertRaises(ValueError):
+            ShardedRoute([], self.stats)
+        with self.assertRaises(ValueError):
+            ShardedRoute([21, 22], self.stats, replicas=3)
+
+    def test_spread_keys(self) -> None:
+        route = self.new_route(self.servers)
+        selector = route.new_selector()
+
+        counts: Dict[int, int] = {}
+        for i in range(3000):
+            server_id, ok = selector.select_server(f'key:{i}')
+            self.assertTrue(ok)
+            counts[server_id] = counts.get(server_id, 0) + 1
+
+        self.assertEqual([21, 22, 23], sorted(counts))
+        for count in counts.values():
+            self.assertGreater(count, 800)
+
+        # health is checked once per server
+        self.assertEqual([21, 22, 23], sorted(self.stats.get_calls))
+        self.assertEqual([], self.rand_calls)
+
+    def test_add_server_moves_about_one_over_n(self) -> None:
+        route = self.new_route(self.servers)
+        new_route = self.new_route(self.servers + [24])
+
+        keys = [f'key:{i}' for i in range(4000)]
+
+        moved = 0
+        for key in keys:
+            old = route.replicas_of(key)[0]
+            new = new_route.replicas_of(key)[0]
+            if old != new:
+                moved += 1
+                self.assertEqual(24, new)
+
+        self.assertGreater(moved, 4000 * 0.2)
+        self.assertLess(moved, 4000 * 0.3)
+
+    def test_failed_server(self) -> None:
+        route: Route = self.new_route(self.servers)
+        s = route.new_selector()
+
+        key = 'key01'
+        server_id, ok = s.select_server(key)
+        self.assertTrue(ok)
+
+        self.assertEqual([server_id], s.select_servers_for_delete(key))
+
+        s.set_failed_server(server_id)
+        self.assertEqual([server_id], self.stats.notify_calls)
+
+        self.assertEqual((server_id, False), s.select_server(key))
+        self.assertEqual([], s.select_servers_for_delete(key))
+
+    def test_replicas(self) -> None:
+        route = self.new_route(self.servers, replicas=2)
+        s = route.new_selector()
+
+        key = 'key01'
+        replicas = route.replicas_of(key)
+        self.assertEqual(2, len(replicas))
+
+        self.rand_val = 1
+        self.assertEqual((replicas[1], True), s.select_server(key))
+        self.assertEqual([2], self.rand_calls)
+
+        # same server until reset
+        self.rand_val = 0
+        self.assertEqual((replicas[1], True), s.select_server(key))
+        self.assertEqual([2], self.rand_calls)
+
+        self.assertEqual(replicas, s.select_servers_for_delete(key))
+
+        # fail over to the other replica
+        s.set_failed_server(replicas[1])
+        self.assertEqual((replicas[0], True), s.select_server(key))
+        self.assertEqual([replicas[0]], s.select_servers_for_delete(key))
+
+        s.set_failed_server(replicas[0])
+        self.assertEqual((replicas[0], False), s.select_server(key))
+
+    def test_server_not_connected(self) -> None:
+        route = self.new_route(self.servers, replicas=2)
+        key = 'key01'
+        replicas = route.replicas_of(key)
+
+        self.stats.failed_servers.add(replicas[0])
+
+        s = route.new_selector()
+        self.assertEqual((replicas[1], True), s.select_server(key))
+        self.assertEqual([replicas[1]], s.select_servers_for_delete(key))
+
+
+class TestShardedProxy(unittest.TestCase):
+    fill_keys: List[int]
+
+    def setUp(self) -> None:
+        self.redis1 = redis.Redis(port=6379)
+        self.redis2 = redis.Redis(port=6380)
+        for r in (self.redis1, self.redis2):
+            r.flushall()
+            r.script_flush()
+
+        self.stats = StatsFake()
+        self.stats.mem = {21: 100.0, 22: 100.0}
+
+        self.route = ShardedRoute([21, 22], self.stats)
+        self.client = ProxyCacheClient([21, 22], self.new_func, self.route)
+        self.fill_keys = []
+
+    def new_func(self, server_id: int) -> CacheClient:
+        if server_id == 21:
+            return RedisClient(self.redis1)
+        return RedisClient(self.redis2)
+
+    def filler_func(self, key: int) -> Promise[UserTest]:
+        self.fill_keys.append(key)
+        return lambda: UserTest(id=key, name=f'user:{key}')
+
+    def new_item(self) -> Item[UserTest, int]:
+        pipe = self.client.pipeline()
+        self.addCleanup(pipe.finish)
+        return Item(
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=new_json_codec(UserTest),
+        )
+
+    def test_keys_are_spread_in_one_stage(self) -> None:
+        it = self.new_item()
+        keys = list(range(20))
+
+        self.assertEqual([UserTest(id=k, name=f'user:{k}') for k in keys], it.get_multi(keys)())
+
+        for k in keys:
+            server_id = self.route.replicas_of(f'user:{k}')[0]
+            r = self.redis1 if server_id == 21 else self.redis2
+            other = self.redis2 if server_id == 21 else self.redis1
+            self.assertEqual(b'val:{"id": %d, "name": "user:%d"}' % (k, k), r.get(f'user:{k}'))
+            self.assertIsNone(other.get(f'user:{k}'))
+
+        self.assertGreater(self.redis1.dbsize(), 0)
+        self.assertGreater(self.redis2.dbsize(), 0)
+
+        # get again
+        it = self.new_item()
+        self.assertEqual([UserTest(id=k, name=f'user:{k}') for k in keys], it.get_multi(keys)())
+        self.assertEqual(keys, self.fill_keys)
+        self.assertEqual(20, it.hit_count)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from typing import Dict, cast
+
+import redis
+
+from memproxy.proxy import StatsScheduler
+from memproxy.proxy.shared_stats import SharedStats, _SLOT
+from .test_hedge import wait_until
+from .test_stats import SlowRedis
+
+
+def _child_read(path: str, clients: Dict[int, SlowRedis], queue: multiprocessing.Queue) -> None:
+    stats = SharedStats({k: cast(redis.Redis, v) for k, v in clients.items()}, path)
+    queue.put((stats.is_leader, stats.get_mem_usage(21), stats.get_mem_usage(22)))
+    stats.notify_server_failed(21)
+    stats.close()
+    queue.put([c.calls for c in clients.values()])
+
+
+class TestSharedStats(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'stats')
+
+        self.scheduler = StatsScheduler()
+        self.addCleanup(self.scheduler.shutdown)
+
+        self.clients = {21: SlowRedis(0.0), 22: SlowRedis(0.0)}
+
+    def new_stats(self, **kwargs) -> SharedStats:
+        stats = SharedStats(
+            {k: cast(redis.Redis, v) for k, v in self.clients.items()}, self.path,
+            scheduler=self.scheduler, election_interval=0.05, watch_interval=0.02, **kwargs,
+        )
+        self.addCleanup(stats.close)
+        return stats
+
+    def new_leader(self, **kwargs) -> SharedStats:
+        stats = self.new_stats(**kwargs)
+        wait_until(lambda: stats.is_leader)
+        return stats
+
+    def test_leader_and_follower(self) -> None:
+        leader = self.new_leader()
+        follower = self.new_stats()
+
+        self.assertTrue(leader.is_leader)
+        self.assertFalse(follower.is_leader)
+
+        self.assertEqual(1234, follower.get_mem_usage(21))
+        self.assertEqual(1234, follower.get_mem_usage(22))
+        self.assertEqual(1234, leader.get_mem_usage(21))
+
+        # polled once by the leader
+        self.assertEqual([1, 1], [c.calls for c in self.clients.values()])
+
+    def test_follower_notify_failed(self) -> None:
+        self.new_leader()
+        follower = self.new_stats()
+
+        follower.notify_server_failed(21)
+        time.sleep(0.1)
+
+        self.assertEqual(2, self.clients[21].calls)
+        self.assertEqual(1, self.clients[22].calls)
+
+    def test_failed_server_published(self) -> None:
+        self.clients[22] = cast(SlowRedis, redis.Redis(port=6400))
+        self.new_leader()
+        follower = self.new_stats()
+
+        self.assertEqual(1234, follower.get_mem_usage(21))
+        self.assertIsNone(follower.get_mem_usage(22))
+
+    def test_take_over_after_leader_closed(self) -> None:
+        leader = self.new_leader()
+        follower = self.new_stats()
+
+        leader.close()
+        self.assertFalse(follower.is_leader)
+
+        wait_until(lambda: follower.is_leader)
+        self.assertTrue(follower.is_leader)
+        self.assertEqual(1234, follower.get_mem_usage(21))
+
+    def test_take_over_does_not_block_callers(self) -> None:
+        leader = self.new_leader()
+        follower = self.new_stats()
+
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for c in self.clients.values():
+            c.release = release
+
+        leader.close()
+        wait_until(lambda: self.clients[21].calls == 2)
+
+        # the follower is probing the servers on its election thread
+        start = time.perf_counter()
+        self.assertEqual(1234, follower.get_mem_usage(21))
+        follower.notify_server_failed(22)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        release.set()
+        wait_until(lambda: follower.is_leader)
+        self.assertTrue(follower.is_leader)
+
+    def test_generation_changed_after_publish(self) -> None:
+        self.new_leader()
+        follower = self.new_stats()
+
+        generation = follower.generation()
+        follower.notify_server_failed(21)
+        wait_until(lambda: self.clients[21].calls == 2)
+        time.sleep(0.05)
+
+        self.assertNotEqual(generation >> 32, follower.generation() >> 32)
+
+    def test_stale_data_of_hung_leader(self) -> None:
+        self.new_leader()
+        follower = self.new_stats(stale_after=0.1)
+
+        self.assertEqual(1234, follower.get_mem_usage(21))
+
+        # the leader does not poll again before sleep_min
+        time.sleep(0.15)
+        self.assertIsNone(follower.get_mem_usage(21))
+        self.assertIsNone(follower.get_mem_usage(22))
+
+    def test_concurrent_publish(self) -> None:
+        leader = self.new_leader()
+        offset = leader._offsets[21]
+        start_seq = _SLOT.unpack_from(leader._mm, offset)[1]
+
+        def publish() -> None:
+            for i in range(2000):
+                leader._publish(21, float(i))
+
+        # switch threads as often as possible
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+
+        threads = [threading.Thread(target=publish) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # each publish increases seq by 2, no updates are lost
+        self.assertEqual(start_seq + 2 * 4 * 2000, _SLOT.unpack_from(leader._mm, offset)[1])
+
+    def test_init_does_not_block_on_probe(self) -> None:
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for c in self.clients.values():
+            c.release = release
+
+        start = time.perf_counter()
+        stats = self.new_stats()
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        # not yet published
+        self.assertFalse(stats.is_leader)
+        self.assertIsNone(stats.get_mem_usage(21))
+
+        release.set()
+        wait_until(lambda: stats.is_leader)
+        self.assertEqual(1234, stats.get_mem_usage(21))
+
+    def test_publish_after_close(self) -> None:
+        leader = self.new_leader()
+        leader.close()
+
+        # e.g. a probe thread of ServerStats finished after closing
+        leader._publish(21, 1234.0)
+
+    def test_different_servers(self) -> None:
+        self.new_stats()
+        with self.assertRaises(ValueError):
+            SharedStats({21: cast(redis.Redis, self.clients[21])}, self.path)
+
+    def test_share_with_other_process(self) -> None:
+        self.new_leader()
+        follower = self.new_stats()
+
+        ctx = multiprocessing.get_context('fork')
+        queue: multiprocessing.Queue = ctx.Queue()
+        p = ctx.Process(target=_child_read, args=(self.path, self.clients, queue))
+        p.start()
+        p.join()
+
+        self.assertEqual(0, p.exitcode)
+        self.assertEqual((False, 1234, 1234), queue.get())
+        # no calls to servers from the child process
+        self.assertEqual([1, 1], queue.get())
+
+        # notified by the child process
+        time.sleep(0.1)
+        self.assertEqual(2, self.clients[21].calls)
+        self.assertEqual(1234, follower.get_mem_usage(21))
@@ -1,10 +1,14 @@
 import datetime
+import os
+import threading
 import time
 import unittest
+from typing import Dict, List, Optional, cast
 
 import redis
 
-from memproxy.proxy import ServerStats
+from memproxy.proxy import ServerStats, StatsScheduler
+from memproxy.proxy.stats import default_stats_scheduler
 
 
 def mem_logger(server_id: int, mem: float):
@@ -96,3 +100,203 @@ class TestServerStatsSingleRedis(unittest.TestCase):
         print(v)
 
         self.assertEqual(None, self.stats.get_mem_usage(22))
+
+
+class SlowRedis:
+    def __init__(
+            self, delay: float,
+            barrier: Optional[threading.Barrier] = None,
+            release: Optional[threading.Event] = None,
+    ):
+        self.delay = delay
+        self.barrier = barrier
+        self.release = release
+        self.mut = threading.Lock()
+        self.calls = 0
+
+    def info(self, _: str) -> Dict[str, int]:
+        with self.mut:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.barrier is not None:
+            # raises if the other probes are not running concurrently
+            self.barrier.wait(timeout=5)
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        return {'used_memory': 1234}
+
+
+class TestServerStatsTimeout(unittest.TestCase):
+    def new_stats(self, clients: List[SlowRedis], timeout: float, duration: int = 7) -> ServerStats:
+        start = time.perf_counter()
+        stats = ServerStats(
+            clients={21 + i: cast(redis.Redis, c) for i, c in enumerate(clients)},
+            sleep_min=duration, sleep_max=duration,
+            timeout=timeout,
+        )
+        self.addCleanup(stats.shutdown)
+        self.init_duration = time.perf_counter() - start
+        return stats
+
+    def test_init_concurrently(self) -> None:
+        barrier = threading.Barrier(5)
+        clients = [SlowRedis(0.0, barrier=barrier) for _ in range(5)]
+        stats = self.new_stats(clients, timeout=10.0)
+
+        for server_id in range(21, 26):
+            self.assertEqual(1234, stats.get_mem_usage(server_id))
+
+    def test_init_not_blocked_by_slow_server(self) -> None:
+        slow = SlowRedis(0.0, release=threading.Event())
+        stats = self.new_stats([SlowRedis(0.0), slow], timeout=0.1)
+
+        # the timeout path ran, the slow server answers only after 5s
+        self.assertEqual('timeout', stats._states[22].error)
+        self.assertIsNone(stats.get_mem_usage(22))
+        self.assertEqual(1234, stats.get_mem_usage(21))
+        self.assertLess(self.init_duration, 2.0)
+
+        # not probing again while the previous probe is running
+        stats.notify_server_failed(22)
+        time.sleep(0.2)
+        self.assertEqual(1, slow.calls)
+
+        # usable again after answering
+        assert slow.release is not None
+        slow.release.set()
+        deadline = time.perf_counter() + 2.0
+        while stats.get_mem_usage(22) is None and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1234, stats.get_mem_usage(22))
+
+    def test_generation_changed_after_poll(self) -> None:
+        stats = self.new_stats([SlowRedis(0.0), SlowRedis(0.0)], timeout=1.0)
+
+        generation = stats.generation()
+        self.assertEqual(generation, stats.generation())
+
+        stats.notify_server_failed(21)
+        time.sleep(0.1)
+        self.assertNotEqual(generation, stats.generation())
+
+    def test_notify_with_slow_server(self) -> None:
+        fast = SlowRedis(0.0)
+        slow = SlowRedis(0.3)
+        stats = self.new_stats([fast, slow], timeout=0.05)
+
+        time.sleep(0.4)
+        self.assertEqual(1, slow.calls)
+
+        stats.notify_server_failed(22)
+        time.sleep(0.1)
+        stats.notify_server_failed(21)
+        time.sleep(0.1)
+
+        # the fast server is probed while the slow one is still running
+        self.assertEqual(2, fast.calls)
+        self.assertEqual(2, slow.calls)
+        self.assertIsNone(stats.get_mem_usage(22))
+
+
+class TestStatsScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = StatsScheduler()
+        self.addCleanup(self.scheduler.shutdown)
+
+    def new_stats(self, clients: Dict[int, SlowRedis], duration: int = 7, **kwargs) -> ServerStats:
+        stats = ServerStats(
+            clients={server_id: cast(redis.Redis, c) for server_id, c in clients.items()},
+            sleep_min=duration, sleep_max=duration,
+            scheduler=self.scheduler, **kwargs,
+        )
+        self.addCleanup(stats.shutdown)
+        return stats
+
+    def test_same_server_polled_once(self) -> None:
+        r = SlowRedis(0.0)
+        logs1: List[int] = []
+        logs2: List[int] = []
+
+        stats1 = self.new_stats({21: r}, mem_logger=lambda server_id, _: logs1.append(server_id))
+        stats2 = self.new_stats({31: r}, mem_logger=lambda server_id, _: logs2.append(server_id))
+
+        self.assertEqual(1, r.calls)
+        self.assertEqual(1234, stats1.get_mem_usage(21))
+        self.assertEqual(1234, stats2.get_mem_usage(31))
+
+        stats1.notify_server_failed(21)
+        stats2.notify_server_failed(31)
+        time.sleep(0.1)
+
+        self.assertEqual(2, r.calls)
+        self.assertEqual([21, 21], logs1)
+        self.assertEqual([31], logs2)
+
+    def test_same_redis_address(self) -> None:
+        stats1 = ServerStats({21: redis.Redis(port=6379)}, scheduler=self.scheduler)
+        stats2 = ServerStats({21: redis.Redis(port=6379), 22: redis.Redis(port=6380)}, scheduler=self.scheduler)
+        self.addCleanup(stats1.shutdown)
+        self.addCleanup(stats2.shutdown)
+
+        self.assertIs(stats1._states[21], stats2._states[21])
+        self.assertIsNot(stats2._states[21], stats2._states[22])
+
+    def test_no_thread_per_stats(self) -> None:
+        r = SlowRedis(0.0)
+        self.new_stats({21: r})
+
+        def num_threads() -> int:
+            # excluding the threads of probes
+            return len([t for t in threading.enumerate() if t.name != 'memproxy-stats'])
+
+        num = num_threads()
+        for _ in range(10):
+            self.new_stats({21: r})
+        self.assertEqual(num, num_threads())
+
+    def test_probe_on_daemon_threads(self) -> None:
+        r = SlowRedis(0.3)
+        self.new_stats({21: r}, timeout=0.05)
+
+        probe_threads = [t for t in threading.enumerate() if t.name == 'memproxy-stats']
+        self.assertGreater(len(probe_threads), 0)
+        for t in probe_threads:
+            # a server not answering does not block the exit of the process
+            self.assertTrue(t.daemon)
+
+    def test_subscribe_while_first_probe_running(self) -> None:
+        r = SlowRedis(0.2)
+
+        first = threading.Thread(target=lambda: self.new_stats({21: r}, timeout=1.0))
+        first.start()
+        while r.calls == 0:
+            time.sleep(0.005)
+
+        # waits for the running probe, instead of seeing a usage of 0
+        stats = self.new_stats({31: r}, timeout=1.0)
+        self.assertEqual(1234, stats.get_mem_usage(31))
+
+        first.join()
+        self.assertEqual(1, r.calls)
+
+    def test_periodic_poll(self) -> None:
+        r1 = SlowRedis(0.0)
+        r2 = SlowRedis(0.0)
+        self.new_stats({21: r1}, duration=1)
+        self.new_stats({22: r2}, duration=1)
+
+        time.sleep(1.5)
+        self.assertEqual(2, r1.calls)
+        self.assertEqual(2, r2.calls)
+
+    def test_shutdown_stops_polling(self) -> None:
+        r = SlowRedis(0.0)
+        stats = ServerStats({21: cast(redis.Redis, r)}, sleep_min=1, sleep_max=1, scheduler=self.scheduler)
+        stats.shutdown()
+
+        time.sleep(1.3)
+        self.assertEqual(1, r.calls)
+
+    def test_default_scheduler(self) -> None:
+        self.assertIs(default_stats_scheduler(), default_stats_scheduler())
+        self.assertEqual(os.getpid(), default_stats_scheduler().pid)
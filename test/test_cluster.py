@@ -0,0 +1,172 @@
+import unittest
+from dataclasses import dataclass
+from typing import Any, List, Optional, cast
+
+import redis
+from redis.crc import key_slot
+
+from memproxy import Item, new_json_codec, Promise
+from memproxy import LeaseSetResponse, LeaseSetStatus, DeleteResponse, DeleteStatus
+from memproxy.cluster import RedisClusterClient, cas_key_for_slot
+from .test_item import UserTest
+
+FOUND = 1
+LEASE_GRANTED: int = 2
+ERROR = 3
+
+
+@dataclass
+class NodeFake:
+    name: str
+    client: redis.Redis
+
+
+class ClusterFake:
+    """Maps the first half of slots to the first node, other slots to the second node."""
+    nodes: List[Optional[NodeFake]]
+
+    def __init__(self, nodes: List[Optional[NodeFake]]):
+        self.nodes = nodes
+
+    @staticmethod
+    def keyslot(key: str) -> int:
+        return key_slot(key.encode())
+
+    def get_node_from_key(self, key: str) -> Optional[NodeFake]:
+        if self.keyslot(key) < 8192:
+            return self.nodes[0]
+        return self.nodes[1]
+
+    @staticmethod
+    def get_redis_connection(node: NodeFake) -> redis.Redis:
+        return node.client
+
+
+def find_key(prefix: str, first_half: bool) -> str:
+    i = 0
+    while True:
+        key = f'{prefix}{i}'
+        if (key_slot(key.encode()) < 8192) == first_half:
+            return key
+        i += 1
+
+
+class TestCasKeyForSlot(unittest.TestCase):
+    def test_same_slot(self) -> None:
+        for slot in [0, 1, 100, 8191, 16383]:
+            key = cas_key_for_slot(slot)
+            self.assertTrue(key.startswith('__next_cas:{'))
+            self.assertEqual(slot, key_slot(key.encode()))
+
+        self.assertEqual(cas_key_for_slot(100), cas_key_for_slot(100))
+
+
+class TestRedisClusterClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis1 = redis.Redis()
+        self.redis2 = redis.Redis(port=6380)
+        for r in [self.redis1, self.redis2]:
+            r.flushall()
+            r.script_flush()
+
+        self.cluster = ClusterFake([
+            NodeFake(name='node1', client=self.redis1),
+            NodeFake(name='node2', client=self.redis2),
+        ])
+        self.client = RedisClusterClient(cast(Any, self.cluster), max_keys_per_batch=2)
+
+        self.key1 = find_key('key:a', True)
+        self.key2 = find_key('key:b', False)
+
+    def test_get_then_set_on_two_nodes(self) -> None:
+        pipe = self.client.pipeline()
+
+        fn1 = pipe.lease_get(self.key1)
+        fn2 = pipe.lease_get(self.key2)
+
+        resp1 = fn1.result()
+        resp2 = fn2.result()
+        self.assertEqual((LEASE_GRANTED, b'', 1, None), resp1)
+        self.assertEqual((LEASE_GRANTED, b'', 1, None), resp2)
+
+        # cas counter is local to the hash slot
+        slot1 = key_slot(self.key1.encode())
+        self.assertEqual(b'1', self.redis1.get(cas_key_for_slot(slot1)))
+        self.assertEqual(b'cas:1', self.redis2.get(self.key2))
+
+        set_fn1 = pipe.lease_set(self.key1, resp1[2], b'data 01')
+        set_fn2 = pipe.lease_set(self.key2, resp2[2] + 1, b'data 02')
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), set_fn1())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.CAS_MISMATCH), set_fn2())
+
+        self.assertEqual(b'val:data 01', self.redis1.get(self.key1))
+
+        fn1 = pipe.lease_get(self.key1)
+        self.assertEqual((FOUND, b'data 01', 0, None), fn1.result())
+
+        delete_fn1 = pipe.delete(self.key1)
+        delete_fn2 = pipe.delete(find_key('other', False))
+        self.assertEqual(DeleteResponse(status=DeleteStatus.OK), delete_fn1())
+        self.assertEqual(DeleteResponse(status=DeleteStatus.NOT_FOUND), delete_fn2())
+
+    def test_many_keys_exceed_batch(self) -> None:
+        pipe = self.client.pipeline()
+
+        keys = [f'user:{i}' for i in range(20)]
+        fn_list = [pipe.lease_get(k) for k in keys]
+
+        resp_list = [fn.result() for fn in fn_list]
+        for resp in resp_list:
+            self.assertEqual(LEASE_GRANTED, resp[0])
+
+        set_list = [pipe.lease_set(k, resp[2], k.encode()) for k, resp in zip(keys, resp_list)]
+        for set_fn in set_list:
+            self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), set_fn())
+
+        fn_list = [pipe.lease_get(k) for k in keys]
+        self.assertEqual([(FOUND, k.encode(), 0, None) for k in keys], [fn.result() for fn in fn_list])
+
+    def test_one_node_failed(self) -> None:
+        self.cluster.nodes[1] = NodeFake(name='node2', client=redis.Redis(port=6400))
+
+        pipe = self.client.pipeline()
+        fn1 = pipe.lease_get(self.key1)
+        fn2 = pipe.lease_get(self.key2)
+
+        self.assertEqual(LEASE_GRANTED, fn1.result()[0])
+
+        resp2 = fn2.result()
+        self.assertEqual(ERROR, resp2[0])
+        self.assertTrue(resp2[3] and resp2[3].startswith('Redis Get: '))
+
+    def test_slot_not_covered(self) -> None:
+        self.cluster.nodes[1] = None
+
+        pipe = self.client.pipeline()
+        fn1 = pipe.lease_get(self.key1)
+        fn2 = pipe.lease_get(self.key2)
+
+        resp1 = fn1.result()
+        self.assertEqual(ERROR, resp1[0])
+        self.assertTrue(resp1[3] and 'is not covered by any node' in resp1[3])
+        self.assertEqual(ERROR, fn2.result()[0])
+
+    def test_item(self) -> None:
+        fill_keys: List[int] = []
+
+        def filler(key: int) -> Promise[UserTest]:
+            fill_keys.append(key)
+            return lambda: UserTest(id=key, name=f'user:{key}', age=81)
+
+        for _ in range(2):
+            with self.client.pipeline() as pipe:
+                it = Item[UserTest, int](
+                    pipe=pipe,
+                    key_fn=lambda user_id: f'user:{user_id}',
+                    filler=filler,
+                    codec=new_json_codec(UserTest),
+                )
+                users = it.get_multi(list(range(10)))()
+                self.assertEqual([UserTest(id=i, name=f'user:{i}', age=81) for i in range(10)], users)
+
+        self.assertEqual(list(range(10)), fill_keys)
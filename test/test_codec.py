@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import datetime
+import os
+import unittest
+import zlib
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from memproxy import ItemCodec, CompressedCodec, new_json_codec, build_zdict, new_binary_codec
+from memproxy.codec import CODEC_MAGIC
+
+
+@dataclass
+class Product:
+    id: int
+    name: str
+    description: str
+
+
+def new_product(i: int) -> Product:
+    return Product(id=i, name=f'product:{i}', description='some long description of product ' * 10)
+
+
+class TestCompressedCodec(unittest.TestCase):
+    def test_small_data_not_compressed(self) -> None:
+        codec = CompressedCodec(new_json_codec(Product), threshold=1024)
+
+        data = codec.encode(Product(id=1, name='p1', description='desc'))
+        self.assertEqual(CODEC_MAGIC + b'\x00{"id": 1, "name": "p1", "description": "desc"}', data)
+        self.assertEqual(Product(id=1, name='p1', description='desc'), codec.decode(data))
+
+        self.assertEqual(0, codec.compress_count)
+        self.assertEqual(1, codec.encode_count)
+        self.assertEqual(1, codec.decode_count)
+
+    def test_compressed(self) -> None:
+        codec = CompressedCodec(new_json_codec(Product), threshold=100)
+
+        data = codec.encode(new_product(21))
+        self.assertEqual(CODEC_MAGIC + b'\x01', data[:4])
+        self.assertEqual(new_product(21), codec.decode(data))
+
+        self.assertEqual(1, codec.compress_count)
+        self.assertLess(codec.encoded_bytes, codec.raw_bytes)
+        self.assertLess(codec.compression_ratio, 0.5)
+        self.assertGreater(codec.encode_seconds, 0)
+        self.assertGreater(codec.decode_seconds, 0)
+
+    def test_with_zdict(self) -> None:
+        json_codec = new_json_codec(Product)
+        zdict = build_zdict([json_codec.encode(new_product(i)) for i in range(10)])
+
+        codec = CompressedCodec(json_codec, threshold=100, zdict=zdict)
+        no_dict_codec = CompressedCodec(json_codec, threshold=100)
+
+        data = codec.encode(new_product(31))
+        self.assertEqual(CODEC_MAGIC + b'\x02', data[:4])
+        self.assertEqual(new_product(31), codec.decode(data))
+
+        self.assertLess(len(data), len(no_dict_codec.encode(new_product(31))))
+
+        # can decode data compressed without dictionary
+        self.assertEqual(new_product(31), codec.decode(no_dict_codec.encode(new_product(31))))
+
+        with self.assertRaises(ValueError):
+            no_dict_codec.decode(data)
+
+        with self.assertRaises(zlib.error):
+            CompressedCodec(json_codec, zdict=b'other dict').decode(data)
+
+    def test_decode_data_without_header(self) -> None:
+        data = b'{"id": 1, "name": "p1", "description": "desc"}'
+
+        with self.assertRaises(ValueError):
+            CompressedCodec(new_json_codec(Product)).decode(data)
+
+        codec = CompressedCodec(new_json_codec(Product), legacy=True)
+        self.assertEqual(Product(id=1, name='p1', description='desc'), codec.decode(data))
+
+    def test_decode_legacy_data_starting_with_format_bytes(self) -> None:
+        codec: CompressedCodec[bytes] = CompressedCodec(
+            ItemCodec(encode=lambda x: x, decode=lambda d: d), legacy=True,
+        )
+
+        # e.g. binary codec data, its checksum prefix can start with any byte
+        for data in (b'\x00\x01data', b'\x01\x78\x9cdata', b'\x02data'):
+            self.assertEqual(data, codec.decode(data))
+
+        self.assertEqual(b'\x01data', codec.decode(codec.encode(b'\x01data')))
+
+    def test_decode_many(self) -> None:
+        codec = CompressedCodec(new_json_codec(Product), threshold=100)
+        assert codec.decode_many is not None
+
+        products = [new_product(1), Product(id=2, name='p2', description='desc')]
+        self.assertEqual(products, codec.decode_many([codec.encode(p) for p in products]))
+        self.assertEqual(2, codec.decode_count)
+
+        self.assertIsNone(CompressedCodec(ItemCodec(encode=lambda x: x, decode=lambda d: d)).decode_many)
+
+    def test_build_zdict_size(self) -> None:
+        self.assertEqual(b'cdef', build_zdict([b'ab', b'cd', b'ef'], size=4))
+
+
+@dataclass
+class Tag:
+    name: str
+    weight: float
+
+
+@dataclass
+class Category:
+    id: int
+    active: bool
+    data: bytes
+    tags: List[Tag]
+    parent: Optional[Category] = None
+    matrix: List[List[int]] = field(default_factory=list)
+    note: Optional[str] = None
+
+
+def new_category(i: int) -> Category:
+    return Category(
+        id=i, active=i % 2 == 0, data=b'\x00\x01 some data',
+        tags=[Tag(name=f'tag:{j}', weight=j * 1.5) for j in range(3)],
+        parent=Category(id=i + 1, active=True, data=b'', tags=[], note='parent'),
+        matrix=[[1, 2, -3], [], [2 ** 40]],
+    )
+
+
+class TestBinaryCodec(unittest.TestCase):
+    def test_encode_decode(self) -> None:
+        codec = new_binary_codec(Category)
+
+        c = new_category(21)
+        self.assertEqual(c, codec.decode(codec.encode(c)))
+
+        c = Category(id=-1, active=False, data=b'', tags=[], note='Unicode ✓')
+        self.assertEqual(c, codec.decode(codec.encode(c)))
+
+    def test_format(self) -> None:
+        codec = new_binary_codec(Tag)
+
+        data = codec.encode(Tag(name='ab', weight=2.0))
+        self.assertEqual(4 + 4 + 2 + 8, len(data))
+        self.assertEqual(b'\x02\x00\x00\x00ab', data[4:10])
+
+    def test_schema_checksum(self) -> None:
+        # must not change between python versions, cached data would be rejected
+        self.assertEqual(b'\x97\xb2\xc4O', new_binary_codec(Tag).encode(Tag(name='ab', weight=2.0))[:4])
+        self.assertEqual(b'\x93\x15M\x1c', new_binary_codec(Category).encode(new_category(21))[:4])
+
+    def test_schema_changed(self) -> None:
+        @dataclass
+        class Tag2:
+            weight: float
+            name: str
+
+        data = new_binary_codec(Tag).encode(Tag(name='ab', weight=2.0))
+
+        with self.assertRaises(ValueError):
+            new_binary_codec(Tag2).decode(data)
+
+    def test_trailing_bytes(self) -> None:
+        codec = new_binary_codec(Tag)
+        with self.assertRaises(ValueError):
+            codec.decode(codec.encode(Tag(name='ab', weight=2.0)) + b'x')
+
+    def test_unsupported_type(self) -> None:
+        @dataclass
+        class WithDict:
+            values: dict
+
+        with self.assertRaises(ValueError):
+            new_binary_codec(WithDict)
+
+        with self.assertRaises(ValueError):
+            new_binary_codec(int)
+
+
+class TestBinaryCodecBenchmark(unittest.TestCase):
+    def test_run(self) -> None:
+        num_loops = 20
+        env = os.getenv("LOOP_MUL")
+        if env:
+            num_loops *= int(env)
+
+        # new_json_codec does not support nested dataclasses on decode
+        json_codec = new_json_codec(Tag)
+        binary_codec = new_binary_codec(Tag)
+
+        for name, codec in [('JSON', json_codec), ('BINARY', binary_codec)]:
+            values = [Tag(name=f'tag:{i}', weight=i * 1.5) for i in range(1000)]
+
+            start = datetime.datetime.now()
+            encoded = []
+            for _ in range(num_loops):
+                encoded = [codec.encode(v) for v in values]
+            encode_duration = datetime.datetime.now() - start
+
+            start = datetime.datetime.now()
+            for _ in range(num_loops):
+                for d in encoded:
+                    codec.decode(d)
+            decode_duration = datetime.datetime.now() - start
+
+            print(f'{name} (1000 values): ENCODE {(encode_duration / num_loops).microseconds / 1000.0}ms, '
+                  f'DECODE {(decode_duration / num_loops).microseconds / 1000.0}ms')
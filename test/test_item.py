@@ -3,16 +3,20 @@ from __future__ import annotations
 import cProfile
 import datetime
 import os
+import threading
+import time
 import unittest
+from concurrent.futures import Executor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Union, Callable
+from typing import List, Union, Callable, Optional
 
 import redis
 
 from memproxy import Item, RedisClient, Promise, new_json_codec, ItemCodec, new_multi_get_filler
-from memproxy import LeaseGetResult
+from memproxy import LeaseGetResult, NOT_FOUND
 from memproxy import Pipeline, Session, DeleteResponse, LeaseSetResponse, LeaseGetResponse, FillerFunc
 from memproxy.memproxy import LeaseGetResultFunc
+from memproxy.item import NEGATIVE_ENTRY
 
 
 @dataclass
@@ -53,9 +57,9 @@ class CapturedPipeline(Pipeline):
 
         return LeaseGetResultFunc(lease_get_func)
 
-    def lease_set(self, key: str, cas: int, data: bytes) -> Promise[LeaseSetResponse]:
+    def lease_set(self, key: str, cas: int, data: bytes, negative: bool = False) -> Promise[LeaseSetResponse]:
         self.set_inputs.append(SetInput(key, cas, data))
-        fn = self.pipe.lease_set(key, cas, data)
+        fn = self.pipe.lease_set(key, cas, data, negative)
 
         def lease_set_func() -> LeaseSetResponse:
             self.set_inputs.append(f'{key}:func')
@@ -162,6 +166,35 @@ class TestItemIntegration(unittest.TestCase):
         self.assertEqual(0, it.cache_error_count)
         self.assertEqual(2 * len(b'{"id": 21, "name": "user-data:21", "age": 81}'), it.bytes_read)
 
+    def test_get_same_key_in_one_stage(self) -> None:
+        it = self.it
+
+        user_fn1 = it.get(21)
+        user_fn2 = it.get(22)
+        user_fn3 = it.get(21)
+        multi_fn = it.get_multi([22, 23, 23])
+
+        u21 = UserTest(id=21, name='user-data:21', age=81)
+        u22 = UserTest(id=22, name='user-data:22', age=81)
+        u23 = UserTest(id=23, name='user-data:23', age=81)
+
+        self.assertEqual(u21, user_fn1())
+        self.assertEqual(u22, user_fn2())
+        self.assertEqual(u21, user_fn3())
+        self.assertEqual([u22, u23, u23], multi_fn())
+
+        self.assertEqual([21, 22, 23], self.fill_keys)
+        self.assertEqual([
+            'user:21', 'user:22', 'user:23',
+            'user:21:func', 'user:22:func', 'user:23:func',
+        ], self.pipe.get_keys)
+        self.assertEqual(3, it.fill_count)
+
+        # keys are fetched again in the next stage
+        self.assertEqual(u21, it.get(21)())
+        self.assertEqual(u21, it.get(21)())
+        self.assertEqual(2, it.hit_count)
+
     def test_get_multi(self) -> None:
         it = self.it
 
@@ -287,6 +320,353 @@ class TestItemIntegration(unittest.TestCase):
         self.assertEqual(UserTest(id=21, name='user-data:21', age=81), user_fn1())
 
 
+class TestItemLeaseWait(unittest.TestCase):
+    fill_keys: List[int]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.client = RedisClient(self.redis_client, lease_wait=True)
+        self.fill_keys = []
+
+    def filler_func(self, key: int) -> Promise[UserTest]:
+        self.fill_keys.append(key)
+        return lambda: UserTest(id=key, name=f'user-data:{key}', age=81)
+
+    def new_item(self) -> Item[UserTest, int]:
+        pipe = self.client.pipeline()
+        self.addCleanup(pipe.finish)
+
+        return Item[UserTest, int](
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=new_json_codec(UserTest),
+            lease_wait_durations=[0.01] * 10,
+        )
+
+    def test_wait_for_lease_holder(self) -> None:
+        # another client holds the lease
+        holder = self.client.pipeline()
+        self.addCleanup(holder.finish)
+        cas = holder.lease_get('user:21').result()[2]
+
+        timer = threading.Timer(0.03, lambda: holder.lease_set(
+            'user:21', cas, new_json_codec(UserTest).encode(UserTest(id=21, name='holder', age=82)),
+        )())
+        timer.start()
+        self.addCleanup(timer.join)
+
+        it = self.new_item()
+        fn1 = it.get(21)
+        fn2 = it.get(22)
+
+        self.assertEqual(UserTest(id=21, name='holder', age=82), fn1())
+        self.assertEqual(UserTest(id=22, name='user-data:22', age=81), fn2())
+
+        self.assertEqual([22], self.fill_keys)
+        self.assertGreater(it.lease_wait_count, 0)
+        self.assertEqual(1, it.hit_count)
+
+    def test_lease_never_released(self) -> None:
+        self.redis_client.set('user:21', b'cas:15')
+        self.redis_client.set('user:22', b'cas:16')
+
+        it = self.new_item()
+        users = it.get_multi([21, 22])()
+
+        self.assertEqual([
+            UserTest(id=21, name='user-data:21', age=81),
+            UserTest(id=22, name='user-data:22', age=81),
+        ], users)
+
+        self.assertEqual([21, 22], self.fill_keys)
+        self.assertEqual(20, it.lease_wait_count)
+
+        # not set back
+        self.assertEqual(b'cas:15', self.redis_client.get('user:21'))
+
+
+class TestItemEarlyRefresh(unittest.TestCase):
+    fill_keys: List[int]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.client = RedisClient(self.redis_client, early_refresh_delta=1e6, min_ttl=60, max_ttl=60)
+        self.fill_keys = []
+
+    def filler_func(self, key: int) -> Promise[UserTest]:
+        self.fill_keys.append(key)
+        return lambda: UserTest(id=key, name=f'user-data:{key}', age=82)
+
+    def test_refresh_after_finish(self) -> None:
+        codec = new_json_codec(UserTest)
+        self.redis_client.set('user:21', b'val:' + codec.encode(UserTest(id=21, name='old', age=81)), px=5000)
+
+        pipe = self.client.pipeline()
+        it = Item[UserTest, int](
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=codec,
+        )
+
+        # current value is returned, filler is not called yet
+        self.assertEqual(UserTest(id=21, name='old', age=81), it.get(21)())
+        self.assertEqual([], self.fill_keys)
+        self.assertEqual(1, it.refresh_count)
+
+        pipe.finish()
+
+        self.assertEqual([21], self.fill_keys)
+
+        data = self.redis_client.get('user:21')
+        assert isinstance(data, bytes)
+        self.assertEqual(UserTest(id=21, name='user-data:21', age=82), codec.decode(data[len(b'val:'):]))
+        self.assertGreater(self.redis_client.ttl('user:21'), 50)
+
+    def test_refresh_calls_lease_set_promise(self) -> None:
+        codec = new_json_codec(UserTest)
+        self.redis_client.set('user:21', b'val:' + codec.encode(UserTest(id=21, name='old', age=81)), px=5000)
+
+        pipe = CapturedPipeline(self.client.pipeline())
+        it = Item[UserTest, int](
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=codec,
+        )
+
+        self.assertEqual(UserTest(id=21, name='old', age=81), it.get(21)())
+        pipe.finish()
+
+        # wrapper pipelines doing their work in the promise are not skipped
+        self.assertEqual(2, len(pipe.set_inputs))
+        self.assertEqual('user:21:func', pipe.set_inputs[1])
+
+
+class TestItemFillExecutor(unittest.TestCase):
+    fill_threads: List[int]
+    barrier: Optional[threading.Barrier]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.pipe = RedisClient(self.redis_client).pipeline()
+        self.addCleanup(self.pipe.finish)
+
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+        self.fill_threads = []
+        self.barrier = None
+
+    def fill_multi(self, keys: List[int]) -> List[UserTest]:
+        self.fill_threads.append(threading.get_ident())
+        if self.barrier is not None:
+            # fails if the fillers are not running concurrently
+            self.barrier.wait(timeout=5)
+        return [UserTest(id=k, name=f'user:{k}', age=81) for k in keys]
+
+    def new_item(self, prefix: str, fill_executor: Optional[Executor]) -> Item[UserTest, int]:
+        return Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'{prefix}:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=self.fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: UserTest(id=0, name='', age=0),
+            ),
+            codec=new_json_codec(UserTest),
+            fill_executor=fill_executor,
+        )
+
+    def get_from_items(self, fill_executor: Optional[Executor]) -> None:
+        it1 = self.new_item('user', fill_executor)
+        it2 = self.new_item('product', fill_executor)
+
+        fn1 = it1.get_multi([21, 22])
+        fn2 = it2.get(23)
+        fn3 = it2.get(24)
+
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=22, name='user:22', age=81),
+        ], fn1())
+        self.assertEqual(UserTest(id=23, name='user:23', age=81), fn2())
+        self.assertEqual(UserTest(id=24, name='user:24', age=81), fn3())
+
+        # filled values are set back to the cache
+        self.assertEqual(b'val:{"id": 22, "name": "user:22", "age": 81}', self.redis_client.get('user:22'))
+        self.assertEqual(b'val:{"id": 24, "name": "user:24", "age": 81}', self.redis_client.get('product:24'))
+
+        self.assertEqual(2, it1.fill_count)
+        self.assertEqual(2, it2.fill_count)
+
+        # get again from cache
+        self.assertEqual(UserTest(id=23, name='user:23', age=81), it2.get(23)())
+        self.assertEqual(1, it2.hit_count)
+
+    def test_sequential(self) -> None:
+        self.get_from_items(None)
+        self.assertEqual([threading.get_ident()] * 2, self.fill_threads)
+
+    def test_with_executor(self) -> None:
+        self.barrier = threading.Barrier(2)
+        self.get_from_items(self.executor)
+        self.assertEqual(2, len(set(self.fill_threads)))
+        self.assertNotIn(threading.get_ident(), self.fill_threads)
+
+    def test_per_key_fillers_concurrently(self) -> None:
+        barrier = threading.Barrier(3)
+
+        def filler(key: int) -> Promise[UserTest]:
+            def fill_fn() -> UserTest:
+                self.fill_threads.append(threading.get_ident())
+                barrier.wait(timeout=5)
+                return UserTest(id=key, name=f'user:{key}', age=81)
+            return fill_fn
+
+        it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=filler,
+            codec=new_json_codec(UserTest),
+            fill_executor=self.executor,
+        )
+
+        self.assertEqual(
+            [UserTest(id=k, name=f'user:{k}', age=81) for k in [21, 22, 23]],
+            it.get_multi([21, 22, 23])(),
+        )
+        self.assertEqual(3, len(set(self.fill_threads)))
+        self.assertEqual(b'val:{"id": 23, "name": "user:23", "age": 81}', self.redis_client.get('user:23'))
+
+
+class TestItemNegativeCache(unittest.TestCase):
+    fill_keys: List[List[int]]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.pipe = RedisClient(self.redis_client, negative_min_ttl=30, negative_max_ttl=60).pipeline()
+        self.addCleanup(self.pipe.finish)
+
+        self.fill_keys = []
+
+        self.it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=self.fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: NOT_FOUND,
+            ),
+            codec=new_json_codec(UserTest),
+            negative_value=lambda: UserTest(id=0, name='', age=0),
+        )
+
+    def fill_multi(self, keys: List[int]) -> List[UserTest]:
+        self.fill_keys.append(keys)
+        # only keys less than 100 exist, key 0 is a row equal to the negative value
+        return [UserTest(id=k, name=f'user:{k}' if k else '', age=81 if k else 0) for k in keys if k < 100]
+
+    def test_normal(self) -> None:
+        it = self.it
+
+        u21 = UserTest(id=21, name='user:21', age=81)
+        not_found = UserTest(id=0, name='', age=0)
+
+        self.assertEqual(u21, it.get(21)())
+        self.assertEqual(not_found, it.get(121)())
+
+        self.assertEqual(b'val:' + NEGATIVE_ENTRY, self.redis_client.get('user:121'))
+        self.assertLessEqual(self.redis_client.ttl('user:121'), 60)
+        self.assertEqual(b'val:{"id": 21, "name": "user:21", "age": 81}', self.redis_client.get('user:21'))
+
+        # get again
+        self.assertEqual(not_found, it.get(121)())
+        self.assertEqual(u21, it.get(21)())
+
+        self.assertEqual([[21], [121]], self.fill_keys)
+        self.assertEqual(2, it.hit_count)
+        self.assertEqual(1, it.negative_hit_count)
+        self.assertEqual(2, it.fill_count)
+
+    def test_get_multi(self) -> None:
+        it = self.it
+
+        u21 = UserTest(id=21, name='user:21', age=81)
+        u22 = UserTest(id=22, name='user:22', age=81)
+        not_found = UserTest(id=0, name='', age=0)
+
+        self.assertEqual([u21, not_found, u22, not_found], it.get_multi([21, 121, 22, 122])())
+        self.assertEqual([u21, not_found, u22, not_found], it.get_multi([21, 121, 22, 122])())
+
+        self.assertEqual([[21, 121, 22, 122]], self.fill_keys)
+        self.assertEqual(4, it.hit_count)
+        self.assertEqual(2, it.negative_hit_count)
+        self.assertEqual(0, it.decode_error_count)
+
+    def test_disabled(self) -> None:
+        it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=self.fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: UserTest(id=0, name='', age=0),
+            ),
+            codec=new_json_codec(UserTest),
+        )
+
+        it.get(121)()
+        self.assertEqual(b'val:{"id": 0, "name": "", "age": 0}', self.redis_client.get('user:121'))
+        self.assertGreater(self.redis_client.ttl('user:121'), 60)
+        self.assertEqual(0, it.negative_hit_count)
+
+    def test_value_equal_to_negative_value(self) -> None:
+        # an existing entity equal to the value of not found keys
+        self.assertEqual(UserTest(id=0, name='', age=0), self.it.get(0)())
+        self.assertEqual(b'val:{"id": 0, "name": "", "age": 0}', self.redis_client.get('user:0'))
+        self.assertGreater(self.redis_client.ttl('user:0'), 60)
+
+        self.assertEqual(UserTest(id=0, name='', age=0), self.it.get(0)())
+        self.assertEqual(1, self.it.hit_count)
+        self.assertEqual(0, self.it.negative_hit_count)
+
+    def test_empty_data_not_negative(self) -> None:
+        self.redis_client.set('user:21', b'val:')
+
+        self.assertEqual(UserTest(id=21, name='user:21', age=81), self.it.get(21)())
+        self.assertEqual(0, self.it.negative_hit_count)
+        self.assertEqual(1, self.it.decode_error_count)
+
+    def test_not_found_without_negative_value(self) -> None:
+        it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=self.fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: NOT_FOUND,
+            ),
+            codec=new_json_codec(UserTest),
+        )
+
+        with self.assertRaises(ValueError):
+            it.get(121)()
+
+
 class TestItemRedisError(unittest.TestCase):
     fill_keys: List[int]
     age: int
@@ -508,6 +888,68 @@ class TestMultiGetFiller(unittest.TestCase):
         ], self.fill_keys)
 
 
+    def test_duplicated_keys(self) -> None:
+        f = self.new_filler()
+
+        u1 = UserTest(id=21, name='user01', age=71)
+        self.return_users = [u1]
+
+        fn1 = f(21)
+        fn2 = f(22)
+        fn3 = f(21)
+
+        self.assertEqual(u1, fn1())
+        self.assertEqual(UserTest(id=0, name='', age=0), fn2())
+        self.assertEqual(u1, fn3())
+
+        self.assertEqual([[21, 22]], self.fill_keys)
+
+    def test_max_batch_size(self) -> None:
+        f = new_multi_get_filler(
+            fill_func=self.fill_func,
+            get_key_func=UserTest.get_key,
+            default=self.default,
+            max_batch_size=2,
+        )
+
+        users = [UserTest(id=i, name=f'user{i}', age=70 + i) for i in range(21, 26)]
+        self.return_users = users
+
+        fn_list = [f(i) for i in range(21, 26)]
+        fn_list.append(f(22))
+
+        self.assertEqual(users + [users[1]], [fn() for fn in fn_list])
+        self.assertEqual([[21, 22], [23, 24], [25]], self.fill_keys)
+
+    def test_max_batch_size__with_executor(self) -> None:
+        executor = ThreadPoolExecutor(max_workers=3)
+        self.addCleanup(executor.shutdown)
+
+        chunk_threads: List[int] = []
+
+        def fill_func(keys: List[int]) -> List[UserTest]:
+            chunk_threads.append(threading.get_ident())
+            self.fill_keys.append(keys)
+            return [UserTest(id=k, name=f'user{k}', age=70 + k) for k in keys]
+
+        f = new_multi_get_filler(
+            fill_func=fill_func,
+            get_key_func=UserTest.get_key,
+            default=self.default,
+            max_batch_size=2,
+            executor=executor,
+        )
+
+        fn_list = [f(i) for i in range(21, 27)]
+
+        self.assertEqual(
+            [UserTest(id=i, name=f'user{i}', age=70 + i) for i in range(21, 27)],
+            [fn() for fn in fn_list],
+        )
+
+        self.assertEqual([[21, 22], [23, 24], [25, 26]], sorted(self.fill_keys))
+        self.assertNotIn(threading.get_ident(), chunk_threads)
+
 class TestItemGetMulti(unittest.TestCase):
     fill_keys: List[List[int]]
     age: int
@@ -564,3 +1006,135 @@ class TestItemGetMulti(unittest.TestCase):
             'user:21:func', 'user:22:func', 'user:23:func',
             'user:24:func', 'user:25:func',
         ], self.pipe.get_keys)
+
+    def new_counting_item(self, decode_many_calls: List[int]) -> Item[UserTest, int]:
+        json_codec = new_json_codec(UserTest)
+        assert json_codec.decode_many is not None
+        decode_many = json_codec.decode_many
+
+        def counting_decode_many(data_list: List[bytes]) -> List[UserTest]:
+            decode_many_calls.append(len(data_list))
+            return decode_many(data_list)
+
+        return Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=self.fill_multi,
+                get_key_func=UserTest.get_key,
+                default=lambda: UserTest(id=0, name='', age=0),
+            ),
+            codec=ItemCodec(
+                encode=json_codec.encode, decode=json_codec.decode,
+                decode_many=counting_decode_many,
+            ),
+        )
+
+    def test_decode_many_for_hits(self) -> None:
+        calls: List[int] = []
+        it = self.new_counting_item(calls)
+
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=22, name='user:22', age=81),
+        ], it.get_multi([21, 22])())
+        self.assertEqual([], calls)
+
+        # mixed hits & misses
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=23, name='user:23', age=81),
+            UserTest(id=22, name='user:22', age=81),
+        ], it.get_multi([21, 23, 22])())
+
+        self.assertEqual([2], calls)
+        self.assertEqual([[21, 22], [23]], self.fill_keys)
+        self.assertEqual(2, it.hit_count)
+        self.assertEqual(3, it.fill_count)
+        self.assertEqual(
+            len(b'{"id": 21, "name": "user:21", "age": 81}') * 2,
+            it.bytes_read,
+        )
+
+    def test_decode_many_error_fallback_to_decode(self) -> None:
+        calls: List[int] = []
+        it = self.new_counting_item(calls)
+
+        it.get_multi([21, 22, 23])()
+        self.redis.set('user:22', b'val:{"id": 22')
+
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=22, name='user:22', age=81),
+            UserTest(id=23, name='user:23', age=81),
+        ], it.get_multi([21, 22, 23])())
+
+        self.assertEqual([3], calls)
+        self.assertEqual(1, it.decode_error_count)
+        self.assertEqual([[21, 22, 23], [22]], self.fill_keys)
+
+    def test_without_decode_many(self) -> None:
+        json_codec = new_json_codec(UserTest)
+        it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.it._conf.filler,
+            codec=ItemCodec(encode=json_codec.encode, decode=json_codec.decode),
+        )
+
+        it.get_multi([21, 22])()
+        self.assertEqual([
+            UserTest(id=21, name='user:21', age=81),
+            UserTest(id=22, name='user:22', age=81),
+        ], it.get_multi([21, 22])())
+        self.assertEqual(2, it.hit_count)
+        self.assertEqual(2, it.fill_count)
+
+
+class TestItemGetMultiBenchmark(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis = redis.Redis()
+        self.redis.flushall()
+        self.redis.script_flush()
+
+        c = RedisClient(self.redis, max_keys_per_batch=200)
+        self.pipe = c.pipeline()
+        self.addCleanup(self.pipe.finish)
+
+    def run_get_multi(self, codec: ItemCodec[UserTest], num_loops: int) -> float:
+        it = Item[UserTest, int](
+            pipe=self.pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=new_multi_get_filler(
+                fill_func=lambda keys: [UserTest(id=k, name=f'user:{k}', age=81) for k in keys],
+                get_key_func=UserTest.get_key,
+                default=lambda: UserTest(id=0, name='', age=0),
+            ),
+            codec=codec,
+        )
+        keys = list(range(1000))
+        it.get_multi(keys)()
+
+        start = datetime.datetime.now()
+        for _ in range(num_loops):
+            it.get_multi(keys)()
+        duration = datetime.datetime.now() - start
+
+        self.assertEqual(num_loops * len(keys), it.hit_count)
+        return duration.total_seconds() * 1000.0 / num_loops
+
+    def test_run(self) -> None:
+        num_loops = 20
+        env = os.getenv("LOOP_MUL")
+        if env:
+            num_loops *= int(env)
+
+        json_codec = new_json_codec(UserTest)
+
+        single = self.run_get_multi(
+            ItemCodec(encode=json_codec.encode, decode=json_codec.decode), num_loops,
+        )
+        self.redis.flushall()
+        batch = self.run_get_multi(json_codec, num_loops)
+
+        print(f'GET MULTI 1000 KEYS: decode={single:.3f}ms, decode_many={batch:.3f}ms')
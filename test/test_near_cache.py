@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import unittest
+from dataclasses import dataclass
+from typing import List
+
+import redis
+
+from memproxy import Item, RedisClient, Promise, new_json_codec
+from memproxy import NearCache, NearCacheClient, EvictionPolicy
+from memproxy import LeaseSetResponse, LeaseSetStatus, DeleteResponse, DeleteStatus
+from memproxy.near_cache import VERSION_BUCKETS
+
+
+@dataclass
+class UserTest:
+    id: int
+    name: str
+
+
+def key_of_other_version(key: str) -> str:
+    """Returns a key that does not share the invalidation version with the key."""
+    i = 0
+    while True:
+        other = f'other:{i}'
+        if hash(other) % VERSION_BUCKETS != hash(key) % VERSION_BUCKETS:
+            return other
+        i += 1
+
+
+class TestNearCache(unittest.TestCase):
+    now: float
+
+    def setUp(self) -> None:
+        self.now = 100.0
+
+    def now_func(self) -> float:
+        return self.now
+
+    def new_cache(self, **kwargs) -> NearCache:
+        return NearCache(now_func=self.now_func, **kwargs)
+
+    def test_get_put(self) -> None:
+        c = self.new_cache()
+
+        self.assertIsNone(c.get('key01'))
+
+        self.assertTrue(c.put_if('key01', b'data 01', c.version('key01')))
+        self.assertEqual(b'data 01', c.get('key01'))
+
+        self.assertEqual(1, len(c))
+        self.assertEqual(len('key01') + len(b'data 01'), c.total_bytes)
+        self.assertEqual(1, c.hit_count)
+        self.assertEqual(1, c.miss_count)
+
+    def test_expired(self) -> None:
+        c = self.new_cache(ttl=10.0)
+        c.put_if('key01', b'data 01', c.version('key01'))
+
+        self.now = 109.9
+        self.assertEqual(b'data 01', c.get('key01'))
+
+        self.now = 110.0
+        self.assertIsNone(c.get('key01'))
+        self.assertEqual(0, len(c))
+        self.assertEqual(0, c.total_bytes)
+
+    def test_invalidate(self) -> None:
+        c = self.new_cache()
+        c.put_if('key01', b'data 01', c.version('key01'))
+
+        version = c.version('key01')
+        c.invalidate('key01')
+        self.assertIsNone(c.get('key01'))
+
+        # put with version observed before invalidation
+        self.assertFalse(c.put_if('key01', b'data 02', version))
+        self.assertIsNone(c.get('key01'))
+
+        self.assertTrue(c.put_if('key01', b'data 03', c.version('key01')))
+        self.assertEqual(b'data 03', c.get('key01'))
+
+    def test_invalidate_other_key(self) -> None:
+        c = self.new_cache()
+        key02 = key_of_other_version('key01')
+
+        version = c.version(key02)
+        c.invalidate('key01')
+
+        # in-flight reads of keys of other versions are still put
+        self.assertTrue(c.put_if(key02, b'data 02', version))
+        self.assertEqual(b'data 02', c.get(key02))
+
+    def test_lru_max_entries(self) -> None:
+        c = self.new_cache(max_entries=2)
+        c.put_if('key01', b'A', c.version('key01'))
+        c.put_if('key02', b'B', c.version('key02'))
+
+        self.assertEqual(b'A', c.get('key01'))
+
+        c.put_if('key03', b'C', c.version('key03'))
+
+        self.assertEqual(b'A', c.get('key01'))
+        self.assertIsNone(c.get('key02'))
+        self.assertEqual(b'C', c.get('key03'))
+        self.assertEqual(1, c.evict_count)
+
+    def test_lru_max_bytes(self) -> None:
+        c = self.new_cache(max_bytes=20)
+        c.put_if('k1', b'A' * 8, c.version('k1'))
+        c.put_if('k2', b'B' * 8, c.version('k2'))
+
+        self.assertEqual(2, len(c))
+
+        c.put_if('k3', b'C' * 8, c.version('k3'))
+        self.assertIsNone(c.get('k1'))
+        self.assertEqual(b'B' * 8, c.get('k2'))
+        self.assertEqual(20, c.total_bytes)
+
+        # too big
+        self.assertFalse(c.put_if('k4', b'D' * 20, c.version('k4')))
+        self.assertEqual(2, len(c))
+
+    def test_lfu(self) -> None:
+        c = self.new_cache(max_entries=2, policy=EvictionPolicy.LFU)
+        c.put_if('key01', b'A', c.version('key01'))
+        c.put_if('key02', b'B', c.version('key02'))
+
+        c.get('key01')
+        c.get('key01')
+        c.get('key02')
+
+        c.put_if('key03', b'C', c.version('key03'))
+        self.assertEqual(b'A', c.get('key01'))
+        self.assertIsNone(c.get('key02'))
+
+        c.put_if('key04', b'D', c.version('key04'))
+        self.assertEqual(b'A', c.get('key01'))
+        self.assertIsNone(c.get('key03'))
+        self.assertEqual(b'D', c.get('key04'))
+
+    def test_clear(self) -> None:
+        c = self.new_cache()
+        version = c.version('key01')
+        c.put_if('key01', b'A', version)
+
+        c.clear()
+        self.assertEqual(0, len(c))
+        self.assertFalse(c.put_if('key01', b'A', version))
+
+
+class TestNearCacheClient(unittest.TestCase):
+    fill_keys: List[int]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.cache = NearCache()
+        self.client = NearCacheClient(RedisClient(self.redis_client), self.cache)
+
+        self.fill_keys = []
+
+    def filler_func(self, key: int) -> Promise[UserTest]:
+        self.fill_keys.append(key)
+        return lambda: UserTest(id=key, name=f'user:{key}')
+
+    def new_item(self) -> Item[UserTest, int]:
+        pipe = self.client.pipeline()
+        self.addCleanup(pipe.finish)
+
+        return Item(
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=new_json_codec(UserTest),
+        )
+
+    def test_lease_get_and_set(self) -> None:
+        pipe = self.client.pipeline()
+
+        resp = pipe.lease_get('key01').result()
+        self.assertEqual(2, resp[0])
+
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe.lease_set('key01', resp[2], b'data 01')())
+        self.assertEqual(b'data 01', self.cache.get('key01'))
+
+        # served from near cache
+        self.redis_client.set('key01', b'val:data 02')
+        self.assertEqual((1, b'data 01', 0, None), pipe.lease_get('key01').result())
+
+    def test_lease_get_found_put_into_near_cache(self) -> None:
+        self.redis_client.set('key01', b'val:data 01')
+
+        pipe = self.client.pipeline()
+        self.assertEqual((1, b'data 01', 0, None), pipe.lease_get('key01').result())
+
+        self.assertEqual(b'data 01', self.cache.get('key01'))
+
+    def test_delete_invalidates(self) -> None:
+        self.redis_client.set('key01', b'val:data 01')
+
+        pipe = self.client.pipeline()
+        pipe.lease_get('key01').result()
+
+        delete_fn = pipe.delete('key01')
+        self.assertIsNone(self.cache.get('key01'))
+        self.assertEqual(DeleteResponse(status=DeleteStatus.OK), delete_fn())
+
+        resp = pipe.lease_get('key01').result()
+        self.assertEqual(2, resp[0])
+
+    def test_get_in_same_stage_as_delete(self) -> None:
+        self.redis_client.set('key01', b'val:data 01')
+
+        pipe = self.client.pipeline()
+        delete_fn = pipe.delete('key01')
+        get_fn = pipe.lease_get('key01')
+
+        # get is executed before delete in the same stage
+        self.assertEqual((1, b'data 01', 0, None), get_fn.result())
+        delete_fn()
+
+        self.assertIsNone(self.cache.get('key01'))
+
+    def test_get_during_delete_of_other_key(self) -> None:
+        key02 = key_of_other_version('key01')
+        self.redis_client.set(key02, b'val:data 02')
+
+        pipe = self.client.pipeline()
+        get_fn = pipe.lease_get(key02)
+
+        delete_pipe = self.client.pipeline()
+        delete_pipe.delete('key01')()
+
+        self.assertEqual((1, b'data 02', 0, None), get_fn.result())
+        self.assertEqual(b'data 02', self.cache.get(key02))
+
+    def test_item(self) -> None:
+        it = self.new_item()
+
+        self.assertEqual(UserTest(id=21, name='user:21'), it.get(21)())
+        self.assertEqual([21], self.fill_keys)
+
+        self.redis_client.flushall()
+
+        it = self.new_item()
+        self.assertEqual(UserTest(id=21, name='user:21'), it.get(21)())
+        self.assertEqual([21], self.fill_keys)
+        self.assertEqual(1, it.hit_count)
@@ -1,3 +1,5 @@
+import datetime
+import os
 import unittest
 from dataclasses import dataclass
 from typing import List, Dict, Any
@@ -12,6 +14,7 @@ from memproxy import LeaseSetStatus, DeleteStatus
 FOUND = 1
 LEASE_GRANTED: int = 2
 ERROR = 3
+LEASE_HELD = 4
 
 
 def lease_get_resp(status: int, data: bytes, cas: int, error: Optional[str] = None) -> LeaseGetResponse:
@@ -329,6 +332,163 @@ class TestRedisClient(unittest.TestCase):
         ), resp)
 
 
+    def test_mixed_stage_in_one_round_trip(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client)
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        resp = pipe.lease_get('key01').result()
+        self.redis_client.set('key03', b'val:data03')
+
+        self.redis_client.config_resetstat()
+
+        fn2 = pipe.lease_get('key02')
+        set_fn1 = pipe.lease_set('key01', resp[2], b'data01')
+        delete_fn3 = pipe.delete('key03')
+
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=2), fn2.result())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), set_fn1())
+        self.assertEqual(DeleteResponse(status=DeleteStatus.OK), delete_fn3())
+
+        stats = self.redis_client.info('commandstats')
+        self.assertEqual(2, stats['cmdstat_evalsha']['calls'])
+        self.assertEqual(1, stats['cmdstat_del']['calls'])
+        # two SCRIPT LOAD, without SCRIPT EXISTS
+        self.assertEqual(2, stats['cmdstat_script']['calls'])
+
+        # scripts are loaded only once per client
+        self.redis_client.config_resetstat()
+
+        pipe.lease_get('key04')
+        pipe.delete('key05')()
+
+        stats = self.redis_client.info('commandstats')
+        self.assertEqual(1, stats['cmdstat_evalsha']['calls'])
+        self.assertNotIn('cmdstat_script', stats)
+
+    def test_mixed_stage__flush_script_in_between(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client)
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        fn1 = pipe.lease_get('key01')
+        pipe.delete('key02')
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=1), fn1.result())
+
+        self.redis_client.script_flush()
+        self.redis_client.set('key03', b'val:data03')
+
+        fn1 = pipe.lease_get('key01')
+        fn3 = pipe.lease_get('key03')
+        delete_fn = pipe.delete('key02')
+
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=1), fn1.result())
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'data03', cas=0), fn3.result())
+        self.assertEqual(DeleteResponse(status=DeleteStatus.NOT_FOUND), delete_fn())
+
+    def test_set_negative_entry(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client, negative_min_ttl=30, negative_max_ttl=40)
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        resp1 = pipe.lease_get('key01').result()
+        resp2 = pipe.lease_get('key02').result()
+        resp3 = pipe.lease_get('key03').result()
+
+        pipe.lease_set('key01', resp1[2], b'', negative=True)
+        pipe.lease_set('key03', resp3[2], b'')
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe.lease_set('key02', resp2[2], b'data02')())
+
+        self.assertEqual(b'val:', self.redis_client.get('key01'))
+        ttl = self.redis_client.ttl('key01')
+        self.assertGreaterEqual(ttl, 29)
+        self.assertLessEqual(ttl, 40)
+
+        self.assertGreater(self.redis_client.ttl('key02'), 6 * 3600 - 10)
+
+        # empty data without the flag is a normal value
+        self.assertEqual(b'val:', self.redis_client.get('key03'))
+        self.assertGreater(self.redis_client.ttl('key03'), 6 * 3600 - 10)
+
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'', cas=0), pipe.lease_get('key01').result())
+
+    def test_lease_wait(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client, lease_wait=True)
+
+        pipe1 = c.pipeline()
+        self.addCleanup(pipe1.finish)
+        pipe2 = c.pipeline()
+        self.addCleanup(pipe2.finish)
+
+        resp = pipe1.lease_get('key01').result()
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=1), resp)
+
+        self.assertEqual(lease_get_resp(status=LEASE_HELD, data=b'', cas=1), pipe2.lease_get('key01').result())
+
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe1.lease_set('key01', 1, b'data01')())
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'data01', cas=0), pipe2.lease_get('key01').result())
+
+    def test_lease_wait__mget_first(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client, lease_wait=True, mget_first=True)
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        self.redis_client.set('key01', b'cas:15')
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        self.assertEqual(lease_get_resp(status=LEASE_HELD, data=b'', cas=15), fn1.result())
+        self.assertEqual(lease_get_resp(status=LEASE_GRANTED, data=b'', cas=1), fn2.result())
+
+    def test_early_refresh(self) -> None:
+        # the refresh threshold is nearly always bigger than the remaining ttl
+        c: CacheClient = RedisClient(self.redis_client, early_refresh_delta=1e6, min_ttl=60, max_ttl=60)
+        self.redis_client.set('key01', b'val:data01', px=5000)
+
+        pipe1 = c.pipeline()
+        self.addCleanup(pipe1.finish)
+
+        resp = pipe1.lease_get('key01').result()
+        self.assertEqual((FOUND, b'data01'), resp[:2])
+        self.assertGreater(resp[2], 0)
+
+        ttl = self.redis_client.pttl('key01')
+        self.assertGreater(ttl, 4000)
+        self.assertLessEqual(ttl, 5000)
+
+        # other callers do not get the refresh lease
+        pipe2 = c.pipeline()
+        self.addCleanup(pipe2.finish)
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'data01', cas=0), pipe2.lease_get('key01').result())
+
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe1.lease_set('key01', resp[2], b'data02')())
+        self.assertEqual(b'val:data02', self.redis_client.get('key01'))
+        self.assertGreater(self.redis_client.ttl('key01'), 50)
+
+    def test_early_refresh__not_near_expiry(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client, early_refresh_delta=0.001)
+        self.redis_client.set('key01', b'val:data01', ex=3600)
+
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'data01', cas=0), pipe.lease_get('key01').result())
+        self.assertEqual(b'val:data01', self.redis_client.get('key01'))
+
+    def test_early_refresh__mget_first(self) -> None:
+        c: CacheClient = RedisClient(self.redis_client, mget_first=True)
+        self.redis_client.set('key01', b'rfs:12:data01', ex=3600)
+
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        self.assertEqual(lease_get_resp(status=FOUND, data=b'data01', cas=0), pipe.lease_get('key01').result())
+
+        # refresh lease of another client is not set by a stale cas
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.CAS_MISMATCH), pipe.lease_set('key01', 11, b'data02')())
+        self.assertEqual(LeaseSetResponse(status=LeaseSetStatus.OK), pipe.lease_set('key01', 12, b'data02')())
+
 class TestRedisClientError(unittest.TestCase):
     def setUp(self):
         self.redis_client = redis.Redis(port=6400)
@@ -438,6 +598,27 @@ class TestRedisClientWithCapturing(unittest.TestCase):
             ],
         }, calls[1].kwargs)
 
+    def test_get_same_key_in_one_stage(self) -> None:
+        c: CacheClient = RedisClient(self.redis, lease_wait=True)
+        pipe = c.pipeline()
+        self.addCleanup(pipe.finish)
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+        fn3 = pipe.lease_get('key01')
+
+        # the key is fetched only once, so the lease is not seen as held by another caller
+        self.assertEqual(lease_get_resp(data=b'', cas=1, status=LEASE_GRANTED), fn1.result())
+        self.assertEqual(lease_get_resp(data=b'', cas=2, status=LEASE_GRANTED), fn2.result())
+        self.assertEqual(lease_get_resp(data=b'', cas=1, status=LEASE_GRANTED), fn3.result())
+
+        calls = self.redis.script_calls
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['key01', 'key02'], calls[0].kwargs['keys'])
+
+        # next stage fetches again
+        self.assertEqual(lease_get_resp(data=b'', cas=1, status=LEASE_HELD), pipe.lease_get('key01').result())
+
     def test_get_multi_keys__exceed_max_batch(self) -> None:
         c: CacheClient = RedisClient(self.redis, max_keys_per_batch=3)
         pipe = c.pipeline()
@@ -552,3 +733,126 @@ class TestRedisClientWithCapturing(unittest.TestCase):
 
         self.assertEqual(lease_get_resp(cas=0, data=b'value01', status=FOUND), fn1.result())
         self.assertEqual(lease_get_resp(cas=0, data=b'value04', status=FOUND), fn4.result())
+
+    def test_mget_first(self) -> None:
+        c: CacheClient = RedisClient(self.redis, mget_first=True)
+        pipe = c.pipeline()
+
+        self.redis.set('key01', b'val:data01')
+        self.redis.set('key03', b'cas:15')
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+        fn3 = pipe.lease_get('key03')
+        fn4 = pipe.lease_get('key04')
+
+        self.assertEqual(lease_get_resp(data=b'data01', cas=0, status=FOUND), fn1.result())
+        self.assertEqual(lease_get_resp(data=b'', cas=1, status=LEASE_GRANTED), fn2.result())
+        self.assertEqual(lease_get_resp(data=b'', cas=15, status=LEASE_GRANTED), fn3.result())
+        self.assertEqual(lease_get_resp(data=b'', cas=2, status=LEASE_GRANTED), fn4.result())
+
+        calls = self.redis.script_calls
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, calls[0].index)
+        self.assertDictEqual({
+            'client': self.redis,
+            'keys': ['key02', 'key04'],
+        }, calls[0].kwargs)
+
+    def test_mget_first__all_hits(self) -> None:
+        c: CacheClient = RedisClient(self.redis, mget_first=True)
+        pipe = c.pipeline()
+
+        self.redis.set('key01', b'val:data01')
+        self.redis.set('key02', b'val:data02')
+
+        fn1 = pipe.lease_get('key01')
+        fn2 = pipe.lease_get('key02')
+
+        self.assertEqual(lease_get_resp(data=b'data01', cas=0, status=FOUND), fn1.result())
+        self.assertEqual(lease_get_resp(data=b'data02', cas=0, status=FOUND), fn2.result())
+
+        self.assertEqual(0, len(self.redis.script_calls))
+
+    def test_mget_first__exceed_max_batch(self) -> None:
+        c: CacheClient = RedisClient(self.redis, mget_first=True, max_keys_per_batch=2)
+        pipe = c.pipeline()
+
+        self.redis.set('key02', b'val:data02')
+        self.redis.set('key04', b'val:data04')
+
+        fn_list = [pipe.lease_get(f'key0{i}') for i in range(1, 6)]
+
+        self.assertEqual([
+            lease_get_resp(data=b'', cas=1, status=LEASE_GRANTED),
+            lease_get_resp(data=b'data02', cas=0, status=FOUND),
+            lease_get_resp(data=b'', cas=2, status=LEASE_GRANTED),
+            lease_get_resp(data=b'data04', cas=0, status=FOUND),
+            lease_get_resp(data=b'', cas=3, status=LEASE_GRANTED),
+        ], [fn.result() for fn in fn_list])
+
+        calls = self.redis.script_calls
+        self.assertEqual(2, len(calls))
+
+        del calls[0].kwargs['client']
+        self.assertDictEqual({'keys': ['key01', 'key03']}, calls[0].kwargs)
+
+        del calls[1].kwargs['client']
+        self.assertDictEqual({'keys': ['key05']}, calls[1].kwargs)
+
+
+class TestRedisClientMGetBenchmark(unittest.TestCase):
+    """Compare lease get script and mget first modes at different hit rates."""
+
+    def setUp(self):
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+    def server_usec(self) -> int:
+        stats = self.redis_client.info('commandstats')
+        return sum(v['usec'] for v in stats.values())
+
+    def run_lease_get(self, c: CacheClient, hit_rate: float, num_loops: int) -> str:
+        num_keys = 100
+        num_hits = int(num_keys * hit_rate)
+
+        duration = datetime.timedelta(0)
+        usec = 0
+
+        for n in range(num_loops):
+            # populate hits, other keys are deleted to be missed
+            with self.redis_client.pipeline(transaction=False) as p:
+                for i in range(num_keys):
+                    if i < num_hits:
+                        p.set(f'key:{i}', b'val:some-data')
+                    else:
+                        p.delete(f'key:{i}')
+                p.execute()
+
+            self.redis_client.config_resetstat()
+            start = datetime.datetime.now()
+
+            pipe = c.pipeline()
+            fn_list = [pipe.lease_get(f'key:{i}') for i in range(num_keys)]
+            for fn in fn_list:
+                fn.result()
+
+            duration += datetime.datetime.now() - start
+            usec += self.server_usec()
+
+        return f'client {(duration / num_loops).microseconds / 1000.0}ms, server {usec / num_loops}us'
+
+    def test_run(self) -> None:
+        num_loops = 20
+        env = os.getenv("LOOP_MUL")
+        if env:
+            num_loops *= int(env)
+
+        script_client = RedisClient(self.redis_client, max_keys_per_batch=200)
+        mget_client = RedisClient(self.redis_client, max_keys_per_batch=200, mget_first=True)
+
+        for hit_rate in [0.5, 0.8, 0.95, 1.0]:
+            print(f'HIT RATE {hit_rate}:')
+            print('  LEASE GET SCRIPT:', self.run_lease_get(script_client, hit_rate, num_loops))
+            print('  MGET FIRST:', self.run_lease_get(mget_client, hit_rate, num_loops))
@@ -141,3 +141,25 @@ class TestSession(unittest.TestCase):
         lower2.execute()
 
         self.assertEqual([21, 31, 32, 41, 42], calls)
+
+    def test_execute_lower(self) -> None:
+        sess = Session()
+        lower = sess.get_lower()
+        lower2 = lower.get_lower()
+
+        calls: List[int] = []
+
+        def lower2_fn():
+            calls.append(41)
+            # add to a higher session
+            lower.add_next_call(lambda: calls.append(32))
+
+        lower2.add_next_call(lower2_fn)
+        lower.add_next_call(lambda: calls.append(31))
+
+        sess.execute_lower()
+
+        self.assertEqual([31, 41, 32], calls)
+        self.assertFalse(lower.is_dirty)
+        self.assertFalse(lower2.is_dirty)
+
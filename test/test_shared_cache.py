@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import tempfile
+import unittest
+import zlib
+from dataclasses import dataclass
+from typing import List
+
+import redis
+
+from memproxy import Item, RedisClient, Promise, new_json_codec, NearCacheClient, SharedCache
+from memproxy import shared_cache
+
+
+@dataclass
+class UserTest:
+    id: int
+    name: str
+
+
+def _child_get_and_put(path: str, queue: multiprocessing.Queue) -> None:
+    c = SharedCache(path=path, num_slots=64, slot_size=128)
+    queue.put(c.get('key01'))
+    c.put_if('key02', b'data from child', c.version('key02'))
+    c.invalidate('key03')
+    c.close()
+
+
+def _child_put(c: SharedCache) -> None:
+    c.put_if('key02', b'data from child', c.version('key02'))
+
+
+class TestSharedCache(unittest.TestCase):
+    now: float
+
+    def setUp(self) -> None:
+        self.now = 100.0
+
+    def now_func(self) -> float:
+        return self.now
+
+    def new_cache(self, **kwargs) -> SharedCache:
+        c = SharedCache(now_func=self.now_func, **kwargs)
+        self.addCleanup(c.close)
+        return c
+
+    def test_get_put(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128)
+
+        self.assertIsNone(c.get('key01'))
+
+        self.assertTrue(c.put_if('key01', b'data 01', c.version('key01')))
+        self.assertEqual(b'data 01', c.get('key01'))
+
+        self.assertTrue(c.put_if('key01', b'data 02', c.version('key01')))
+        self.assertEqual(b'data 02', c.get('key01'))
+
+        self.assertEqual(1, len(c))
+        self.assertEqual(2, c.hit_count)
+        self.assertEqual(1, c.miss_count)
+
+    def test_expired(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128, ttl=10.0)
+        c.put_if('key01', b'data 01', c.version('key01'))
+
+        self.now = 109.9
+        self.assertEqual(b'data 01', c.get('key01'))
+
+        self.now = 110.0
+        self.assertIsNone(c.get('key01'))
+        self.assertEqual(0, len(c))
+
+    def test_invalidate(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128)
+        c.put_if('key01', b'data 01', c.version('key01'))
+
+        version = c.version('key01')
+        c.invalidate('key01')
+        self.assertIsNone(c.get('key01'))
+
+        # in-flight read before the invalidation
+        self.assertFalse(c.put_if('key01', b'data 01', version))
+        self.assertIsNone(c.get('key01'))
+
+        self.assertTrue(c.put_if('key01', b'data 02', c.version('key01')))
+        self.assertEqual(b'data 02', c.get('key01'))
+
+    def test_invalidate_other_bucket(self) -> None:
+        # 8 buckets of 8 slots
+        c = self.new_cache(num_slots=64, slot_size=128)
+
+        key02 = next(
+            f'other:{i}' for i in range(100)
+            if zlib.crc32(f'other:{i}'.encode()) % 8 != zlib.crc32(b'key01') % 8
+        )
+
+        version = c.version(key02)
+        c.invalidate('key01')
+
+        # in-flight reads of keys in other buckets are still put
+        self.assertTrue(c.put_if(key02, b'data 02', version))
+        self.assertEqual(b'data 02', c.get(key02))
+
+    def test_too_big(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128)
+
+        self.assertFalse(c.put_if('key01', b'x' * 128, c.version('key01')))
+        self.assertIsNone(c.get('key01'))
+
+    def test_evict_least_recently_read(self) -> None:
+        # a single bucket of 2 slots
+        c = self.new_cache(num_slots=2, ways=2, slot_size=128)
+
+        c.put_if('key01', b'data 01', c.version('key01'))
+        self.now = 101.0
+        c.put_if('key02', b'data 02', c.version('key02'))
+
+        self.now = 102.0
+        self.assertEqual(b'data 01', c.get('key01'))
+
+        self.now = 103.0
+        c.put_if('key03', b'data 03', c.version('key03'))
+
+        self.assertEqual(b'data 01', c.get('key01'))
+        self.assertIsNone(c.get('key02'))
+        self.assertEqual(b'data 03', c.get('key03'))
+        self.assertEqual(1, c.evict_count)
+
+    def test_clear(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128)
+        c.put_if('key01', b'data 01', c.version('key01'))
+        c.put_if('key02', b'data 02', c.version('key02'))
+
+        version = c.version('key01')
+        c.clear()
+
+        self.assertEqual(0, len(c))
+        self.assertIsNone(c.get('key01'))
+        self.assertFalse(c.put_if('key01', b'data 01', version))
+
+    def test_invalid_params(self) -> None:
+        with self.assertRaises(ValueError):
+            SharedCache(num_slots=4, ways=8)
+        with self.assertRaises(ValueError):
+            SharedCache(slot_size=16)
+
+    def test_share_by_path(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache')
+
+            c1 = SharedCache(path=path, num_slots=64, slot_size=128)
+            self.addCleanup(c1.close)
+            c2 = SharedCache(path=path, num_slots=64, slot_size=128)
+            self.addCleanup(c2.close)
+
+            c1.put_if('key01', b'data 01', c1.version('key01'))
+            self.assertEqual(b'data 01', c2.get('key01'))
+
+            version = c1.version('key01')
+            c2.invalidate('key01')
+            self.assertIsNone(c1.get('key01'))
+            self.assertFalse(c1.put_if('key01', b'data 01', version))
+
+            with self.assertRaises(ValueError):
+                SharedCache(path=path, num_slots=64, slot_size=256)
+
+    def test_same_path_in_process(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache')
+
+            c1 = SharedCache(path=path, num_slots=64, slot_size=128)
+            c2 = SharedCache(path=path, num_slots=64, slot_size=128)
+            self.addCleanup(c2.close)
+
+            # record locks are owned by the process, objects of the same file share a mutex
+            self.assertIs(c1._mut, c2._mut)
+            with self.assertRaises(ValueError):
+                SharedCache(path=path, num_slots=64, slot_size=256)
+            assert c2._file_key is not None
+            self.assertEqual(2, shared_cache._file_mutexes[c2._file_key].refs)
+
+            c1.close()
+            c1.close()
+
+            self.assertTrue(c2.put_if('key01', b'data 01', c2.version('key01')))
+            self.assertEqual(b'data 01', c2.get('key01'))
+
+            key = c2._file_key
+            c2.close()
+            self.assertNotIn(key, shared_cache._file_mutexes)
+
+    def test_share_with_other_process(self) -> None:
+        ctx = multiprocessing.get_context('fork')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache')
+
+            c = SharedCache(path=path, num_slots=64, slot_size=128)
+            self.addCleanup(c.close)
+            c.put_if('key01', b'data 01', c.version('key01'))
+            c.put_if('key03', b'data 03', c.version('key03'))
+
+            queue: multiprocessing.Queue = ctx.Queue()
+            p = ctx.Process(target=_child_get_and_put, args=(path, queue))
+            p.start()
+            p.join()
+
+            self.assertEqual(0, p.exitcode)
+            self.assertEqual(b'data 01', queue.get())
+            self.assertEqual(b'data from child', c.get('key02'))
+            self.assertIsNone(c.get('key03'))
+
+    def test_share_with_forked_process(self) -> None:
+        c = self.new_cache(num_slots=64, slot_size=128)
+
+        p = multiprocessing.get_context('fork').Process(target=_child_put, args=(c,))
+        p.start()
+        p.join()
+
+        self.assertEqual(0, p.exitcode)
+        self.assertEqual(b'data from child', c.get('key02'))
+
+
+class TestSharedCacheNearCacheClient(unittest.TestCase):
+    fill_keys: List[int]
+
+    def setUp(self) -> None:
+        self.redis_client = redis.Redis()
+        self.redis_client.flushall()
+        self.redis_client.script_flush()
+
+        self.cache = SharedCache(num_slots=1024, slot_size=256)
+        self.addCleanup(self.cache.close)
+
+        self.client = NearCacheClient(RedisClient(self.redis_client), self.cache)
+        self.fill_keys = []
+
+    def filler_func(self, key: int) -> Promise[UserTest]:
+        self.fill_keys.append(key)
+        return lambda: UserTest(id=key, name=f'user:{key}')
+
+    def new_item(self) -> Item[UserTest, int]:
+        pipe = self.client.pipeline()
+        self.addCleanup(pipe.finish)
+
+        return Item(
+            pipe=pipe,
+            key_fn=lambda user_id: f'user:{user_id}',
+            filler=self.filler_func,
+            codec=new_json_codec(UserTest),
+        )
+
+    def test_item(self) -> None:
+        it = self.new_item()
+
+        self.assertEqual(UserTest(id=21, name='user:21'), it.get(21)())
+        self.assertEqual([21], self.fill_keys)
+
+        self.redis_client.flushall()
+
+        it = self.new_item()
+        self.assertEqual(UserTest(id=21, name='user:21'), it.get(21)())
+        self.assertEqual([21], self.fill_keys)
+        self.assertEqual(1, it.hit_count)
+
+    def test_delete_invalidates(self) -> None:
+        self.new_item().get(21)()
+
+        pipe = self.client.pipeline()
+        pipe.delete('user:21')()
+        pipe.finish()
+
+        self.assertIsNone(self.cache.get('user:21'))
+        self.assertEqual(UserTest(id=21, name='user:21'), self.new_item().get(21)())
+        self.assertEqual([21, 21], self.fill_keys)